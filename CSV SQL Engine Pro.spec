@@ -1,7 +1,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('ui_streamlit.py', '.'), ('versioning.py', '.'), ('macros.py', '.'), ('version.json', '.'), ('engine.py', '.'), ('ingestion.py', '.'), ('completer.py', '.'), ('native_window.py', '.'), ('utils.py', '.')]
+datas = [('ui_streamlit.py', '.'), ('versioning.py', '.'), ('macros.py', '.'), ('version.json', '.'), ('engine.py', '.'), ('ingestion.py', '.'), ('completer.py', '.'), ('native_window.py', '.'), ('utils.py', '.'), ('watcher.py', '.'), ('partitioning.py', '.'), ('overlap.py', '.'), ('sketches.py', '.'), ('join_graph.py', '.'), ('profiler.py', '.'), ('catalog.py', '.'), ('schema_edit.py', '.'), ('ddl.py', '.'), ('export.py', '.'), ('results.py', '.'), ('scheduler.py', '.'), ('admission.py', '.'), ('isolation.py', '.'), ('prepared.py', '.'), ('sql_ast.py', '.'), ('reuse.py', '.'), ('sampling.py', '.'), ('rollups.py', '.'), ('warmup.py', '.'), ('serve.py', '.')]
 binaries = []
 hiddenimports = ['PyQt5.QtCore', 'PyQt5.QtWidgets', 'PyQt5.QtWebEngineWidgets', 'PyQt5.QtGui']
 tmp_ret = collect_all('streamlit')
@@ -0,0 +1,133 @@
+"""
+Prioritized admission control for DuckDB queries
+Queries wait in one process-wide queue ordered by class (interactive before batch
+before background) and are admitted under a global and a per-user concurrency
+limit. Some slots are reserved for interactive work, so batch scans yield to short
+queries, and each class has a queue timeout and a run-time timeout.
+"""
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import duckdb
+
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+MAX_CONCURRENT = 4
+PER_USER_LIMIT = 2
+INTERACTIVE_RESERVED = 1  # Slots batch/background work can never take
+QUEUE_TIMEOUTS = {"interactive": 30, "batch": 600, "background": 300}  # Seconds waiting for a slot
+RUN_TIMEOUTS = {"interactive": 600, "batch": 3600, "background": 600}  # Seconds of execution
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=MAX_CONCURRENT, per_user=PER_USER_LIMIT, interactive_reserved=INTERACTIVE_RESERVED):
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.interactive_reserved = interactive_reserved
+        self._cond = threading.Condition()
+        self._waiting = []  # [(rank, seq, priority, user)]
+        self._running = Counter()
+        self._running_by_user = Counter()
+        self._seq = itertools.count()
+        self._stats = {p: {"admitted": 0, "queue_timeouts": 0, "run_timeouts": 0, "wait_seconds": 0.0} for p in PRIORITIES}
+
+    def _can_run(self, priority, user):
+        running = sum(self._running.values())
+        if running >= self.max_concurrent:
+            return False
+        if priority != "interactive" and running >= self.max_concurrent - self.interactive_reserved:
+            return False
+        return user is None or self._running_by_user[user] < self.per_user
+
+    def _next_ticket(self):
+        """Best-ranked waiting ticket that fits the limits (a user at their limit does not block others)"""
+        for ticket in sorted(self._waiting):
+            if self._can_run(ticket[2], ticket[3]):
+                return ticket
+        return None
+
+    @contextmanager
+    def admit(self, priority="interactive", user=None, interrupt=None, queue_timeout=None, timeout=None):
+        """
+        Hold a query slot for the block. `interrupt` is the cursor running the query:
+        it is interrupted after the run timeout, which surfaces as TimeoutError.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown query priority: {priority}")
+        queue_timeout = QUEUE_TIMEOUTS[priority] if queue_timeout is None else queue_timeout
+        timeout = RUN_TIMEOUTS[priority] if timeout is None else timeout
+
+        ticket = (PRIORITIES[priority], next(self._seq), priority, user)
+        t0 = time.monotonic()
+        with self._cond:
+            self._waiting.append(ticket)
+            try:
+                while self._next_ticket() is not ticket:
+                    remaining = queue_timeout - (time.monotonic() - t0)
+                    if remaining <= 0:
+                        self._stats[priority]["queue_timeouts"] += 1
+                        raise TimeoutError(f"No query slot for {priority} work after {queue_timeout}s ({self.queue_depth()} queued)")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            self._running[priority] += 1
+            self._running_by_user[user] += 1
+            self._stats[priority]["admitted"] += 1
+            self._stats[priority]["wait_seconds"] += time.monotonic() - t0
+
+        timed_out = threading.Event()
+        timer = None
+        if interrupt is not None and timeout:
+            def expire():
+                timed_out.set()
+                interrupt.interrupt()
+            timer = threading.Timer(timeout, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            yield
+        except duckdb.InterruptException:
+            if timed_out.is_set():
+                self._stats[priority]["run_timeouts"] += 1
+                raise TimeoutError(f"{priority.capitalize()} query exceeded {timeout}s and was cancelled") from None
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+            with self._cond:
+                self._running[priority] -= 1
+                self._running_by_user[user] -= 1
+                if not self._running_by_user[user]:
+                    del self._running_by_user[user]
+                self._cond.notify_all()
+
+    def queue_depth(self, priority=None):
+        return sum(1 for t in self._waiting if priority is None or t[2] == priority)
+
+    def metrics(self):
+        """{priority: {"running", "queued", "admitted", "queue_timeouts", "run_timeouts", "avg_wait_ms"}}"""
+        with self._cond:
+            out = {}
+            for p, stats in self._stats.items():
+                out[p] = {
+                    "running": self._running[p],
+                    "queued": self.queue_depth(p),
+                    "admitted": stats["admitted"],
+                    "queue_timeouts": stats["queue_timeouts"],
+                    "run_timeouts": stats["run_timeouts"],
+                    "avg_wait_ms": stats["wait_seconds"] / stats["admitted"] * 1000 if stats["admitted"] else 0.0,
+                }
+            return out
+
+
+QUERY_ADMISSION = AdmissionController()  # Shared by every session in this process
+
+
+def execute(con, query, params=None, priority="interactive", user=None, timeout=None):
+    """Run a statement on its own cursor once admitted; returns the cursor holding the result"""
+    cursor = con.cursor()
+    with QUERY_ADMISSION.admit(priority, user, interrupt=cursor, timeout=timeout):
+        return cursor.execute(query, params) if params else cursor.execute(query)
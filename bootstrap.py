@@ -1,19 +1,24 @@
 import os
 import json
+import hashlib
 import requests
 import subprocess
+import threading
 import time
 import sys
 import tkinter as tk
 from tkinter import messagebox, ttk
 import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # CONFIGURATION
 GITHUB_USER = "int-meetmovaliya-jpg"
 REPO_NAME = "Csv_Sql_Engine_Pro"
-VERSION_URL = f"https://raw.githubusercontent.com/{GITHUB_USER}/{REPO_NAME}/main/version.json"
+RAW_BASE_URL = f"https://raw.githubusercontent.com/{GITHUB_USER}/{REPO_NAME}/main"
+VERSION_URL = f"{RAW_BASE_URL}/version.json"
+MANIFEST_URL = f"{RAW_BASE_URL}/manifest.json"  # {"version", "files": {path: {"sha256", "size"}}}
 RELEASES_API_URL = f"https://api.github.com/repos/{GITHUB_USER}/{REPO_NAME}/releases/latest"
 ZIP_URL_TEMPLATE = f"https://github.com/{GITHUB_USER}/{REPO_NAME}/archive/refs/heads/main.zip"
 
@@ -27,7 +32,14 @@ else:
 
 CONFIG_DIR = APP_DIR / "config"
 CONFIG_FILE = CONFIG_DIR / "update_preferences.json"
+UPDATE_CACHE_FILE = CONFIG_DIR / "update_check.json"  # Last version.json seen and its ETag
 VERSION_FILE = APP_DIR / "version.json"
+STAGING_DIR = APP_DIR / "temp_update"
+
+UPDATE_CHECK_TIMEOUT = 5
+UPDATE_CHECK_GRACE = 0.5  # Seconds launch waits for a fresh check before using the cached result
+UPDATE_WORKERS = 4  # Parallel file downloads
+MANIFEST_PATTERNS = ("*.py", "*.icns", "requirements.txt", "version.json")  # Files an update delivers
 
 def ensure_config_dir():
     """Ensure config directory exists"""
@@ -85,39 +97,146 @@ def compare_versions(local, remote):
             return False
     return False
 
-def check_for_updates():
-    """Check for available updates from GitHub"""
-    prefs = load_update_preferences()
-    
-    # Check if user skipped this version
-    remote_version = None
+def load_update_cache():
+    """{"etag", "data", "checked_at"} of the last successful check"""
+    try:
+        with open(UPDATE_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_update_cache(cache):
+    ensure_config_dir()
+    with open(UPDATE_CACHE_FILE, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+def _newer_version(remote_data):
+    """remote_data if it is newer than the installed version and not skipped, else None"""
+    if not remote_data:
+        return None
+    remote_version = remote_data.get("version", "0.0.0")
+    if load_update_preferences().get("skip_version") == remote_version:
+        return None
+    return remote_data if compare_versions(get_local_version(), remote_version) else None
+
+def check_for_updates(version_url=VERSION_URL):
+    """
+    Check for available updates from GitHub: one conditional request, answered from
+    the cached version.json when the server replies 304 Not Modified
+    """
+    cache = load_update_cache()
+    headers = {"If-None-Match": cache["etag"]} if cache.get("etag") and cache.get("data") else {}
     try:
-        response = requests.get(VERSION_URL, timeout=10)
-        if response.status_code == 200:
+        response = requests.get(version_url, headers=headers, timeout=UPDATE_CHECK_TIMEOUT)
+        if response.status_code == 304:
+            remote_data = cache["data"]
+        elif response.status_code == 200:
             remote_data = response.json()
-            remote_version = remote_data.get("version", "0.0.0")
-            
-            # If user skipped this version, don't show update
-            if prefs.get("skip_version") == remote_version:
-                return None
+        else:
+            return None
+        save_update_cache({"etag": response.headers.get("ETag", cache.get("etag")), "data": remote_data,
+                           "checked_at": time.time()})
     except Exception as e:
         print(f"Update check failed: {e}")
         return None
-    
-    if not remote_version:
+    return _newer_version(remote_data)
+
+def cached_update():
+    """Update found by an earlier check, without touching the network"""
+    return _newer_version(load_update_cache().get("data"))
+
+def start_update_check(version_url=VERSION_URL):
+    """
+    Run check_for_updates on a daemon thread; returns (thread, result) with
+    result["update"] set once it finishes. Launch never waits on the network.
+    """
+    result = {"update": None}
+
+    def run():
+        result["update"] = check_for_updates(version_url)
+
+    thread = threading.Thread(target=run, name="update-check", daemon=True)
+    thread.start()
+    return thread, result
+
+# --- Manifest (delta) updates ---
+def _sha256(path):
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
         return None
-    
-    local_version = get_local_version()
-    
-    if compare_versions(local_version, remote_version):
-        try:
-            response = requests.get(VERSION_URL, timeout=10)
-            if response.status_code == 200:
-                return response.json()
-        except Exception as e:
-            print(f"Error fetching update info: {e}")
-    
-    return None
+    return digest.hexdigest()
+
+def build_manifest(app_dir=APP_DIR):
+    """Hashed list of the files an update delivers (run before publishing a release)"""
+    files = {}
+    for pattern in MANIFEST_PATTERNS:
+        for path in sorted(Path(app_dir).glob(pattern)):
+            if path.is_file():
+                files[path.name] = {"sha256": _sha256(path), "size": path.stat().st_size}
+    with open(Path(app_dir) / "version.json", 'r') as f:
+        version = json.load(f).get("version", "0.0.0")
+    return {"version": version, "files": files}
+
+def write_manifest(app_dir=APP_DIR):
+    manifest = build_manifest(app_dir)
+    with open(Path(app_dir) / "manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _fetch_file(url, dest, expected):
+    """
+    Download one file into the staging area, resuming a partial .part download with
+    a Range request; verified against the manifest hash before it is kept
+    """
+    if _sha256(dest) == expected["sha256"]:
+        return  # Finished by an earlier, interrupted update
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code != 416:  # 416: the partial file is already complete
+            response.raise_for_status()
+            with open(part, "ab" if response.status_code == 206 else "wb") as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    f.write(chunk)
+    if _sha256(part) != expected["sha256"]:
+        part.unlink()
+        raise ValueError(f"Checksum mismatch for {dest.name}; it will be downloaded again")
+    os.replace(part, dest)
+
+def apply_manifest_update(manifest_url=MANIFEST_URL, base_url=RAW_BASE_URL, app_dir=APP_DIR):
+    """
+    Fetch only the files whose hash differs from the published manifest, in parallel,
+    then install them. Returns the updated paths, or None when no manifest is published.
+    """
+    app_dir = Path(app_dir)
+    response = requests.get(manifest_url, timeout=UPDATE_CHECK_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    files = response.json()["files"]
+    for path in files:
+        if Path(path).is_absolute() or ".." in Path(path).parts:
+            raise ValueError(f"Unsafe path in update manifest: {path}")
+
+    changed = [path for path, meta in files.items() if _sha256(app_dir / path) != meta["sha256"]]
+    staging = app_dir / STAGING_DIR.name
+    with ThreadPoolExecutor(max_workers=UPDATE_WORKERS) as pool:
+        # list() re-raises the first failed download; verified files stay staged for a retry
+        list(pool.map(lambda path: _fetch_file(f"{base_url}/{path}", staging / path, files[path]), changed))
+
+    # version.json goes last, so an interrupted install never reports the new version
+    for path in sorted(changed, key=lambda p: p == "version.json"):
+        target = app_dir / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging / path, target)
+    shutil.rmtree(staging, ignore_errors=True)
+    return changed
 
 def perform_update(remote_data):
     """Perform the update with user confirmation"""
@@ -259,7 +378,17 @@ def perform_update(remote_data):
         try:
             print("Downloading update...")
             
-            # Download the latest code from GitHub
+            # Changed files only, when the release publishes a manifest
+            updated = apply_manifest_update()
+            if updated is not None:
+                print(f"Updated {len(updated)} file(s)")
+                messagebox.showinfo(
+                    "Update Successful",
+                    f"Update to version {version} installed successfully!\n\nThe application will restart."
+                )
+                return True
+            
+            # Otherwise download the latest code from GitHub
             zip_path = APP_DIR / "update.zip"
             response = requests.get(ZIP_URL_TEMPLATE, stream=True, timeout=30)
             response.raise_for_status()
@@ -269,7 +398,7 @@ def perform_update(remote_data):
                     f.write(chunk)
             
             # Extract the update
-            temp_dir = APP_DIR / "temp_update"
+            temp_dir = STAGING_DIR
             if temp_dir.exists():
                 shutil.rmtree(temp_dir)
             temp_dir.mkdir()
@@ -404,10 +533,18 @@ def launch_app():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    # Check for updates
+    if "--write-manifest" in sys.argv:
+        manifest = write_manifest()
+        print(f"Wrote manifest.json for {manifest['version']} ({len(manifest['files'])} files)")
+        sys.exit(0)
+
+    # Check for updates in the background; an update the check does not confirm in
+    # time is taken from the previous check and offered now
     prefs = load_update_preferences()
     if prefs.get("auto_check", True):
-        remote_update = check_for_updates()
+        check_thread, check_result = start_update_check()
+        check_thread.join(UPDATE_CHECK_GRACE)
+        remote_update = check_result["update"] if not check_thread.is_alive() else cached_update()
         if remote_update:
             if perform_update(remote_update):
                 # Restart the application after update
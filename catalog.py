@@ -0,0 +1,64 @@
+"""
+Catalog snapshot and search index for the schema explorer
+One metadata query builds a compact snapshot (tables, column counts and a lowercase
+name index); the UI caches it by catalog_signature() and fetches column details only
+for the table that is opened.
+"""
+
+TABLES_PER_PAGE = 30
+COLUMNS_PER_PAGE = 50
+
+
+def catalog_signature(con):
+    """Cheap checksum of all user table/column names and types; changes on any DDL"""
+    return con.execute("""
+        SELECT count(*), coalesce(bit_xor(hash(table_name, column_name, data_type)), 0)
+        FROM duckdb_columns() WHERE schema_name = 'main' AND NOT internal
+    """).fetchone()
+
+
+def load_catalog(con):
+    """
+    Snapshot of the user catalog:
+    {"tables": [(table, column_count)], "index": {table: "col1\\ncol2..." lowercased}}
+    """
+    rows = con.execute("""
+        SELECT table_name, count(*), lower(string_agg(column_name, chr(10) ORDER BY column_index))
+        FROM duckdb_columns() WHERE schema_name = 'main' AND NOT internal
+        GROUP BY table_name ORDER BY table_name
+    """).fetchall()
+    return {
+        "tables": [(t, n) for t, n, _ in rows],
+        "index": {t: cols for t, _, cols in rows},
+    }
+
+
+def search_catalog(catalog, query, offset=0, limit=TABLES_PER_PAGE):
+    """
+    Tables whose name or any column name contains `query`, paged.
+    Returns (total matches, [(table, column_count, matching column count)]).
+    """
+    query = (query or "").strip().lower()
+    matches = []
+    for table, count in catalog["tables"]:
+        if not query or query in table.lower():
+            matches.append((table, count, 0 if not query else count))
+            continue
+        columns = catalog["index"][table]
+        if query in columns:
+            matches.append((table, count, sum(1 for c in columns.split("\n") if query in c)))
+    return len(matches), matches[offset:offset + limit]
+
+
+def table_columns(con, table_name, query=None, offset=0, limit=COLUMNS_PER_PAGE):
+    """(total, [(column, type)]) of one table, optionally filtered by a name substring, paged"""
+    where, params = "schema_name = 'main' AND NOT internal AND table_name = ?", [table_name]
+    if query:
+        where += " AND contains(lower(column_name), ?)"
+        params.append(query.lower())
+    total = con.execute(f"SELECT count(*) FROM duckdb_columns() WHERE {where}", params).fetchone()[0]
+    rows = con.execute(f"""
+        SELECT column_name, data_type FROM duckdb_columns() WHERE {where}
+        ORDER BY column_index LIMIT {int(limit)} OFFSET {int(offset)}
+    """, params).fetchall()
+    return total, rows
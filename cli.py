@@ -1,16 +1,26 @@
 import os
+import re
 import sys
 from prompt_toolkit import PromptSession
+from prompt_toolkit.patch_stdout import patch_stdout
 from rich import print
 from rich.table import Table
 from rich.console import Console
+from rich.progress import Progress
 
 # Import local modules
 from engine import SQLEngine
 from completer import SQLCompleter
 from ingestion import ingest_csv, auto_ingest_folder
 from macros import expand_macros
-from versioning import save_schema_version
+from versioning import migrate_legacy_schema_files
+from watcher import start_folder_watcher
+from ddl import cleanup_staging
+from export import export_query
+from join_graph import start_join_discovery
+from admission import QUERY_ADMISSION
+from prepared import statement_stats
+from rollups import cube_status, refresh_cubes, ROLLUP_CUBES
 
 console = Console()
 
@@ -19,9 +29,15 @@ def main():
     
     engine = SQLEngine()
     con = engine.get_connection()
+    migrate_legacy_schema_files(con)
+    cleanup_staging(con)
     
     # ---- AUTO INGEST FROM data/ ----
     auto_ingest_folder(con, "data")
+    # ---- LIVE INGEST: keep watching data/ in the background ----
+    folder_watcher = start_folder_watcher(con, "data")
+    # ---- JOIN DISCOVERY: likely join keys for completion hints ----
+    join_discovery = start_join_discovery(con)
 
     # ---- CSV INGESTION MANUALLY ----
     print("\n[yellow]Manually ingest CSV files? (Press ENTER to skip)[/yellow]")
@@ -29,9 +45,7 @@ def main():
         path = input("Paste CSV path: ").strip()
         if not path:
             break
-        table = ingest_csv(con, path)
-        if table:
-            save_schema_version(con, table)
+        ingest_csv(con, path)
 
     # ---- SQL MODE ----
     session = PromptSession(
@@ -40,43 +54,98 @@ def main():
     )
 
     print("\n[green]SQL Mode Started (type 'exit' or 'quit' to stop)[/green]")
-    print("[dim]Macros supported: @top_users, @daily_agg, @dedup_latest[/dim]\n")
+    print("[dim]Macros supported: @top_users, @daily_agg, @dedup_latest[/dim]")
+    print("[dim]Export: .export <file.csv|.csv.gz|.parquet|.jsonl> [--split N] <query>[/dim]")
+    print("[dim]Query queue: .queue[/dim]")
+    print("[dim]Rollup cubes: .cubes [refresh][/dim]\n")
 
-    while True:
-        try:
-            sql = session.prompt("sql> ").strip()
-            if not sql:
-                continue
-            if sql.lower() in ("exit", "quit"):
-                break
-
-            # Expand macros
-            expanded_sql = expand_macros(sql)
-            if expanded_sql != sql:
-                print(f"[dim]Expanded SQL: {expanded_sql}[/dim]")
-
-            result = con.execute(expanded_sql)
-
-            if result.description:
-                # Use Rich to display a nice table
-                columns = [desc[0] for desc in result.description]
-                rows = result.fetchall()
-                
-                table = Table(show_header=True, header_style="bold magenta")
-                for col in columns:
-                    table.add_column(col)
-                
-                # Show top 20 rows
-                for r in rows[:20]:
-                    table.add_row(*[str(val) for val in r])
-                
-                console.print(table)
-                print(f"[dim]{len(rows)} rows total (showing top 20)[/dim]")
-            else:
-                print("[green]Command executed successfully.[/green]")
-
-        except Exception as e:
-            print(f"[red]Error: {e}[/red]")
+    with patch_stdout():
+        while True:
+            try:
+                sql = session.prompt("sql> ").strip()
+                if not sql:
+                    continue
+                if sql.lower() in ("exit", "quit"):
+                    break
+
+                # Stream a result to disk: .export <path> [--split N] <query>
+                if sql.lower().startswith(".export"):
+                    m = re.match(r"\.export\s+(\S+)(?:\s+--split\s+(\d+))?\s+(.+)$", sql, re.S | re.I)
+                    if not m:
+                        print("[yellow]Usage: .export <path> [--split N] <query>[/yellow]")
+                        continue
+                    with QUERY_ADMISSION.admit("batch"), Progress(transient=True) as progress:
+                        task = progress.add_task(f"Exporting to {m.group(1)}", total=100)
+                        out = export_query(
+                            con, expand_macros(m.group(3), con), m.group(1), split=int(m.group(2) or 1),
+                            progress=lambda pct: progress.update(task, completed=pct)
+                        )
+                    size_mb = out["bytes"] / 1024 / 1024
+                    print(f"[green]Exported {out['rows']:,} rows to {out['path']} "
+                          f"({len(out['files'])} file(s), {size_mb:,.1f}MB, {out['seconds']:.2f}s)[/green]")
+                    continue
+
+                # Admission metrics per priority class
+                if sql.lower() == ".queue":
+                    table = Table(show_header=True, header_style="bold magenta")
+                    for col in ("class", "running", "queued", "admitted", "avg wait", "timeouts (queue/run)"):
+                        table.add_column(col)
+                    for priority, m in QUERY_ADMISSION.metrics().items():
+                        table.add_row(priority, str(m["running"]), str(m["queued"]), str(m["admitted"]),
+                                      f"{m['avg_wait_ms']:.1f}ms", f"{m['queue_timeouts']}/{m['run_timeouts']}")
+                    console.print(table)
+                    s = statement_stats()
+                    print(f"[dim]Plan cache: {s['hit_rate']:.0%} hit rate, {s['hits']} hits, {s['misses']} misses, "
+                          f"{s['evictions']} evictions, {s['fallbacks']} fallbacks[/dim]")
+                    continue
+
+                # Rollup cube status; `.cubes refresh` rebuilds them all
+                if sql.lower() in (".cubes", ".cubes refresh"):
+                    if sql.lower().endswith("refresh"):
+                        for source in {cfg["source"] for cfg in ROLLUP_CUBES.values()}:
+                            try:
+                                refresh_cubes(con, source)
+                            except Exception as e:
+                                print(f"[yellow]Cubes over '{source}' not built: {e}[/yellow]")
+                    table = Table(show_header=True, header_style="bold magenta")
+                    for col in ("cube", "source", "rows", "built", "fresh"):
+                        table.add_column(col)
+                    for cube, source, rows, built_at, fresh in cube_status(con):
+                        table.add_row(cube, source, f"{rows:,}" if rows is not None else "-",
+                                      built_at.strftime("%Y-%m-%d %H:%M") if built_at else "-", "yes" if fresh else "no")
+                    console.print(table)
+                    continue
+
+                # Expand macros
+                expanded_sql = expand_macros(sql, con)
+                if expanded_sql != sql:
+                    print(f"[dim]Expanded SQL: {expanded_sql}[/dim]")
+
+                result = engine.execute(expanded_sql)
+
+                if result.description:
+                    # Use Rich to display a nice table
+                    columns = [desc[0] for desc in result.description]
+                    rows = result.fetchall()
+                    
+                    table = Table(show_header=True, header_style="bold magenta")
+                    for col in columns:
+                        table.add_column(col)
+                    
+                    # Show top 20 rows
+                    for r in rows[:20]:
+                        table.add_row(*[str(val) for val in r])
+                    
+                    console.print(table)
+                    print(f"[dim]{len(rows)} rows total (showing top 20)[/dim]")
+                else:
+                    print("[green]Command executed successfully.[/green]")
+
+            except Exception as e:
+                print(f"[red]Error: {e}[/red]")
+
+    folder_watcher.stop()
+    join_discovery.stop()
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 from prompt_toolkit.completion import Completer, Completion
 import re
+from join_graph import join_hints
 
 SQL_KEYWORDS = [
     "select", "from", "where", "group by", "order by",
@@ -62,6 +63,18 @@ class SQLCompleter(Completer):
         if re.search(r"(from|join)\s+$", text):
             suggestions = set(tables)
 
+        # Context-aware: after JOIN <table> ON → discovered join conditions
+        if re.search(r"join\s+\w+(\s+as)?(\s+\w+)?\s+on\s+$", text):
+            referenced = re.findall(r"(?:from|join)\s+(\w+)", text)
+            try:
+                hints = join_hints(self.con, referenced)
+            except Exception:
+                hints = []
+            if hints:
+                for h in hints:
+                    yield Completion(h, start_position=0)
+                return
+
         # Context-aware: after table.column
         match = re.search(r"(\w+)\.(\w*)$", text)
         if match:
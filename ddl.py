@@ -0,0 +1,120 @@
+"""
+Ingestion/DDL coordinator
+Tables are built under a staging name inside one transaction, indexed, and swapped
+in place of the target before commit. A failure (or a crash: the transaction never
+commits) leaves the previous table, its indexes and its data/ export untouched.
+"""
+import os
+from contextlib import contextmanager
+
+STAGING_PREFIX = "__staging_"
+AUTO_INDEX_HINTS = ("id", "num", "phone", "email", "code", "key")
+NON_INDEXABLE_TYPES = ("STRUCT", "MAP", "UNION")
+
+
+def staging_name(table_name):
+    return f"{STAGING_PREFIX}{table_name}"
+
+
+def auto_index_columns(con, table_name):
+    """Columns that get an idx_<table>_<column> index: key-like names with indexable types"""
+    return [
+        c[0] for c in con.execute(f'DESCRIBE "{table_name}"').fetchall()
+        if any(k in c[0].lower() for k in AUTO_INDEX_HINTS)
+        and not c[1].upper().startswith(NON_INDEXABLE_TYPES) and not c[1].endswith("]")
+    ]
+
+
+def index_name(table_name, column):
+    return f'idx_{table_name}_{column.lower().replace(" ", "_")}'
+
+
+def create_auto_indexes(con, table_name):
+    for col in auto_index_columns(con, table_name):
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{index_name(table_name, col)}" ON "{table_name}"("{col}")')
+
+
+def table_indexes(con, table_name):
+    """[(index name, [columns], unique)] for plain column indexes of a table"""
+    indexes = []
+    for name, expressions, unique in con.execute(
+        "SELECT index_name, expressions, is_unique FROM duckdb_indexes() WHERE table_name = ?", [table_name]
+    ).fetchall():
+        columns = [e.strip().strip("'").strip('"') for e in expressions.strip("[]").split(",")]
+        indexes.append((name, columns, unique))
+    return indexes
+
+
+def create_indexes(con, table_name, indexes, renames=None, dropped=()):
+    """Recreate indexes from table_indexes(), following column renames and skipping dropped columns"""
+    renames = renames or {}
+    for name, columns, unique in indexes:
+        if any(c in dropped for c in columns):
+            continue
+        cols = ", ".join(f'"{renames.get(c, c)}"' for c in columns)
+        con.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" ON "{table_name}"({cols})')
+
+
+@contextmanager
+def atomic(con):
+    """Run a block in one transaction; roll back and re-raise on any error"""
+    con.begin()
+    try:
+        yield con
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+
+
+@contextmanager
+def staged_table(con, table_name, auto_index=True):
+    """
+    Yield a staging table name to build into; on success, swap it in as `table_name`
+    (dropping the old table and its indexes) and build indexes, all in one transaction.
+
+        with staged_table(con, "sales") as staging:
+            con.execute(f'CREATE TABLE "{staging}" AS SELECT ... FROM read_csv_auto(?)', [path])
+    """
+    staging = staging_name(table_name)
+    with atomic(con):
+        con.execute(f'DROP TABLE IF EXISTS "{staging}"')
+        yield staging
+        # DuckDB cannot rename a table that has indexes, so they are built after the swap
+        is_view = con.execute(
+            "SELECT count(*) FROM duckdb_views() WHERE schema_name = 'main' AND view_name = ?", [table_name]
+        ).fetchone()[0] > 0
+        con.execute(f'DROP {"VIEW" if is_view else "TABLE"} IF EXISTS "{table_name}"')
+        con.execute(f'ALTER TABLE "{staging}" RENAME TO "{table_name}"')
+        if auto_index:
+            create_auto_indexes(con, table_name)
+
+
+def export_table_csv(con, table_name, path):
+    """COPY a table to CSV through a temporary file renamed into place, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"  # Ignored by the folder watcher
+    escaped = tmp_path.replace("'", "''")
+    try:
+        con.execute(f"""COPY "{table_name}" TO '{escaped}' (HEADER, DELIMITER ',')""")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def cleanup_staging(con):
+    """Drop staging tables and temporary exports left behind by an interrupted run"""
+    dropped = []
+    for (name,) in con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' AND starts_with(table_name, ?)",
+        [STAGING_PREFIX]
+    ).fetchall():
+        con.execute(f'DROP TABLE IF EXISTS "{name}"')
+        dropped.append(name)
+    if os.path.isdir("data"):
+        for f in os.listdir("data"):
+            if f.endswith(".csv.tmp"):
+                os.remove(os.path.join("data", f))
+    return dropped
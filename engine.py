@@ -1,15 +1,27 @@
 import duckdb
 import os
 from rich import print
+from admission import QUERY_ADMISSION
+from prepared import StatementCache
+from rollups import route_to_cube
+from versioning import record_writes
 
 class SQLEngine:
     def __init__(self, db_file="metadata.db"):
         self.db_file = db_file
         self.con = duckdb.connect(db_file)
+        self.statements = StatementCache(self.con)  # Repeated SELECTs reuse their plans
         print(f"[dim]Connected to DuckDB: {db_file}[/dim]")
 
-    def execute(self, sql):
-        return self.con.execute(sql)
+    def execute(self, sql, priority="interactive", user=None):
+        """Run once admitted; stays on the session connection so temp tables and SET persist"""
+        routed = route_to_cube(self.con, sql)  # GROUP BYs a rollup cube covers read the cube
+        if routed:
+            sql = routed["sql"]
+        with QUERY_ADMISSION.admit(priority, user, interrupt=self.con):
+            result = self.statements.execute(sql)
+        record_writes(self.con, sql)  # DML makes fingerprint-keyed caches (cubes, samples, profiles) stale
+        return result
 
     def get_connection(self):
         return self.con
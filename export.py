@@ -0,0 +1,259 @@
+"""
+Streaming result export
+Query results are written by DuckDB's COPY (query) TO straight to CSV, Parquet or
+JSON lines; rows never pass through Python or pandas. Optional compression and
+splitting into N files, with progress reported from DuckDB's query progress.
+UI exports land under EXPORTS_DIR and are downloaded through DownloadServer, which
+streams each file from disk in chunks behind an unguessable link.
+"""
+import mimetypes
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+EXPORTS_DIR = "exports"  # UI exports go here or in a subfolder; files older than EXPORT_MAX_AGE_DAYS are pruned
+EXPORT_MAX_AGE_DAYS = 7
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+CONTENT_TYPES = {
+    ".csv": "text/csv", ".parquet": "application/vnd.apache.parquet", ".jsonl": "application/x-ndjson",
+    ".gz": "application/gzip", ".zst": "application/zstd",
+}
+FORMATS = {
+    "csv": {"extension": ".csv", "options": "FORMAT CSV, HEADER", "compression": ["none", "gzip", "zstd"],
+            "partitioned": True},
+    "parquet": {"extension": ".parquet", "options": "FORMAT PARQUET", "compression": ["snappy", "zstd", "gzip", "uncompressed"],
+                "partitioned": True},
+    # COPY ... (FORMAT JSON) has no PARTITION_BY; splits run one filtered pass per file
+    "jsonl": {"extension": ".jsonl", "options": "FORMAT JSON", "compression": ["none", "gzip", "zstd"],
+              "partitioned": False},
+}
+COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+SPLIT_COLUMN = "__export_part"
+
+
+def _sql_str(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def format_from_path(path):
+    """(format, compression) implied by a file name like out.csv.gz or out.parquet"""
+    name = path.lower()
+    compression = None
+    for codec, suffix in COMPRESSED_SUFFIXES.items():
+        if name.endswith(suffix):
+            compression, name = codec, name[:-len(suffix)]
+    for fmt, spec in FORMATS.items():
+        if name.endswith(spec["extension"]) or (fmt == "jsonl" and name.endswith(".json")):
+            return fmt, compression
+    raise ValueError(f"Cannot tell export format from {path} (use .csv, .parquet or .jsonl)")
+
+
+def export_file_name(name, fmt, compression=None):
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "export"
+    suffix = COMPRESSED_SUFFIXES.get(compression, "") if fmt != "parquet" else ""
+    return f"{safe}{FORMATS[fmt]['extension']}{suffix}"
+
+
+def strip_export_suffix(path):
+    """out.csv.gz -> out (the directory used when a result is split into files)"""
+    lower = path.lower()
+    for suffix in COMPRESSED_SUFFIXES.values():
+        if lower.endswith(suffix):
+            path, lower = path[:-len(suffix)], lower[:-len(suffix)]
+    for spec in FORMATS.values():
+        if lower.endswith(spec["extension"]):
+            return path[:-len(spec["extension"])]
+    return path
+
+
+def copy_statements(query, target, fmt, compression=None, split=1):
+    """
+    COPY (query) TO target statements. With split > 1 rows are hashed into N files
+    under target/: one PARTITION_BY pass where the format supports it, else N passes.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    spec = FORMATS[fmt]
+    options = [spec["options"]]
+    if compression and compression != "none":
+        if compression not in spec["compression"]:
+            raise ValueError(f"{fmt} does not support {compression} compression")
+        options.append(f"COMPRESSION {compression.upper()}")
+    query = query.strip().rstrip(";")
+    if split <= 1:
+        return [f"COPY ({query}) TO {_sql_str(target)} ({', '.join(options)})"]
+
+    if spec["partitioned"]:
+        split_query = f"SELECT q.*, hash(q) % {int(split)} AS {SPLIT_COLUMN} FROM ({query}) q"
+        options += [f"PARTITION_BY ({SPLIT_COLUMN})", "OVERWRITE_OR_IGNORE"]
+        return [f"COPY ({split_query}) TO {_sql_str(target)} ({', '.join(options)})"]
+    return [
+        f"COPY (SELECT q.* FROM ({query}) q WHERE hash(q) % {int(split)} = {i}) "
+        f"TO {_sql_str(os.path.join(target, export_file_name(f'part_{i}', fmt, compression)))} ({', '.join(options)})"
+        for i in range(int(split))
+    ]
+
+
+def export_query(con, query, path, fmt=None, compression=None, split=1, progress=None):
+    """
+    Stream `query` to `path` (a file, or a directory of files when split > 1).
+    `progress(percent)` is called while DuckDB works. Returns
+    {"path", "files", "rows", "bytes", "seconds"}.
+    """
+    if fmt is None:
+        fmt, implied = format_from_path(path)
+        compression = compression or implied
+    if split > 1:
+        path = strip_export_suffix(path)
+        os.makedirs(path, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    statements = copy_statements(query, path, fmt, compression, split)
+
+    t0 = time.perf_counter()
+    rows = 0
+    for i, statement in enumerate(statements):
+        outcome = {}
+
+        def run():
+            try:
+                outcome["rows"] = con.execute(statement).fetchone()[0]
+            except Exception as e:
+                outcome["error"] = e
+
+        # COPY runs on a worker thread so this one can poll DuckDB's progress
+        worker = threading.Thread(target=run, name="export", daemon=True)
+        worker.start()
+        while worker.is_alive():
+            worker.join(0.25)
+            if progress and worker.is_alive():
+                try:
+                    pct = con.query_progress()
+                except Exception:
+                    pct = -1
+                if pct >= 0:
+                    progress((i + pct / 100) / len(statements) * 100)
+        if "error" in outcome:
+            raise outcome["error"]
+        rows += outcome["rows"]
+    if progress:
+        progress(100.0)
+
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+    else:
+        files = [path]
+    return {
+        "path": path,
+        "files": files,
+        "rows": rows,
+        "bytes": sum(os.path.getsize(f) for f in files),
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def new_export_path(name, fmt, compression=None, directory=EXPORTS_DIR):
+    """Timestamped, collision-free path for an export in `directory`"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(directory, export_file_name(f"{name}_{stamp}", fmt, compression))
+
+
+def export_dir(subfolder="", root=EXPORTS_DIR):
+    """Absolute path of a folder under `root` for exports; anything resolving outside it is refused"""
+    root = os.path.realpath(root)
+    target = os.path.realpath(os.path.join(root, subfolder.strip().lstrip("/\\")))
+    if os.path.commonpath([root, target]) != root:
+        raise ValueError(f"Exports can only be saved under {root}")
+    return target
+
+
+def prune_exports(directory=EXPORTS_DIR, max_age_days=EXPORT_MAX_AGE_DAYS):
+    """Delete files under `directory` older than max_age_days, then empty folders; returns the files removed"""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for root, folders, names in os.walk(directory, topdown=False):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass  # Still being written or already gone
+        if root != directory and not os.listdir(root):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+    return removed
+
+
+class _DownloadHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        token = self.path.lstrip("/").split("/", 1)[0]
+        path = self.server.shared.get(token)
+        try:
+            f = open(path, "rb") if path else None
+        except OSError:
+            f = None  # Pruned since it was shared
+        if f is None:
+            self.send_error(404)
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", _content_type(path))
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(os.path.basename(path))}")
+            self.end_headers()
+            try:
+                shutil.copyfileobj(f, self.wfile, DOWNLOAD_CHUNK_BYTES)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Download cancelled in the browser
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _content_type(path):
+    return CONTENT_TYPES.get(os.path.splitext(path)[1].lower()) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class DownloadServer:
+    """
+    HTTP server for export files of any size: each request streams one file from disk
+    in DOWNLOAD_CHUNK_BYTES chunks. Only files under `root` that were passed to share()
+    are served, each under a random token, so links cannot be guessed or pointed elsewhere.
+    """
+
+    def __init__(self, host="", port=0, root=EXPORTS_DIR):
+        self.root = os.path.realpath(root)
+        self._httpd = ThreadingHTTPServer((host, port), _DownloadHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.shared = {}  # token -> absolute file path
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="export-downloads", daemon=True).start()
+
+    def share(self, path):
+        """URL path ("/<token>/<file name>") that downloads `path`"""
+        path = os.path.realpath(path)
+        if os.path.commonpath([self.root, path]) != self.root or not os.path.isfile(path):
+            raise ValueError(f"Not an export file: {path}")
+        shared = self._httpd.shared
+        for token, shared_path in list(shared.items()):
+            if not os.path.exists(shared_path):
+                shared.pop(token, None)  # Pruned exports
+        token = secrets.token_urlsafe(24)
+        shared[token] = path
+        return f"/{token}/{quote(os.path.basename(path))}"
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
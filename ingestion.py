@@ -1,30 +1,230 @@
 import os
 import duckdb
+from datetime import datetime
 from rich import print
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from ddl import atomic, staged_table, table_indexes, create_indexes
+from sketches import SKETCH_ON_INGEST, build_table_sketches, merge_table_sketches
+from sampling import SAMPLE_ON_INGEST, build_table_sample, drop_table_sample, merge_table_sample
+from rollups import refresh_cubes, drop_cubes
+from macros import refresh_materialized_macros
+from versioning import (
+    describe_schema, get_schema_version, classify_schema_change, save_schema_version, bump_table_version,
+    table_fingerprint
+)
 
-def ingest_csv(con, path):
+INGEST_LEDGER_TABLE = f"{INTERNAL_SCHEMA}.ingest_ledger"
+
+
+def _ensure_ledger(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INGEST_LEDGER_TABLE} (
+            table_name VARCHAR NOT NULL,
+            path VARCHAR NOT NULL,
+            file_size BIGINT,
+            file_mtime DOUBLE,
+            row_count BIGINT,
+            mode VARCHAR,
+            ingested_at TIMESTAMP
+        )
+    """)
+
+
+def _table_exists(con, table_name):
+    return con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = ?", [table_name]
+    ).fetchone()[0] > 0
+
+
+def record_ingested_file(con, table_name, path, row_count=None, mode="create"):
+    """Remember that `path` (as it is on disk now) is part of `table_name`"""
+    _ensure_ledger(con)
+    stat = os.stat(path)
+    path = os.path.abspath(path)
+    con.execute(f"DELETE FROM {INGEST_LEDGER_TABLE} WHERE table_name = ? AND path = ?", [table_name, path])
+    con.execute(
+        f"INSERT INTO {INGEST_LEDGER_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [table_name, path, stat.st_size, stat.st_mtime, row_count, mode, datetime.now()]
+    )
+
+
+def forget_table(con, table_name):
+    """Drop ledger entries, the preview sample and rollup cubes of a table (call when the table is dropped or rebuilt)"""
+    _ensure_ledger(con)
+    con.execute(f"DELETE FROM {INGEST_LEDGER_TABLE} WHERE table_name = ?", [table_name])
+    drop_table_sample(con, table_name)
+    drop_cubes(con, table_name)
+
+
+def _next_version_name(con, table_name):
+    n = 2
+    while _table_exists(con, f"{table_name}_v{n}"):
+        n += 1
+    return f"{table_name}_v{n}"
+
+
+def _version_for(con, table_name, path, incoming):
+    """
+    Existing `<name>_v<n>` table a breaking file belongs in: the one it was loaded into
+    before, else the newest one whose schema absorbs it; None when a new version is needed
+    """
+    versions = [r[0] for r in con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' AND regexp_full_match(table_name, ?) "
+        "ORDER BY CAST(regexp_extract(table_name, '_v(\\d+)$', 1) AS INTEGER) DESC",
+        [f"{table_name}_v\\d+"]
+    ).fetchall()]
+    if not versions:
+        return None
+    placeholders = ", ".join("?" for _ in versions)
+    loaded = con.execute(
+        f"SELECT table_name FROM {INGEST_LEDGER_TABLE} WHERE path = ? AND table_name IN ({placeholders})",
+        [path, *versions]
+    ).fetchone()
+    if loaded:
+        return loaded[0]
+    for version in versions:
+        stored = get_schema_version(con, version) or describe_schema(con, f'"{version}"')
+        if classify_schema_change(stored, incoming)["status"] != "break":
+            return version
+    return None
+
+
+def _sql_str(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def ingest_csv(con, path, table_name=None, on_break="replace"):
+    """
+    Load a CSV into a table, appending when the schema allows it.
+
+    - a file already loaded and unchanged on disk is skipped
+    - a new file whose sniffed schema matches (or compatibly widens) the stored schema
+      is appended with INSERT INTO ... SELECT
+    - a changed file, or a schema break, rebuilds the table through a staging table
+      swapped in atomically (idx_* indexes rebuilt); with on_break="version" a break
+      is routed to the `<name>_v<n>` table holding the file (or absorbing its schema),
+      else to a new one
+    - a table without ledger entries (loaded before the ledger existed) is rebuilt from
+      the file, as it cannot tell whether the file is already in it
+    - a rebuild that would lose rows of source files no longer on disk is refused
+    """
     if not os.path.exists(path):
         print(f"[red]Error: Path {path} does not exist.[/red]")
         return None
-    
-    table_name = os.path.splitext(os.path.basename(path))[0].lower()
-    table_name = table_name.replace("-", "_").replace(" ", "_")
+
+    if not table_name:
+        table_name = os.path.splitext(os.path.basename(path))[0].lower()
+        table_name = table_name.replace("-", "_").replace(" ", "_")
 
     try:
-        con.execute(f"""
-            CREATE OR REPLACE TABLE {table_name} AS
-            SELECT * FROM read_csv_auto('{path}')
-        """)
-        print(f"[green]Successfully loaded {path} into table '{table_name}'[/green]")
+        _ensure_ledger(con)
+        abs_path = os.path.abspath(path)
+        stat = os.stat(path)
+        sources = con.execute(
+            f"SELECT path, file_size, file_mtime FROM {INGEST_LEDGER_TABLE} WHERE table_name = ?", [table_name]
+        ).fetchall()
+        known = {p: (size, mtime) for p, size, mtime in sources}
+        exists = _table_exists(con, table_name)
+
+        if exists and known.get(abs_path) == (stat.st_size, stat.st_mtime):
+            print(f"[dim]{path} unchanged since last ingest of '{table_name}', skipping[/dim]")
+            return table_name
+
+        mode = "create"
+        if exists and not known:
+            print(f"[dim]'{table_name}' has no ingest history, rebuilding it from {path}[/dim]")
+        elif exists and abs_path not in known:
+            incoming = describe_schema(con, f"SELECT * FROM read_csv_auto({_sql_str(path)})")
+            stored = get_schema_version(con, table_name) or describe_schema(con, f'"{table_name}"')
+            change = classify_schema_change(stored, incoming)
+            if change["status"] != "break":
+                mode = "append"
+            elif on_break == "version":
+                version = _version_for(con, table_name, abs_path, incoming)
+                if version:
+                    return ingest_csv(con, path, version)
+                table_name = _next_version_name(con, table_name)
+                print(f"[yellow]Schema of {path} breaks the stored schema, loading into '{table_name}'[/yellow]")
+            else:
+                print(f"[yellow]Schema of {path} breaks '{table_name}', rebuilding[/yellow]")
+
+        if mode == "append":
+            appended_to = table_fingerprint(con, table_name)
+            with atomic(con):
+                # Indexes (idx_* from the first load) block ALTER TABLE; an index dropped
+                # in this transaction no longer does, and it is rebuilt before commit
+                indexes = table_indexes(con, table_name) if change["add"] or change["widen"] else []
+                for name, _, _ in indexes:
+                    con.execute(f'DROP INDEX "{name}"')
+                for col in change["add"]:
+                    con.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col["column"]}" {col["type"]}')
+                for col in change["widen"]:
+                    con.execute(f'ALTER TABLE "{table_name}" ALTER COLUMN "{col["column"]}" TYPE {col["new_type"]}')
+                rows = con.execute(
+                    f'INSERT INTO "{table_name}" BY NAME SELECT * FROM read_csv_auto(?)', [path]
+                ).fetchone()[0]
+                create_indexes(con, table_name, indexes)
+                record_ingested_file(con, table_name, path, rows, mode)
+        else:
+            # A changed source invalidates what was loaded from it; reload the table
+            # from every file it was built from so appended files are not lost.
+            files = [p for p in known if p != abs_path] if abs_path in known else []
+            missing = [p for p in files if not os.path.exists(p)]
+            if missing:
+                print(f"[red]Not rebuilding '{table_name}' from {path}: its rows from {', '.join(missing)} "
+                      f"would be lost (restore the file(s), or drop the table to reload from what is on disk)[/red]")
+                return None
+            files.append(abs_path)
+            with staged_table(con, table_name) as staging:
+                con.execute(
+                    f'CREATE TABLE "{staging}" AS SELECT * FROM read_csv_auto(?, union_by_name=true)',
+                    [files if len(files) > 1 else path]
+                )
+                rows = con.execute(f'SELECT count(*) FROM "{staging}"').fetchone()[0]
+                forget_table(con, table_name)
+                for p in files[:-1]:
+                    record_ingested_file(con, table_name, p, mode="rebuild")
+                record_ingested_file(con, table_name, path, rows, mode)
+
+        save_schema_version(con, table_name)
+        bump_table_version(con, table_name)
+        if SKETCH_ON_INGEST:
+            try:
+                if mode == "append":
+                    merge_table_sketches(con, table_name, f"read_csv_auto({_sql_str(path)})")
+                else:
+                    build_table_sketches(con, table_name)
+            except Exception as e:
+                print(f"[yellow]Column sketches for '{table_name}' skipped: {e}[/yellow]")
+        if SAMPLE_ON_INGEST:
+            try:
+                if mode == "append":
+                    merge_table_sample(con, table_name, f"read_csv_auto({_sql_str(path)})")  # Scans the new file only
+                else:
+                    build_table_sample(con, table_name)
+            except Exception as e:
+                print(f"[yellow]Preview sample for '{table_name}' skipped: {e}[/yellow]")
+        try:
+            refresh_cubes(con, table_name, f"read_csv_auto({_sql_str(path)})" if mode == "append" else None)
+        except Exception as e:
+            print(f"[yellow]Rollup cubes for '{table_name}' skipped: {e}[/yellow]")
+        if mode == "append":
+            # Merge the new rows while the macros still match what they were appended to;
+            # other loads leave them to rebuild on next use
+            refresh_materialized_macros(con, table_name, appended_to=appended_to)
+        verb = "Appended" if mode == "append" else "Loaded"
+        print(f"[green]{verb} {path} into table '{table_name}' ({rows:,} rows)[/green]")
         return table_name
     except Exception as e:
         print(f"[red]Failed to ingest {path}: {e}[/red]")
         return None
 
+
 def auto_ingest_folder(con, folder_path):
     if not os.path.exists(folder_path):
         return []
-    
+
     loaded_tables = []
     for f in os.listdir(folder_path):
         if f.endswith(".csv"):
@@ -0,0 +1,292 @@
+"""
+Process-pool query isolation
+Optional backend that runs read-only queries in worker processes, so a query that
+exhausts memory or crashes DuckDB costs one worker instead of the whole server.
+DuckDB lets only one process open metadata.db, so workers read a snapshot the
+coordinator publishes whenever the catalog or a table version changes; results come
+back as Arrow IPC in shared memory and are mapped, not copied, by the server.
+A snapshot is a full copy of the database, so databases over SNAPSHOT_MAX_MB are not
+isolated: their queries run in-process instead of being copied after every change.
+"""
+import ctypes
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from multiprocessing import shared_memory
+
+import duckdb
+import pyarrow as pa
+
+from catalog import catalog_signature
+from versioning import get_table_versions
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows: no peak RSS, workers are only replaced when they die
+    RESOURCE_AVAILABLE = False
+
+POOL_SIZE = 2
+WORKER_MEMORY_LIMIT = "4GB"  # DuckDB limit per worker: most runaway queries fail cleanly before the OS steps in
+WORKER_HIGH_WATER_MB = 6144  # A worker whose peak RSS passes this is replaced after its query
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_MAX_MB = 2048  # Above this a snapshot copy costs more than the isolation is worth
+WORKER_WAIT_TIMEOUT = 30  # Seconds a query waits for a free worker (admission lets more queries in than there are workers)
+SNAPSHOT_ALIAS = "__snapshot"
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker running a query died (segfault, OOM kill); it has been replaced"""
+
+
+class SnapshotTooLarge(RuntimeError):
+    """The database is too large to snapshot for the workers; run the query in-process"""
+
+
+def is_read_only_query(con, sql):
+    """True for a single SELECT, the only statements the read-only workers can run"""
+    try:
+        statements = con.extract_statements(sql)
+    except duckdb.Error:
+        return False
+    return len(statements) == 1 and statements[0].type.name == "SELECT"
+
+
+def has_session_state(con):
+    """True when the connection holds TEMP tables/views or variables, which snapshots do not carry"""
+    return con.execute("""
+        SELECT (SELECT count(*) FROM duckdb_tables() WHERE temporary)
+             + (SELECT count(*) FROM duckdb_views() WHERE temporary AND NOT internal)
+             + (SELECT count(*) FROM duckdb_variables())
+    """).fetchone()[0] > 0
+
+
+def database_mb(con):
+    """Size of the allocated blocks of the connection's database in MB"""
+    row = con.execute("SELECT block_size * used_blocks FROM pragma_database_size() WHERE database_name = current_database()").fetchone()
+    return row[0] / 1024 / 1024 if row else 0
+
+
+def _peak_rss_mb():
+    if not RESOURCE_AVAILABLE:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def _write_shared(table, size):
+    """Serialize a table straight into a new shared memory segment; returns its name"""
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        target = pa.py_buffer(shm.buf)
+        stream = pa.FixedSizeBufferWriter(target)
+        writer = pa.ipc.new_stream(stream, table.schema)
+        writer.write_table(table)
+        writer.close()
+        stream.close()
+        del writer, stream, target  # Release the exported view so the segment can be closed
+    except Exception:
+        shm.unlink()
+        raise
+    finally:
+        shm.close()
+    return shm.name
+
+
+def _worker_main(conn, memory_limit, high_water_mb):
+    """Worker loop: (snapshot path, sql) in; ("ok", shm name, size, peak MB) or ("error", type, message, peak MB) out"""
+    db, db_path = None, None
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        snapshot, sql = task
+        try:
+            if snapshot != db_path:
+                if db is not None:
+                    db.close()
+                db = duckdb.connect(snapshot, read_only=True, config={"memory_limit": memory_limit})
+                db_path = snapshot
+            table = db.execute(sql).to_arrow_table()
+            sink = pa.MockOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            size = sink.size()
+            reply = ("ok", _write_shared(table, size), size, _peak_rss_mb())
+            del table
+        except Exception as e:
+            reply = ("error", type(e).__name__, str(e), _peak_rss_mb())
+        conn.send(reply)
+        if reply[3] > high_water_mb:
+            return
+
+
+class _SharedBlock:
+    """Keeps a shared memory segment mapped for as long as Arrow buffers point into it"""
+
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.shm.unlink()  # The mapping outlives the name; nothing else needs to find it
+        self._anchor = ctypes.c_char.from_buffer(self.shm.buf)
+        self.address = ctypes.addressof(self._anchor)
+
+    def __del__(self):
+        del self._anchor
+        self.shm.close()
+
+
+def _read_shared(name, size):
+    block = _SharedBlock(name)
+    return pa.ipc.open_stream(pa.foreign_buffer(block.address, size, base=block)).read_all()
+
+
+class _Worker:
+    def __init__(self, ctx, memory_limit, high_water_mb):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child, memory_limit, high_water_mb), name="query-worker", daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class QueryPool:
+    """
+    Worker processes plus the snapshot they read. `execute(sql)` returns a pyarrow
+    Table; a crashed or timed-out worker is replaced and the query fails with
+    WorkerCrashed / TimeoutError instead of taking the server down.
+    """
+
+    def __init__(self, con, size=POOL_SIZE, snapshot_dir=SNAPSHOT_DIR, memory_limit=WORKER_MEMORY_LIMIT,
+                 high_water_mb=WORKER_HIGH_WATER_MB, snapshot_max_mb=SNAPSHOT_MAX_MB, wait_timeout=WORKER_WAIT_TIMEOUT):
+        self.con = con
+        self.snapshot_max_mb = snapshot_max_mb
+        self.wait_timeout = wait_timeout
+        self.snapshot_dir = snapshot_dir
+        self.memory_limit = memory_limit
+        self.high_water_mb = high_water_mb
+        self.restarts = 0
+        self.recycled = 0
+        self._ctx = mp.get_context("spawn")  # Forking a process that runs DuckDB threads is unsafe
+        self._idle = queue.Queue()
+        self._snapshot = None
+        self._snapshot_key = None
+        self._lock = threading.Lock()
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self._remove_snapshots()  # Leftovers of a previous run
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        return _Worker(self._ctx, self.memory_limit, self.high_water_mb)
+
+    def _replace(self, worker, kill=False):
+        worker.stop(kill=kill)
+        return self._spawn()
+
+    # --- Snapshot coordination ---
+    def invalidate(self):
+        """Force a new snapshot before the next query (e.g. after in-process DML)"""
+        with self._lock:
+            self._snapshot_key = None
+
+    def _remove_snapshots(self, keep=None):
+        for f in os.listdir(self.snapshot_dir):
+            path = os.path.join(self.snapshot_dir, f)
+            if path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # Still open in a worker (Windows); removed on a later pass
+
+    def snapshot(self):
+        """
+        Path of a snapshot matching the current catalog and table versions, published if
+        needed; raises SnapshotTooLarge when publishing would copy more than snapshot_max_mb
+        """
+        cursor = self.con.cursor()
+        try:
+            key = (catalog_signature(cursor), tuple(sorted(get_table_versions(cursor).items())))
+            with self._lock:
+                if key == self._snapshot_key and self._snapshot:
+                    return self._snapshot
+                size_mb = database_mb(cursor)
+                if size_mb > self.snapshot_max_mb:
+                    raise SnapshotTooLarge(f"Database is {size_mb:,.0f}MB; snapshots are limited to {self.snapshot_max_mb:,}MB")
+                path = os.path.join(self.snapshot_dir, f"snapshot_{uuid.uuid4().hex[:12]}.db")
+                source = cursor.execute("SELECT current_database()").fetchone()[0]
+                cursor.execute(f"ATTACH '{path}' AS {SNAPSHOT_ALIAS}")
+                try:
+                    cursor.execute(f'COPY FROM DATABASE "{source}" TO {SNAPSHOT_ALIAS}')
+                finally:
+                    cursor.execute(f"DETACH {SNAPSHOT_ALIAS}")
+                self._snapshot, self._snapshot_key = path, key
+                self._remove_snapshots(keep=path)
+                return path
+        finally:
+            cursor.close()
+
+    # --- Execution ---
+    def execute(self, sql, timeout=None):
+        snapshot = self.snapshot()
+        try:
+            worker = self._idle.get(timeout=self.wait_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No query worker free after {self.wait_timeout}s") from None
+        try:
+            worker.conn.send((snapshot, sql))
+            deadline = time.monotonic() + timeout if timeout else None
+            while not worker.conn.poll(0.1):
+                if not worker.process.is_alive():
+                    raise EOFError
+                if deadline and time.monotonic() > deadline:
+                    worker = self._replace(worker, kill=True)
+                    self.restarts += 1
+                    raise TimeoutError(f"Query exceeded {timeout}s; its worker was restarted")
+            reply = worker.conn.recv()
+            if reply[3] > self.high_water_mb:
+                # The worker exits on its own after this reply; swap in a fresh one
+                worker = self._replace(worker)
+                self.recycled += 1
+        except (EOFError, ConnectionError):
+            code = worker.process.exitcode
+            worker = self._replace(worker, kill=True)
+            self.restarts += 1
+            raise WorkerCrashed(f"Query worker exited (code {code}); a new worker has been started") from None
+        finally:
+            self._idle.put(worker)
+
+        if reply[0] == "error":
+            raise duckdb.Error(f"{reply[1]}: {reply[2]}")
+        return _read_shared(reply[1], reply[2])
+
+    def stats(self):
+        return {"workers": self._idle.qsize(), "restarts": self.restarts, "recycled": self.recycled,
+                "snapshot": self._snapshot}
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get().stop()
+        self._remove_snapshots()
+
+
+def start_query_pool(con, **kwargs):
+    return QueryPool(con, **kwargs)
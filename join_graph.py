@@ -0,0 +1,303 @@
+"""
+Join-key discovery across the whole catalog
+Column sketches of every table pair are compared (vectorized over all column pairs of
+two tables) into a ranked graph of likely join keys and foreign-key relationships,
+stored in _engine.join_graph. A background worker re-analyzes only tables whose data
+version changed, so the cost grows with what changed rather than with catalog size.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from admission import QUERY_ADMISSION
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from sketches import EMPTY_SLOT, ensure_table_sketches, load_sketches
+from versioning import get_table_versions, subscribe_table_changes, unsubscribe_table_changes
+
+JOIN_GRAPH_TABLE = f"{INTERNAL_SCHEMA}.join_graph"
+JOIN_GRAPH_STATE_TABLE = f"{INTERNAL_SCHEMA}.join_graph_state"
+
+MIN_JOIN_SCORE = 0.5     # Containment (plus name bonus) needed to keep an edge
+MIN_DISTINCT = 20        # Low-cardinality columns (flags, statuses) overlap by accident
+UNIQUE_RATIO = 0.95      # distinct / non-null above this: the column looks like a key
+NAME_MATCH_BONUS = 0.1
+NON_KEY_TYPES = ("BOOLEAN", "FLOAT", "DOUBLE", "DATE", "TIME", "TIMESTAMP", "INTERVAL")
+DISCOVERY_DELAY = 3.0    # Seconds to wait for a burst of ingests to finish
+RELATIONSHIP_LABELS = {"many_to_one": "N:1", "one_to_one": "1:1", "many_to_many": "N:N"}
+
+
+def _ensure_tables(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {JOIN_GRAPH_TABLE} (
+            from_table VARCHAR NOT NULL,
+            from_column VARCHAR NOT NULL,
+            to_table VARCHAR NOT NULL,
+            to_column VARCHAR NOT NULL,
+            relationship VARCHAR,
+            score DOUBLE,
+            containment DOUBLE,
+            jaccard DOUBLE,
+            from_distinct DOUBLE,
+            to_distinct DOUBLE,
+            computed_at TIMESTAMP
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {JOIN_GRAPH_STATE_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            version BIGINT,
+            analyzed_at TIMESTAMP
+        )
+    """)
+
+
+def _catalog_tables(con):
+    return [r[0] for r in con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main' ORDER BY table_name"
+    ).fetchall()]
+
+
+def _hll_estimates(registers):
+    """Row-wise HyperLogLog estimates for a (columns, buckets) register matrix"""
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimates = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    small = (estimates <= 2.5 * m) & (zeros > 0)
+    estimates[small] = m * np.log(m / zeros[small])
+    return estimates
+
+
+class _TableSketches:
+    """Key-candidate column sketches of one table as numpy matrices"""
+
+    def __init__(self, con, table_name):
+        ensure_table_sketches(con, table_name)
+        sketches = {
+            col: s for col, s in load_sketches(con, table_name).items()
+            if s["non_null"] and not (s["type"] or "").upper().startswith(NON_KEY_TYPES)
+        }
+        self.table = table_name
+        self.columns = list(sketches)
+        if not self.columns:
+            return
+        self.registers = np.array([sketches[c]["registers"] for c in self.columns], dtype=np.uint8)
+        self.minhash = np.array([sketches[c]["minhash"] for c in self.columns], dtype=np.uint64)
+        self.non_null = np.array([sketches[c]["non_null"] for c in self.columns], dtype=np.float64)
+        self.distinct = _hll_estimates(self.registers)
+        keep = self.distinct >= MIN_DISTINCT
+        self.columns = [c for c, k in zip(self.columns, keep) if k]
+        self.registers, self.minhash = self.registers[keep], self.minhash[keep]
+        self.non_null, self.distinct = self.non_null[keep], self.distinct[keep]
+
+    def unique(self):
+        return self.distinct / np.maximum(self.non_null, 1) >= UNIQUE_RATIO
+
+
+def _compare_tables(a, b):
+    """Edges between two tables: one row per column pair scoring at least MIN_JOIN_SCORE"""
+    if not a.columns or not b.columns:
+        return []
+    edges = []
+    unique_a, unique_b = a.unique(), b.unique()
+    filled_b = b.minhash != EMPTY_SLOT
+    for i, col_a in enumerate(a.columns):
+        # All columns of b at once: (columns_b, buckets)
+        used = (a.minhash[i] != EMPTY_SLOT) | filled_b
+        same = (a.minhash[i] == b.minhash) & used
+        jaccard = same.sum(axis=1) / np.maximum(used.sum(axis=1), 1)
+        union = _hll_estimates(np.maximum(a.registers[i], b.registers))
+        smaller = np.maximum(np.minimum(a.distinct[i], b.distinct), 1.0)
+        containment = np.minimum(jaccard * union / smaller, 1.0)
+        bonus = np.array([NAME_MATCH_BONUS if col_a.lower() == c.lower() else 0.0 for c in b.columns])
+        score = containment + bonus
+        for j in np.nonzero(score >= MIN_JOIN_SCORE)[0]:
+            edges.append(_edge(a, i, b, j, unique_a[i], unique_b[j],
+                               float(score[j]), float(containment[j]), float(jaccard[j])))
+    return edges
+
+
+def _edge(a, i, b, j, unique_a, unique_b, score, containment, jaccard):
+    """Orient a column pair as referencing (many) -> referenced (unique) side"""
+    if unique_a and unique_b:
+        relationship = "one_to_one"
+    elif unique_a or unique_b:
+        relationship = "many_to_one"
+        if unique_a:  # a is the referenced side
+            a, i, b, j = b, j, a, i
+    else:
+        relationship = "many_to_many"
+    return [a.table, a.columns[i], b.table, b.columns[j], relationship, score, containment, jaccard,
+            float(a.distinct[i]), float(b.distinct[j])]
+
+
+def discover_join_keys(con, tables=None):
+    """
+    Recompute graph edges touching `tables` (default: every table) against the whole
+    catalog. Returns the number of edges written.
+    """
+    _ensure_tables(con)
+    catalog = _catalog_tables(con)
+    # Edges of dropped tables go away with them
+    if catalog:
+        placeholders = ", ".join("?" for _ in catalog)
+        con.execute(f"DELETE FROM {JOIN_GRAPH_TABLE} WHERE from_table NOT IN ({placeholders}) "
+                    f"OR to_table NOT IN ({placeholders})", catalog + catalog)
+        con.execute(f"DELETE FROM {JOIN_GRAPH_STATE_TABLE} WHERE table_name NOT IN ({placeholders})", catalog)
+    else:
+        con.execute(f"DELETE FROM {JOIN_GRAPH_TABLE}")
+        con.execute(f"DELETE FROM {JOIN_GRAPH_STATE_TABLE}")
+    targets = [t for t in (tables if tables is not None else catalog) if t in catalog]
+    if not targets:
+        return 0
+
+    sketches = {}
+    for t in catalog:
+        try:
+            sketches[t] = _TableSketches(con, t)
+        except Exception:
+            continue  # Unreadable view or similar: leave it out of the graph
+
+    versions = get_table_versions(con)
+    done, edges = set(), []
+    for t in targets:
+        if t not in sketches:
+            continue
+        for other in catalog:
+            pair = frozenset((t, other))
+            if other == t or other not in sketches or pair in done:
+                continue
+            done.add(pair)
+            edges.extend(_compare_tables(sketches[t], sketches[other]))
+
+    now = datetime.now()
+    placeholders = ", ".join("?" for _ in targets)
+    con.begin()
+    try:
+        con.execute(f"DELETE FROM {JOIN_GRAPH_TABLE} WHERE from_table IN ({placeholders}) "
+                    f"OR to_table IN ({placeholders})", targets + targets)
+        if edges:
+            con.executemany(f"INSERT INTO {JOIN_GRAPH_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            [e + [now] for e in edges])
+        con.executemany(f"INSERT OR REPLACE INTO {JOIN_GRAPH_STATE_TABLE} VALUES (?, ?, ?)",
+                        [[t, versions.get(t, 0), now] for t in targets])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return len(edges)
+
+
+def stale_tables(con):
+    """Tables never analyzed, or whose data version moved since the last analysis"""
+    _ensure_tables(con)
+    analyzed = dict(con.execute(f"SELECT table_name, version FROM {JOIN_GRAPH_STATE_TABLE}").fetchall())
+    versions = get_table_versions(con)
+    return [t for t in _catalog_tables(con) if analyzed.get(t) != versions.get(t, 0)]
+
+
+def join_edges(con, table_name=None, min_score=MIN_JOIN_SCORE, limit=50):
+    """
+    Ranked edges as dicts (from_table, from_column, to_table, to_column, relationship,
+    score, containment, jaccard), optionally only those touching one table
+    """
+    _ensure_tables(con)
+    where, params = "score >= ?", [min_score]
+    if table_name:
+        where += " AND (from_table = ? OR to_table = ?)"
+        params += [table_name, table_name]
+    cursor = con.execute(f"""
+        SELECT from_table, from_column, to_table, to_column, relationship, score, containment, jaccard
+        FROM {JOIN_GRAPH_TABLE} WHERE {where}
+        ORDER BY score DESC, from_table, to_table LIMIT {int(limit)}
+    """, params)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def join_condition(edge):
+    return f'{edge["from_table"]}.{edge["from_column"]} = {edge["to_table"]}.{edge["to_column"]}'
+
+
+def join_hints(con, tables, min_score=MIN_JOIN_SCORE):
+    """Join conditions between any two of `tables`, best first"""
+    tables = set(tables)
+    return [
+        join_condition(e) for e in join_edges(con, min_score=min_score, limit=1000)
+        if e["from_table"] in tables and e["to_table"] in tables
+    ]
+
+
+class JoinKeyDiscovery:
+    """
+    Background join-graph maintenance. Listens for table version bumps, waits for the
+    burst to settle and re-analyzes just those tables on its own cursor. `version`
+    increases after every pass so UIs can refresh graph-derived hints.
+    """
+
+    def __init__(self, con, delay=DISCOVERY_DELAY):
+        self.con = con
+        self.delay = delay
+        self.version = 0
+        self.last_error = None
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listener = None
+
+    def start(self):
+        if self._thread:
+            return self
+        cursor = self.con.cursor()
+        try:
+            self._dirty.update(stale_tables(cursor))
+        finally:
+            cursor.close()
+        self._listener = subscribe_table_changes(self._on_table_changed)
+        self._thread = threading.Thread(target=self._run, name="join-discovery", daemon=True)
+        self._thread.start()
+        if self._dirty:
+            self._wake.set()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._listener:
+            unsubscribe_table_changes(self._listener)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _on_table_changed(self, table_name, version):
+        with self._lock:
+            self._dirty.add(table_name)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            if self._stop.wait(self.delay):
+                return
+            self._wake.clear()
+            with self._lock:
+                tables, self._dirty = sorted(self._dirty), set()
+            if not tables:
+                continue
+            cursor = self.con.cursor()
+            try:
+                with QUERY_ADMISSION.admit("background", interrupt=cursor):
+                    discover_join_keys(cursor, tables)
+                self.version += 1
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                cursor.close()
+
+
+def start_join_discovery(con, **kwargs):
+    return JoinKeyDiscovery(con, **kwargs).start()
@@ -1,4 +1,7 @@
 import re
+from datetime import datetime
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from versioning import bump_table_version, table_fingerprint
 
 MACRO_MAP = {
     "@top_users": "SELECT user_id, count(*) as cnt FROM sales GROUP BY user_id ORDER BY cnt DESC LIMIT 10",
@@ -6,8 +9,179 @@ MACRO_MAP = {
     "@dedup_latest": "SELECT * FROM (SELECT *, row_number() OVER (PARTITION BY id ORDER BY updated_at DESC) as rn FROM my_table) WHERE rn = 1"
 }
 
-def expand_macros(sql):
+# Macros stored as tables and refreshed incrementally from a high-water mark after
+# appends; any other change to the source (a rebuild, UPDATE/DELETE) rebuilds them.
+#   source    - base table the macro scans
+#   watermark - monotonically increasing column of the source (e.g. a timestamp)
+#   keys      - output columns identifying a row of the materialized result
+#   merge     - "aggregate": re-combine measures for touched keys
+#               "upsert":    newer rows replace older rows with the same keys
+#   measures  - for "aggregate": output column -> combine function (sum/min/max)
+MATERIALIZED_MACROS = {
+    "@daily_agg": {
+        "source": "sales",
+        "watermark": "timestamp",
+        "keys": ["day"],
+        "merge": "aggregate",
+        "measures": {"total": "sum"},
+        "order_by": ["day"],
+    },
+    "@dedup_latest": {
+        "source": "my_table",
+        "watermark": "updated_at",
+        "keys": ["id"],
+        "merge": "upsert",
+    },
+}
+
+MACRO_STATE_TABLE = f"{INTERNAL_SCHEMA}.macro_state"
+_COMBINE = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+
+
+def materialized_table_name(macro):
+    return f"{INTERNAL_SCHEMA}.mv_{macro.lstrip('@')}"
+
+
+def mark_materialized(macro, source, watermark, keys, merge="upsert", measures=None, order_by=None):
+    """Register a macro from MACRO_MAP for materialization"""
+    if macro not in MACRO_MAP:
+        raise ValueError(f"Unknown macro: {macro}")
+    if merge not in ("aggregate", "upsert"):
+        raise ValueError(f"Unknown merge strategy: {merge}")
+    MATERIALIZED_MACROS[macro] = {
+        "source": source, "watermark": watermark, "keys": list(keys),
+        "merge": merge, "measures": measures or {}, "order_by": order_by or [],
+    }
+
+
+def _ensure_state_table(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MACRO_STATE_TABLE} (
+            macro VARCHAR PRIMARY KEY,
+            table_name VARCHAR,
+            source VARCHAR,
+            watermark_column VARCHAR,
+            high_water_mark VARCHAR,
+            refreshed_at TIMESTAMP
+        )
+    """)
+    con.execute(f"ALTER TABLE {MACRO_STATE_TABLE} ADD COLUMN IF NOT EXISTS source_fingerprint VARCHAR")
+
+
+def _delta_sql(macro, cfg):
+    """Macro SQL with its source scan restricted to rows in (old mark, new mark]"""
+    bounded = f'(SELECT * FROM {cfg["source"]} WHERE "{cfg["watermark"]}" > ? AND "{cfg["watermark"]}" <= ?) AS {cfg["source"]}'
+    return re.sub(rf'\bFROM\s+{re.escape(cfg["source"])}\b', f"FROM {bounded}", MACRO_MAP[macro], flags=re.IGNORECASE)
+
+
+def _key_match(cfg, left, right):
+    return " AND ".join(f'{left}."{k}" IS NOT DISTINCT FROM {right}."{k}"' for k in cfg["keys"])
+
+
+def refresh_materialized_macro(con, macro, full=False, appended_to=None):
+    """
+    Bring a materialized macro up to date; returns the materialized table name, or
+    None if the source is unavailable.
+    Nothing is scanned while the source fingerprint matches the stored one. After an
+    append (`appended_to`: the source fingerprint the rows were appended to) only rows
+    newer than the stored high-water mark are merged; any other change rebuilds it.
+    """
+    cfg = MATERIALIZED_MACROS[macro]
+    mv = materialized_table_name(macro)
+    _ensure_state_table(con)
+
+    try:
+        fingerprint = table_fingerprint(con, cfg["source"])
+        state = con.execute(
+            f"SELECT high_water_mark, source_fingerprint FROM {MACRO_STATE_TABLE} WHERE macro = ?", [macro]
+        ).fetchone()
+        exists = con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?",
+            [INTERNAL_SCHEMA, mv.split(".", 1)[1]]
+        ).fetchone()[0] > 0
+        if exists and not full and state is not None and state[1] == fingerprint:
+            return mv  # Source unchanged since the last refresh
+        new_mark = con.execute(f'SELECT CAST(max("{cfg["watermark"]}") AS VARCHAR) FROM {cfg["source"]}').fetchone()[0]
+    except Exception as e:
+        print(f"Cannot materialize {macro}: {e}")
+        return None
+
+    # Only rows appended to what the stored result was built from can be merged
+    rebuild = (full or not exists or state is None or state[0] is None
+               or appended_to is None or state[1] != appended_to)
+    newer = not rebuild and new_mark is not None and _is_newer(con, cfg, new_mark, state[0])
+
+    con.begin()
+    try:
+        if rebuild:
+            con.execute(f"CREATE OR REPLACE TABLE {mv} AS {MACRO_MAP[macro]}")
+        elif newer:
+            con.execute(f"CREATE OR REPLACE TEMP TABLE __mv_delta AS {_delta_sql(macro, cfg)}", [state[0], new_mark])
+            match = _key_match(cfg, mv, "__mv_delta")
+            if cfg["merge"] == "aggregate":
+                keys = ", ".join(f'"{k}"' for k in cfg["keys"])
+                measures = ", ".join(
+                    f'{_COMBINE[fn]}("{col}") AS "{col}"' for col, fn in cfg["measures"].items()
+                )
+                con.execute(f"""
+                    CREATE OR REPLACE TEMP TABLE __mv_merged AS
+                    SELECT {keys}, {measures} FROM (
+                        SELECT * FROM {mv} WHERE EXISTS (SELECT 1 FROM __mv_delta WHERE {match})
+                        UNION ALL BY NAME
+                        SELECT * FROM __mv_delta
+                    ) GROUP BY {keys}
+                """)
+                con.execute(f"DELETE FROM {mv} USING __mv_delta WHERE {match}")
+                con.execute(f"INSERT INTO {mv} BY NAME SELECT * FROM __mv_merged")
+                con.execute("DROP TABLE IF EXISTS __mv_merged")
+            else:
+                con.execute(f"DELETE FROM {mv} USING __mv_delta WHERE {match}")
+                con.execute(f"INSERT INTO {mv} BY NAME SELECT * FROM __mv_delta")
+            con.execute("DROP TABLE IF EXISTS __mv_delta")
+
+        con.execute(f"""
+            INSERT OR REPLACE INTO {MACRO_STATE_TABLE}
+            (macro, table_name, source, watermark_column, high_water_mark, refreshed_at, source_fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [macro, mv, cfg["source"], cfg["watermark"], new_mark if rebuild or newer else state[0],
+              datetime.now(), fingerprint])
+        if rebuild or newer:
+            bump_table_version(con, mv)  # Snapshots and caches keyed on table versions see the refresh
+        con.commit()
+    except Exception as e:
+        con.rollback()
+        print(f"Error refreshing {macro}: {e}")
+        return mv if exists and not rebuild else None
+    return mv
+
+
+def _is_newer(con, cfg, new_mark, old_mark):
+    """Compare marks in the watermark column's own type (string order differs for e.g. numbers)"""
+    col_type = con.execute(
+        f'SELECT column_type FROM (DESCRIBE {cfg["source"]}) WHERE column_name = ?', [cfg["watermark"]]
+    ).fetchone()[0]
+    return con.execute(f"SELECT CAST(? AS {col_type}) > CAST(? AS {col_type})", [new_mark, old_mark]).fetchone()[0]
+
+
+def refresh_materialized_macros(con, source=None, appended_to=None):
+    """Refresh every materialized macro (optionally only those reading `source`)"""
+    refreshed = []
+    for macro, cfg in MATERIALIZED_MACROS.items():
+        if source and cfg["source"] != source:
+            continue
+        if refresh_materialized_macro(con, macro, appended_to=appended_to):
+            refreshed.append(macro)
+    return refreshed
+
+
+def expand_macros(sql, con=None):
     for macro, replacement in MACRO_MAP.items():
         if macro in sql:
+            if con is not None and macro in MATERIALIZED_MACROS:
+                mv = refresh_materialized_macro(con, macro)
+                if mv:
+                    order = ", ".join(f'"{c}"' for c in MATERIALIZED_MACROS[macro].get("order_by", []))
+                    replacement = f"SELECT * FROM {mv}" + (f" ORDER BY {order}" if order else "")
             sql = sql.replace(macro, f"({replacement})")
     return sql
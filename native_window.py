@@ -1,7 +1,11 @@
 """
 Native macOS window wrapper for Streamlit application
-Uses PyQt5 to create a native window with embedded web view
+Uses PyQt5 to create a native window with embedded web view. The server is started
+through serve.py, which warms the engine while it boots and reports readiness (with
+startup phase timings) over a local socket, so the window never sleeps or polls.
 """
+import json
+import socket
 import sys
 import time
 import subprocess
@@ -11,12 +15,60 @@ from pathlib import Path
 try:
     from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget
     from PyQt5.QtWebEngineWidgets import QWebEngineView
-    from PyQt5.QtCore import QUrl, QTimer, pyqtSignal, QObject
+    from PyQt5.QtCore import QUrl, pyqtSignal, QObject
     from PyQt5.QtGui import QIcon
     PYQT5_AVAILABLE = True
 except ImportError:
     PYQT5_AVAILABLE = False
 
+SERVER_START_TIMEOUT = 30
+
+def start_server(script_path, port=8503):
+    """
+    Spawn the Streamlit server via serve.py; returns (process, listener) where
+    `listener` is the socket the server reports readiness on
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    serve_path = Path(script_path).parent / "serve.py"
+    process = subprocess.Popen([
+        sys.executable, str(serve_path), str(script_path),
+        "--port", str(port),
+        "--ready-port", str(listener.getsockname()[1])
+    ])
+    return process, listener
+
+def wait_for_ready(listener, process, timeout=SERVER_START_TIMEOUT):
+    """
+    Block until the server signals readiness; returns its startup phase timings,
+    or None if it exited or stayed silent for `timeout` seconds
+    """
+    started = time.perf_counter()
+    listener.settimeout(0.25)  # Wake up now and then to notice a server that died
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                if process.poll() is not None:
+                    return None
+                continue
+            with conn:
+                conn.settimeout(5)
+                message = conn.makefile().readline()
+            phases = json.loads(message).get("timings", {}) if message else {}
+            phases["launcher_wait"] = time.perf_counter() - started
+            return phases
+        return None
+    finally:
+        listener.close()
+
+def report_startup(phases):
+    """Print startup phase timings"""
+    from warmup import format_timings
+    print(f"Startup: {format_timings(phases)}")
+
 def wait_for_server(url="http://127.0.0.1:8503", timeout=30):
     """Wait for the Streamlit server to be ready"""
     import requests
@@ -31,6 +83,10 @@ def wait_for_server(url="http://127.0.0.1:8503", timeout=30):
         time.sleep(0.5)
     return False
 
+class ServerReadiness(QObject):
+    """Carries the readiness signal from the waiting thread to the Qt main thread"""
+    finished = pyqtSignal(object)
+
 class NativeStreamlitWindow(QMainWindow):
     """Native macOS window containing the Streamlit app"""
     
@@ -39,6 +95,7 @@ class NativeStreamlitWindow(QMainWindow):
         self.url = url
         self.app_name = app_name
         self.streamlit_process = None
+        self.startup_phases = None
         self.init_ui()
         
     def init_ui(self):
@@ -65,6 +122,8 @@ class NativeStreamlitWindow(QMainWindow):
         # Create web view
         self.webview = QWebEngineView()
         layout.addWidget(self.webview)
+        # Result exports are plain download links; save them where the user chooses
+        self.webview.page().profile().downloadRequested.connect(self.on_download_requested)
         
         # Set window properties for macOS
         self.setWindowIcon(QIcon())
@@ -78,14 +137,33 @@ class NativeStreamlitWindow(QMainWindow):
         frame_geometry.moveCenter(screen)
         self.move(frame_geometry.topLeft())
         
-    def load_streamlit_app(self):
-        """Load the Streamlit application in the web view"""
-        # Wait for server to be ready
-        if wait_for_server(self.url):
-            self.webview.setUrl(QUrl(self.url))
-        else:
+    def on_server_ready(self, phases):
+        """Load the app as soon as the server reports readiness"""
+        if phases is None:
             print(f"Error: Streamlit server at {self.url} did not start in time")
             self.show_error_message()
+            return
+        self.startup_phases = phases
+        self._load_started = time.perf_counter()
+        self.webview.loadFinished.connect(self.on_page_loaded)
+        self.webview.setUrl(QUrl(self.url))
+    
+    def on_page_loaded(self, ok):
+        self.webview.loadFinished.disconnect(self.on_page_loaded)
+        if self.startup_phases is not None:
+            self.startup_phases["page_load"] = time.perf_counter() - self._load_started
+            report_startup(self.startup_phases)
+    
+    def on_download_requested(self, download):
+        """Ask where to save a downloaded export"""
+        from PyQt5.QtWidgets import QFileDialog
+        suggested = str(Path.home() / "Downloads" / Path(download.path()).name)
+        path, _ = QFileDialog.getSaveFileName(self, "Save export", suggested)
+        if path:
+            download.setPath(path)
+            download.accept()
+        else:
+            download.cancel()
     
     def show_error_message(self):
         """Show error message if server fails to start"""
@@ -126,15 +204,8 @@ def launch_native_app(script_path, port=8503, app_name="CSV SQL Engine Pro"):
     app = QApplication(sys.argv)
     app.setApplicationName(app_name)
     
-    # Start Streamlit server in background
-    streamlit_process = subprocess.Popen([
-        sys.executable, "-m", "streamlit", "run",
-        str(script_path),
-        "--server.port", str(port),
-        "--server.headless", "true",
-        "--server.address", "127.0.0.1",
-        "--browser.gatherUsageStats", "false"
-    ])
+    # Start Streamlit server first, so it boots (and warms the engine) while Qt sets up
+    streamlit_process, ready_listener = start_server(script_path, port)
     
     # Create and show native window
     window = NativeStreamlitWindow(
@@ -144,8 +215,13 @@ def launch_native_app(script_path, port=8503, app_name="CSV SQL Engine Pro"):
     window.streamlit_process = streamlit_process
     window.show()
     
-    # Load the app after a short delay
-    QTimer.singleShot(1000, window.load_streamlit_app)
+    # Load the app the moment the server reports it is ready
+    readiness = ServerReadiness()
+    readiness.finished.connect(window.on_server_ready)
+    threading.Thread(
+        target=lambda: readiness.finished.emit(wait_for_ready(ready_listener, streamlit_process)),
+        name="server-ready", daemon=True
+    ).start()
     
     # Run the application
     try:
@@ -156,20 +232,15 @@ def launch_native_app(script_path, port=8503, app_name="CSV SQL Engine Pro"):
 
 def launch_browser_fallback(script_path, port=8503):
     """Fallback to browser mode if PyQt5 is not available"""
-    import subprocess
-    import time
     import webbrowser
     
-    process = subprocess.Popen([
-        sys.executable, "-m", "streamlit", "run",
-        str(script_path),
-        "--server.port", str(port),
-        "--server.headless", "true",
-        "--server.address", "127.0.0.1"
-    ])
-    
-    time.sleep(3)
-    webbrowser.open(f"http://127.0.0.1:{port}")
+    process, ready_listener = start_server(script_path, port)
+    phases = wait_for_ready(ready_listener, process)
+    if phases is None:
+        print(f"Error: Streamlit server on port {port} did not start in time")
+    else:
+        report_startup(phases)
+        webbrowser.open(f"http://127.0.0.1:{port}")
     
     try:
         process.wait()
@@ -0,0 +1,138 @@
+"""
+Set-overlap engine for the Common Value Finder
+Distinct key sets (with multiplicities) are materialized once per table version and
+reused, so repeated comparisons only join two small distinct-key tables.
+"""
+import hashlib
+import time
+from datetime import datetime
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from versioning import table_fingerprint
+
+KEY_SETS_TABLE = f"{INTERNAL_SCHEMA}.key_sets"
+
+# (set_a, fingerprint_a, set_b, fingerprint_b) -> comparison result
+_comparison_cache = {}
+MAX_CACHED_COMPARISONS = 256
+
+
+def _ensure_registry(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {KEY_SETS_TABLE} (
+            set_table VARCHAR PRIMARY KEY,
+            table_name VARCHAR NOT NULL,
+            columns VARCHAR NOT NULL,
+            fingerprint VARCHAR NOT NULL,
+            distinct_keys BIGINT,
+            built_at TIMESTAMP
+        )
+    """)
+
+
+def _set_table_name(table_name, columns):
+    digest = hashlib.md5(f"{table_name}|{'|'.join(columns)}".encode()).hexdigest()[:16]
+    return f"keyset_{digest}"
+
+
+def key_set(con, table_name, columns):
+    """
+    Distinct non-null key tuples of table(columns) with their row counts, as an
+    internal table (k0, k1, ..., cnt). Rebuilt only when the table's fingerprint changes.
+    Returns (qualified table name, fingerprint).
+    """
+    _ensure_registry(con)
+    columns = list(columns)
+    fingerprint = table_fingerprint(con, table_name)
+    name = _set_table_name(table_name, columns)
+    row = con.execute(f"SELECT fingerprint FROM {KEY_SETS_TABLE} WHERE set_table = ?", [name]).fetchone()
+    exists = con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?", [INTERNAL_SCHEMA, name]
+    ).fetchone()[0] > 0
+    if row and row[0] == fingerprint and exists:
+        return f"{INTERNAL_SCHEMA}.{name}", fingerprint
+
+    keys = ", ".join(f'"{c}" AS k{i}' for i, c in enumerate(columns))
+    not_null = " AND ".join(f'"{c}" IS NOT NULL' for c in columns)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {INTERNAL_SCHEMA}.{name} AS
+        SELECT {keys}, count(*) AS cnt FROM "{table_name}" WHERE {not_null} GROUP BY ALL
+    """)
+    distinct = con.execute(f"SELECT count(*) FROM {INTERNAL_SCHEMA}.{name}").fetchone()[0]
+    con.execute(
+        f"INSERT OR REPLACE INTO {KEY_SETS_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+        [name, table_name, ",".join(columns), fingerprint, distinct, datetime.now()]
+    )
+    return f"{INTERNAL_SCHEMA}.{name}", fingerprint
+
+
+def compare_keys(con, table_a, columns_a, table_b, columns_b):
+    """
+    Overlap breakdown between table_a(columns_a) and table_b(columns_b).
+    Returns distinct-key counts (common / A-only / B-only), matched row counts on
+    each side, the row count of the equi-join and the key multiplicities.
+    """
+    if len(columns_a) != len(columns_b) or not columns_a:
+        raise ValueError("Both sides need the same, non-zero number of key columns")
+
+    t0 = time.perf_counter()
+    set_a, fp_a = key_set(con, table_a, columns_a)
+    set_b, fp_b = key_set(con, table_b, columns_b)
+    cache_key = (set_a, fp_a, set_b, fp_b)
+    if cache_key in _comparison_cache:
+        return {**_comparison_cache[cache_key], "cached": True, "seconds": time.perf_counter() - t0}
+
+    on = " AND ".join(f"a.k{i} = b.k{i}" for i in range(len(columns_a)))
+    row = con.execute(f"""
+        SELECT
+            count(*) FILTER (WHERE a.cnt IS NOT NULL AND b.cnt IS NOT NULL),
+            count(*) FILTER (WHERE b.cnt IS NULL),
+            count(*) FILTER (WHERE a.cnt IS NULL),
+            coalesce(sum(a.cnt) FILTER (WHERE b.cnt IS NOT NULL), 0),
+            coalesce(sum(a.cnt) FILTER (WHERE b.cnt IS NULL), 0),
+            coalesce(sum(b.cnt) FILTER (WHERE a.cnt IS NOT NULL), 0),
+            coalesce(sum(b.cnt) FILTER (WHERE a.cnt IS NULL), 0),
+            coalesce(sum(a.cnt * b.cnt), 0),
+            coalesce(max(a.cnt) FILTER (WHERE b.cnt IS NOT NULL), 0),
+            coalesce(max(b.cnt) FILTER (WHERE a.cnt IS NOT NULL), 0)
+        FROM {set_a} a FULL OUTER JOIN {set_b} b ON {on}
+    """).fetchone()
+
+    max_a, max_b = row[8], row[9]
+    relationship = f"{'1' if max_a <= 1 else 'N'}:{'1' if max_b <= 1 else 'N'}"  # rows per key on A:B
+    result = {
+        "common_keys": row[0],
+        "a_only_keys": row[1],
+        "b_only_keys": row[2],
+        "a_rows_matched": row[3],
+        "a_rows_unmatched": row[4],
+        "b_rows_matched": row[5],
+        "b_rows_unmatched": row[6],
+        "join_rows": row[7],
+        "max_multiplicity_a": max_a,
+        "max_multiplicity_b": max_b,
+        "relationship": relationship,
+    }
+    if len(_comparison_cache) >= MAX_CACHED_COMPARISONS:
+        _comparison_cache.pop(next(iter(_comparison_cache)))
+    _comparison_cache[cache_key] = result
+    return {**result, "cached": False, "seconds": time.perf_counter() - t0}
+
+
+def overlap_rows_sql(table_a, columns_a, table_b, columns_b, kind="common", limit=100):
+    """SQL listing rows of table_a whose key is in table_b ("common") or not ("a_only")"""
+    match = " AND ".join(f'b."{cb}" = a."{ca}"' for ca, cb in zip(columns_a, columns_b))
+    exists = "EXISTS" if kind == "common" else "NOT EXISTS"
+    return (
+        f'SELECT * FROM "{table_a}" a\n'
+        f'WHERE {exists} (SELECT 1 FROM "{table_b}" b WHERE {match})\n'
+        f"LIMIT {int(limit)};"
+    )
+
+
+def drop_key_sets(con, table_name):
+    """Remove cached key sets of a table (e.g. when it is dropped)"""
+    _ensure_registry(con)
+    for (name,) in con.execute(f"SELECT set_table FROM {KEY_SETS_TABLE} WHERE table_name = ?", [table_name]).fetchall():
+        con.execute(f"DROP TABLE IF EXISTS {INTERNAL_SCHEMA}.{name}")
+    con.execute(f"DELETE FROM {KEY_SETS_TABLE} WHERE table_name = ?", [table_name])
@@ -0,0 +1,161 @@
+"""
+Partitioned ingestion: huge CSVs written as a hive-layout Parquet tree
+(partitions/<table>/<key>=<value>/*.parquet) exposed through a view, with a
+partition catalog holding per-partition row counts. DuckDB prunes partitions on
+filters on the key and skips row groups by the min/max in each Parquet footer.
+"""
+import os
+import shutil
+from datetime import datetime
+from rich import print
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from versioning import save_schema_version, bump_table_version
+from sketches import SKETCH_ON_INGEST, build_table_sketches
+
+PARTITIONS_DIR = "partitions"
+PARTITIONS_TABLE = f"{INTERNAL_SCHEMA}.partitions"
+PARTITION_STATS_TABLE = f"{INTERNAL_SCHEMA}.partition_stats"  # Former min/max catalog, dropped on first use
+SOURCE_DIR = "_source"  # Loaded CSVs moved out of a watched folder, next to their Parquet tree
+
+# Partition key expressions; "value" partitions by the column itself
+GRANULARITIES = {
+    "value": None,
+    "day": "CAST({col} AS DATE)",
+    "month": "strftime(CAST({col} AS DATE), '%Y-%m')",
+    "year": "year(CAST({col} AS DATE))",
+}
+
+
+def _sql_str(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _ensure_catalog(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} (
+            table_name VARCHAR NOT NULL,
+            partition_column VARCHAR NOT NULL,
+            source_column VARCHAR,
+            granularity VARCHAR,
+            partition_value VARCHAR,
+            path VARCHAR,
+            row_count BIGINT,
+            created_at TIMESTAMP
+        )
+    """)
+    con.execute(f"DROP TABLE IF EXISTS {PARTITION_STATS_TABLE}")
+
+
+def partition_key_name(column, granularity):
+    return column if granularity == "value" else f"{column}_{granularity}"
+
+
+def ingest_partitioned(con, path, table_name, partition_by, granularity="value", renames=None, move_source=False):
+    """
+    Write a CSV as a hive-partitioned Parquet tree and expose it as view `table_name`.
+    Filters on the partition key read only matching partitions; the catalog records
+    the row count of every partition. With `move_source` the CSV
+    is moved into partitions/<table>/_source/ once loaded, so a folder watcher (or the
+    next auto-ingest) does not load it again as a plain table.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown partition granularity: {granularity}")
+    _ensure_catalog(con)
+
+    # partition_by names a column of the CSV; renames map CSV columns to table columns
+    renames = renames or {}
+    select = ", ".join(f'"{old}" AS "{new}"' for old, new in renames.items()) if renames else "*"
+    key = partition_key_name(renames.get(partition_by, partition_by), granularity)
+    key_expr = GRANULARITIES[granularity]
+    if key_expr:
+        key_sql = key_expr.format(col=f'"{partition_by}"')
+        select += f', {key_sql} AS "{key}"'
+
+    target = os.path.abspath(os.path.join(PARTITIONS_DIR, table_name))
+    staging = target + ".staging"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(PARTITIONS_DIR, exist_ok=True)
+
+    # 1. One pass over the CSV, written into a staging tree
+    con.execute(f"""
+        COPY (SELECT {select} FROM read_csv_auto({_sql_str(path)}))
+        TO {_sql_str(staging)} (FORMAT PARQUET, PARTITION_BY ("{key}"), OVERWRITE_OR_IGNORE)
+    """)
+
+    # 2. Swap the tree in and point the view at it
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(staging, target)
+    if move_source:
+        os.makedirs(os.path.join(target, SOURCE_DIR), exist_ok=True)
+        shutil.move(path, os.path.join(target, SOURCE_DIR, os.path.basename(path)))
+    glob = os.path.join(target, "**", "*.parquet")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW "{table_name}" AS
+        SELECT * FROM read_parquet({_sql_str(glob)}, hive_partitioning = true)
+    """)
+
+    # 3. Partition catalog: row counts in one scan
+    _record_partitions(con, table_name, key, partition_by, granularity, target, glob)
+    save_schema_version(con, table_name)
+    bump_table_version(con, table_name)
+    if SKETCH_ON_INGEST:
+        try:
+            build_table_sketches(con, table_name)
+        except Exception as e:
+            print(f"[yellow]Column sketches for '{table_name}' skipped: {e}[/yellow]")
+    n = con.execute(f"SELECT count(*) FROM {PARTITIONS_TABLE} WHERE table_name = ?", [table_name]).fetchone()[0]
+    print(f"[green]Loaded {path} into partitioned table '{table_name}' ({n} partitions by {key})[/green]")
+    return table_name
+
+
+def _record_partitions(con, table_name, key, source_column, granularity, target, glob):
+    rows = con.execute(f"""
+        SELECT CAST("{key}" AS VARCHAR), count(*)
+        FROM read_parquet({_sql_str(glob)}, hive_partitioning = true)
+        GROUP BY 1
+    """).fetchall()
+
+    con.execute(f"DELETE FROM {PARTITIONS_TABLE} WHERE table_name = ?", [table_name])
+    now = datetime.now()
+    con.executemany(
+        f"INSERT INTO {PARTITIONS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [[table_name, key, source_column, granularity, value, os.path.join(target, f"{key}={value}"), count, now]
+         for value, count in rows]
+    )
+
+
+def is_partitioned(con, table_name):
+    _ensure_catalog(con)
+    return con.execute(
+        f"SELECT count(*) FROM {PARTITIONS_TABLE} WHERE table_name = ?", [table_name]
+    ).fetchone()[0] > 0
+
+
+def list_partitions(con, table_name):
+    """(partition_value, row_count, path) for each partition of a table"""
+    _ensure_catalog(con)
+    return con.execute(f"""
+        SELECT partition_value, row_count, path FROM {PARTITIONS_TABLE}
+        WHERE table_name = ? ORDER BY partition_value
+    """, [table_name]).fetchall()
+
+
+def rename_partition_columns(con, table_name, renames):
+    """Keep catalog column names in step with a view that aliases Parquet columns"""
+    _ensure_catalog(con)
+    for old, new in renames.items():
+        con.execute(f"UPDATE {PARTITIONS_TABLE} SET partition_column = ? WHERE table_name = ? AND partition_column = ?",
+                    [new, table_name, old])
+
+
+def drop_partitioned_table(con, table_name):
+    """Drop the view, its Parquet tree and its catalog entries"""
+    _ensure_catalog(con)
+    con.execute(f'DROP VIEW IF EXISTS "{table_name}"')
+    con.execute(f"DELETE FROM {PARTITIONS_TABLE} WHERE table_name = ?", [table_name])
+    target = os.path.join(PARTITIONS_DIR, table_name)
+    if os.path.exists(target):
+        shutil.rmtree(target)
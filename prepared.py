@@ -0,0 +1,140 @@
+"""
+Prepared-statement cache for repeated queries
+Filter values in a SELECT (comparisons, IN lists, BETWEEN, LIKE, LIMIT/OFFSET) are
+lifted into parameters, so statements that differ only in those literals share one
+PREPAREd statement per connection and skip parsing, binding and planning. Statements
+are kept per connection with LRU eviction; hit rates are tracked process-wide.
+"""
+import itertools
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import duckdb
+
+STATEMENT_CACHE_SIZE = 64  # Prepared statements kept per connection
+COMPARISON_OPERATORS = ("=", "==", "<>", "!=", "<", ">", "<=", ">=")
+VALUE_KEYWORDS = ("LIKE", "ILIKE", "BETWEEN", "LIMIT", "OFFSET")
+# Literal types the template cannot take, or a lifted literal the tokenizer misplaced
+FALLBACK_ERRORS = (duckdb.ConversionException, duckdb.BinderException, duckdb.ParserException)
+# Literal texts that are safe to lift (tokens run on to the next token, comments included)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMERIC_LITERAL = re.compile(r"(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?")
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_statement_ids = itertools.count()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def statement_stats():
+    """{"hits", "misses", "evictions", "fallbacks", "uncached", "hit_rate"} since startup"""
+    with _stats_lock:
+        stats = {k: _stats[k] for k in ("hits", "misses", "evictions", "fallbacks", "uncached")}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def lift_literals(sql):
+    """
+    (template, literals): `sql` with filter-value literals replaced by $1..$n, and the
+    original literal texts. Literals elsewhere (select lists, GROUP BY 1, type
+    arguments, typed literals like DATE '...') stay in the template.
+    """
+    tokens = duckdb.tokenize(sql)
+    bounds = [p for p, _ in tokens[1:]] + [len(sql)]
+    significant = []  # Upper-cased text of previous non-comment tokens
+    literals, parts, last = [], [], 0
+    in_list = between = after_between = False
+    for (pos, kind), end in zip(tokens, bounds):
+        if kind == duckdb.token_type.comment:
+            continue
+        prev = significant[-1] if significant else ""
+        # A token's span runs to the next token, so it can carry whitespace and comments
+        text = re.split(r"\s|--|/\*", sql[pos:end], maxsplit=1)[0]
+        if kind in (duckdb.token_type.string_const, duckdb.token_type.numeric_const):
+            pattern = STRING_LITERAL if kind == duckdb.token_type.string_const else NUMERIC_LITERAL
+            m = pattern.match(sql, pos, end)
+            # E'...', $$...$$, 0x.. and the like stay in the template
+            literal = m and not re.match(r"[\w'$]", sql[m.end():m.end() + 1])
+            lift = literal and (
+                prev in COMPARISON_OPERATORS or prev in VALUE_KEYWORDS
+                or after_between or (in_list and prev in ("(", ","))
+            )
+            text = m.group() if m else text
+            if lift:
+                literals.append(text)
+                numeric_fraction = kind == duckdb.token_type.numeric_const and any(c in text for c in ".eE")
+                parts.append(sql[last:pos] + f"${len(literals)}" + ("::DOUBLE" if numeric_fraction else ""))
+                last = pos + len(text)
+        upper = text.upper()
+        after_between = False
+        if upper == "(" and prev == "IN":
+            in_list = True
+        elif upper == ")":
+            in_list = False
+        elif upper == "BETWEEN":
+            between = True
+        elif upper == "AND" and between:
+            between, after_between = False, True
+        significant.append(upper)
+    parts.append(sql[last:])
+    return "".join(parts), literals
+
+
+class StatementCache:
+    """
+    LRU of prepared statements on one connection (one user at a time). Behaves like
+    the wrapped connection, so it can be passed wherever a cursor is expected.
+    """
+
+    def __init__(self, con, capacity=STATEMENT_CACHE_SIZE):
+        self.con = con
+        self.capacity = capacity
+        self._names = OrderedDict()  # template -> prepared statement name
+
+    def _prepared(self, template):
+        name = self._names.get(template)
+        if name:
+            self._names.move_to_end(template)
+            _count("hits")
+            return name
+        _count("misses")
+        name = f"__stmt_{next(_statement_ids)}"
+        self.con.execute(f"PREPARE {name} AS {template}")
+        self._names[template] = name
+        while len(self._names) > self.capacity:
+            _, evicted = self._names.popitem(last=False)
+            self.con.execute(f"DEALLOCATE {evicted}")
+            _count("evictions")
+        return name
+
+    def execute(self, sql, params=None):
+        """Run `sql`; a single SELECT goes through a cached prepared statement. Returns the connection."""
+        if params:
+            return self.con.execute(sql, params)  # Already parameterized by the caller
+        try:
+            statements = self.con.extract_statements(sql)
+        except duckdb.Error:
+            statements = []
+        if len(statements) != 1 or statements[0].type.name != "SELECT":
+            _count("uncached")
+            return self.con.execute(sql)
+
+        template, literals = lift_literals(sql.strip().rstrip(";"))
+        try:
+            name = self._prepared(template)
+            return self.con.execute(f"EXECUTE {name}({', '.join(literals)})" if literals else f"EXECUTE {name}")
+        except FALLBACK_ERRORS:
+            # e.g. a literal that does not fit the parameter type inferred for the template
+            _count("fallbacks")
+            return self.con.execute(sql)
+
+    def __getattr__(self, name):
+        return getattr(self.con, name)
+
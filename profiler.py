@@ -0,0 +1,134 @@
+"""
+Columnar table profiler
+Per-column statistics (null fraction, distinct estimate, min/max, top-k, equi-depth
+histogram, string lengths) for every column of a table in a single aggregate scan,
+cached in _engine.column_profiles and keyed by the table fingerprint.
+"""
+import json
+import time
+from datetime import datetime
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from versioning import table_fingerprint
+
+PROFILES_TABLE = f"{INTERNAL_SCHEMA}.column_profiles"
+TOP_K = 5
+HISTOGRAM_BUCKETS = 10
+
+NUMERIC_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                 "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "DECIMAL")
+TEMPORAL_TYPES = ("DATE", "TIME", "TIMESTAMP")
+
+
+def _ensure_table(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PROFILES_TABLE} (
+            table_name VARCHAR NOT NULL,
+            column_name VARCHAR NOT NULL,
+            column_type VARCHAR,
+            fingerprint VARCHAR,
+            stats JSON,
+            profiled_at TIMESTAMP,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+
+
+def _column_kind(col_type):
+    col_type = col_type.upper()
+    if "[" in col_type:
+        return "other"  # Lists and arrays (INTEGER[], DOUBLE[3]) have no quantiles or lengths
+    if col_type.split("(")[0] in NUMERIC_TYPES:
+        return "numeric"
+    if col_type.startswith(TEMPORAL_TYPES):
+        return "temporal"
+    if col_type.startswith("VARCHAR"):
+        return "string"
+    return "other"
+
+
+def _aggregates(column, col_type):
+    """[(stat name, SQL aggregate)] for one column"""
+    c = f'"{column}"'
+    kind = _column_kind(col_type)
+    aggs = [
+        ("non_null", f"count({c})"),
+        ("distinct", f"approx_count_distinct({c})"),
+    ]
+    if kind == "other":
+        return aggs
+    aggs += [
+        ("min", f"CAST(min({c}) AS VARCHAR)"),
+        ("max", f"CAST(max({c}) AS VARCHAR)"),
+        ("top_k", f"CAST(approx_top_k({c}, {TOP_K}) AS VARCHAR[])"),
+    ]
+    if kind in ("numeric", "temporal"):
+        # Quantile edges give an equi-depth histogram without a second pass for min/max
+        edges = ", ".join(f"{i / HISTOGRAM_BUCKETS}" for i in range(HISTOGRAM_BUCKETS + 1))
+        aggs.append(("histogram", f"CAST(approx_quantile({c}, [{edges}]::FLOAT[]) AS VARCHAR[])"))
+    if kind == "numeric":
+        aggs += [("mean", f"avg({c})"), ("stddev", f"stddev_samp({c})")]
+    if kind == "string":
+        aggs += [
+            ("min_length", f"min(length({c}))"),
+            ("avg_length", f"avg(length({c}))"),
+            ("max_length", f"max(length({c}))"),
+        ]
+    return aggs
+
+
+def profile_table(con, table_name):
+    """Profile every column of a table in one scan and cache the result; returns {column: stats}"""
+    _ensure_table(con)
+    columns = con.execute(f'DESCRIBE "{table_name}"').fetchall()
+    plan = [(c[0], c[1], _aggregates(c[0], c[1])) for c in columns]
+    select = ", ".join(["count(*)"] + [sql for _, _, aggs in plan for _, sql in aggs])
+
+    t0 = time.perf_counter()
+    row = con.execute(f'SELECT {select} FROM "{table_name}"').fetchone()
+    seconds = time.perf_counter() - t0
+
+    rows, pos, profiles = row[0], 1, {}
+    for name, col_type, aggs in plan:
+        stats = {"type": col_type, "kind": _column_kind(col_type), "rows": rows}
+        for stat, _ in aggs:
+            stats[stat] = row[pos]
+            pos += 1
+        stats["null_fraction"] = (rows - stats["non_null"]) / rows if rows else 0.0
+        profiles[name] = stats
+
+    fingerprint = table_fingerprint(con, table_name)
+    now = datetime.now()
+    con.execute(f"DELETE FROM {PROFILES_TABLE} WHERE table_name = ?", [table_name])
+    con.executemany(
+        f"INSERT INTO {PROFILES_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+        [[table_name, name, s["type"], fingerprint, json.dumps({**s, "scan_seconds": seconds}, default=str), now]
+         for name, s in profiles.items()]
+    )
+    return profiles
+
+
+def cached_profiles(con, table_name=None):
+    """{table: (fingerprint, {column: stats})} for every profiled table (or one), in one query"""
+    _ensure_table(con)
+    where, params = ("WHERE table_name = ?", [table_name]) if table_name else ("", [])
+    result = {}
+    for table_name, column_name, fingerprint, stats in con.execute(
+        f"SELECT table_name, column_name, fingerprint, stats FROM {PROFILES_TABLE} {where}", params
+    ).fetchall():
+        result.setdefault(table_name, (fingerprint, {}))[1][column_name] = json.loads(stats)
+    return result
+
+
+def get_table_profile(con, table_name, compute=False):
+    """Cached profile if it matches the table's current contents; otherwise profile it when compute=True"""
+    _ensure_table(con)
+    cached = cached_profiles(con, table_name).get(table_name)
+    if cached and cached[0] == table_fingerprint(con, table_name):
+        return cached[1]
+    return profile_table(con, table_name) if compute else None
+
+
+def drop_profiles(con, table_name):
+    _ensure_table(con)
+    con.execute(f"DELETE FROM {PROFILES_TABLE} WHERE table_name = ?", [table_name])
@@ -0,0 +1,129 @@
+"""
+Arrow result path for notebook cells
+Query results go from DuckDB to a pyarrow Table without a pandas round-trip; pages
+are zero-copy slices, low-cardinality string columns are dictionary-encoded per page,
+and each page is serialized once to Arrow IPC, its size and cost reported. Large results are spilled to
+memory-mapped Arrow files so idle notebooks do not hold them in the process heap.
+"""
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import weakref
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DICTIONARY_MAX_RATIO = 0.5  # Encode a string column when distinct values <= half the page rows
+
+
+def fetch_arrow(con, query, params=None):
+    """Run a query and return its result as a pyarrow Table"""
+    result = con.execute(query, params) if params else con.execute(query)
+    if hasattr(result, "to_arrow_table"):
+        return result.to_arrow_table()
+    return result.fetch_arrow_table()
+
+
+def paginate_table(table, page_num=0, page_size=1000):
+    """Zero-copy page of an Arrow table: (page, total_rows, total_pages)"""
+    total_rows = table.num_rows
+    total_pages = (total_rows + page_size - 1) // page_size
+    return table.slice(page_num * page_size, page_size), total_rows, total_pages
+
+
+def encode_page(page):
+    """Dictionary-encode repetitive string columns; other types (nested included) pass through"""
+    if page.num_rows == 0:
+        return page
+    columns = []
+    for field, column in zip(page.schema, page.columns):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            if pc.count_distinct(column).as_py() <= page.num_rows * DICTIONARY_MAX_RATIO:
+                column = pc.dictionary_encode(column)
+        columns.append(column)
+    return pa.table(columns, names=page.column_names)
+
+
+def serialize_page(page):
+    """
+    (page, {"bytes", "ms"}): an encoded page serialized once to an Arrow IPC buffer,
+    the page read back from that buffer (zero-copy) and the buffer's size and write time
+    """
+    t0 = time.perf_counter()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, page.schema) as writer:
+        writer.write_table(page)
+    buf = sink.getvalue()
+    ms = (time.perf_counter() - t0) * 1000
+    return pa.ipc.open_stream(buf).read_all(), {"bytes": len(buf), "ms": ms}
+
+
+# --- Spill-to-disk result store ---
+SPILL_THRESHOLD_BYTES = 8 * 1024 * 1024  # Results larger than this live on disk
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ResultRef:
+    """
+    A cell result held either in memory or as a memory-mapped Arrow IPC file.
+    The file is deleted when the last reference to this object goes away
+    (cell re-run, cell or notebook deleted, cache entry evicted).
+    """
+
+    def __init__(self, table):
+        self.num_rows = table.num_rows
+        self.nbytes = table.nbytes
+        self.path = None
+        self._table = table
+
+    @property
+    def spilled(self):
+        return self.path is not None
+
+    def spill(self, directory):
+        if self.path:
+            return
+        path = os.path.join(directory, f"{uuid.uuid4().hex}.arrow")
+        table = self._table.unify_dictionaries()  # IPC files need one dictionary per column
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        self.path, self._table = path, None
+        weakref.finalize(self, _remove_file, path)
+
+    def table(self):
+        """The result as an Arrow table; spilled results are mapped from disk, not copied"""
+        if self._table is not None:
+            return self._table
+        return pa.ipc.open_file(pa.memory_map(self.path)).read_all()
+
+
+class ResultStore:
+    """Per-session spill directory; results above `threshold` bytes are written there"""
+
+    def __init__(self, threshold=SPILL_THRESHOLD_BYTES):
+        self.threshold = threshold
+        self.directory = tempfile.mkdtemp(prefix="csvsql_results_")
+        weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def wrap(self, table):
+        ref = ResultRef(table)
+        if ref.nbytes > self.threshold:
+            ref.spill(self.directory)
+        return ref
+
+    def spill(self, refs):
+        """Move results to disk regardless of size (e.g. a notebook sent to the background)"""
+        for ref in refs:
+            if isinstance(ref, ResultRef):
+                ref.spill(self.directory)
+
+    def disk_usage(self):
+        return sum(e.stat().st_size for e in os.scandir(self.directory) if e.is_file())
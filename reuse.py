@@ -0,0 +1,205 @@
+"""
+Semantic reuse of cached query results
+A new query is answered from an earlier result when it only filters, projects,
+shortens or re-aggregates it: its syntax tree is rewritten to read the cached Arrow
+table instead of the base table. Entries carry the table fingerprint they were
+computed at, so a changed table never serves stale rows.
+"""
+import copy
+import itertools
+from collections import OrderedDict
+
+import duckdb
+
+from sql_ast import (DECOMPOSABLE_AGGREGATES, aggregate_names, column_refs, conjunction, is_column, query_shape,
+                     same, to_sql, walk, with_table)
+from versioning import table_fingerprint
+
+MAX_ENTRIES = 32
+REUSE_VIEW_PREFIX = "__reuse_"
+
+_view_ids = itertools.count()
+
+
+def _table(result):
+    """pyarrow Table of a results.ResultRef or a Table"""
+    return result.table() if hasattr(result, "table") else result
+
+
+def _aggregates(shape, names):
+    """
+    [(aggregate expression, output column)] of a cached GROUP BY query whose aggregates
+    can all be combined again, or None when some output cannot be re-aggregated
+    """
+    out = []
+    for expr, name in zip(shape["node"]["select_list"], names):
+        if is_column(expr):
+            continue  # A group column (anything else would not have bound)
+        if expr.get("class") != "FUNCTION" or expr["function_name"] not in DECOMPOSABLE_AGGREGATES:
+            return None
+        if expr.get("distinct") or expr.get("filter") or expr.get("order_bys", {}).get("orders"):
+            return None  # count(DISTINCT x), FILTER and ordered aggregates do not combine
+        out.append((expr, name))
+    return out
+
+
+def _strip_alias(expr):
+    expr = copy.deepcopy(expr)
+    expr["alias"] = ""
+    return expr
+
+
+class SemanticCache:
+    """LRU of recent single-table SELECT results that later queries can be answered from"""
+
+    def __init__(self, capacity=MAX_ENTRIES):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # sql -> entry
+
+    def add(self, con, sql, result):
+        """Remember `result` (Table or ResultRef) of `sql` if later queries could be answered from it"""
+        shape = query_shape(con, sql)
+        if shape is None or shape["offset"] or shape["limit"] == -1 or shape["grouping_sets"] or shape["distinct"]:
+            return False
+        fingerprint = table_fingerprint(con, shape["table"])
+        if fingerprint.endswith(":view"):
+            return False  # A view's rows change with its sources, which the fingerprint cannot see
+        names = _table(result).column_names
+        if shape["plain"]:
+            # Cached columns must keep their table names for filters on them to resolve
+            if any(alias != column for alias, column in shape["columns"].items()):
+                return False
+            aggregates = None
+        else:
+            if shape["limit"] is not None or shape["having"] or not all(is_column(e) for e in shape["group_by"]):
+                return False
+            aggregates = _aggregates(shape, names)
+            if aggregates is None:
+                return False
+        self._entries[sql] = {"sql": sql, "shape": shape, "result": result,
+                              "aggregates": aggregates, "fingerprint": fingerprint}
+        self._entries.move_to_end(sql)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        """Forget every entry (after DML, whose effect the fingerprints may not show yet)"""
+        self._entries.clear()
+
+    def answer(self, con, sql):
+        """
+        {"table", "source", "sql"} answering `sql` from a cached result (`source` is the
+        cached query, `sql` the rewritten one), or None
+        """
+        shape = query_shape(con, sql)
+        if shape is None or not self._entries:
+            return None
+        for entry in reversed(list(self._entries.values())):
+            cached = entry["shape"]
+            if cached["table"].lower() != shape["table"].lower():
+                continue
+            view = f"{REUSE_VIEW_PREFIX}{next(_view_ids)}"
+            if cached["plain"]:
+                node = self._rewrite_filter(shape, cached, view)
+            else:
+                node = self._rewrite_aggregate(con, sql, shape, entry, view)
+            if node is None:
+                continue
+            if table_fingerprint(con, cached["table"]) != entry["fingerprint"]:
+                del self._entries[entry["sql"]]
+                continue
+            cursor = con.cursor()
+            try:
+                rewritten = to_sql(cursor, node)
+                cursor.register(view, _table(entry["result"]))
+                table = cursor.execute(rewritten).to_arrow_table()
+            except duckdb.Error:
+                continue  # A rewrite the cached columns cannot bind; the base table still can
+            finally:
+                cursor.close()
+            self._entries.move_to_end(entry["sql"])
+            self.hits += 1
+            return {"table": table, "source": entry["sql"], "sql": rewritten}
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def _extra_filters(shape, cached):
+        """Filters of `shape` beyond the cached ones, or None when a cached filter is missing from it"""
+        if not all(any(same(c, q) for q in shape["where"]) for c in cached["where"]):
+            return None
+        return [q for q in shape["where"] if not any(same(q, c) for c in cached["where"])]
+
+    def _rewrite_filter(self, shape, cached, view):
+        """The query over a cached plain SELECT: extra filters, fewer columns or a shorter LIMIT"""
+        extra = self._extra_filters(shape, cached)
+        if extra is None:
+            return None
+        if cached["limit"] is not None:
+            # Only a prefix of the same ordered rows
+            if (extra or not shape["plain"] or shape["offset"] or shape["limit"] is None
+                    or not 0 <= shape["limit"] <= cached["limit"] or not same(shape["orders"], cached["orders"])):
+                return None
+        node = copy.deepcopy(shape["node"])
+        node["where_clause"] = conjunction(extra)
+        if not cached["star"]:
+            if any(e.get("class") == "STAR" for e in node["select_list"]):
+                return None
+            own_aliases = {e["alias"].lower() for e in node["select_list"] if e.get("alias")}
+            needed = column_refs({k: v for k, v in node.items() if k != "from_table"}) - own_aliases
+            if not needed <= set(cached["columns"]):
+                return None
+        return with_table(node, view)
+
+    def _rewrite_aggregate(self, con, sql, shape, entry, view):
+        """The query as a roll-up of a cached GROUP BY: coarser groups, combined aggregates"""
+        cached = entry["shape"]
+        # Group columns the cached result actually carries, under their own names
+        groups = {e["column_names"][-1].lower() for e in cached["group_by"]} & {
+            column for alias, column in cached["columns"].items() if alias == column}
+        if (shape["grouping_sets"] or shape["distinct"] or shape["plain"]
+                or not all(is_column(e) and e["column_names"][-1].lower() in groups for e in shape["group_by"])):
+            return None
+        extra = self._extra_filters(shape, cached)
+        if extra is None or not column_refs(extra) <= groups:
+            return None
+
+        node = copy.deepcopy(shape["node"])
+        node["where_clause"] = conjunction(extra)
+        aggregates = aggregate_names(con)
+        targets = [e for part in ("select_list", "having", "modifiers") for e in walk(node.get(part))
+                   if e.get("class") == "FUNCTION" and e["function_name"] in aggregates]
+        for expr in targets:  # Aggregates cannot nest, so rewriting one never touches another
+            match = next((name for agg, name in entry["aggregates"] if same(_strip_alias(agg), _strip_alias(expr))), None)
+            if match is None:
+                return None
+            combine = {
+                "class": "FUNCTION", "type": "FUNCTION", "alias": "", "function_name": DECOMPOSABLE_AGGREGATES[expr["function_name"]],
+                "schema": "", "catalog": "", "children": [{"class": "COLUMN_REF", "type": "COLUMN_REF", "alias": "", "column_names": [match]}],
+                "filter": None, "order_bys": {"type": "ORDER_MODIFIER", "orders": []}, "distinct": False,
+                "is_operator": False, "export_state": False,
+            }
+            if expr["function_name"] in ("count", "count_star"):
+                combine = {"class": "CAST", "type": "OPERATOR_CAST", "alias": "", "child": combine,
+                           "cast_type": {"id": "BIGINT", "type_info": None}, "try_cast": False}
+            combine["alias"] = expr["alias"]
+            expr.clear()
+            expr.update(combine)
+
+        available = groups | {name.lower() for _, name in entry["aggregates"]}
+        own_aliases = {e["alias"].lower() for e in node["select_list"] if e.get("alias")}
+        if not column_refs({k: v for k, v in node.items() if k != "from_table"}) - own_aliases <= available:
+            return None
+        # Unaliased outputs keep the names the original query would have produced
+        cursor = con.cursor()
+        try:
+            names = [d[0] for d in cursor.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT 0").description]
+        finally:
+            cursor.close()
+        for expr, name in zip(node["select_list"], names):
+            expr["alias"] = name
+        return with_table(node, view)
+
@@ -0,0 +1,306 @@
+"""
+Precomputed rollup cubes
+A cube declares grouping dimensions and sum/count/min/max measures over one table.
+It is built at ingest and merged incrementally when files are appended. A GROUP BY
+query over its dimensions, with filters on them too, is rewritten to re-aggregate
+the cube instead of scanning the raw rows.
+"""
+import copy
+from datetime import datetime
+
+from sql_ast import aggregate_names, parse_expression, query_shape, replace_tables, strip_locations, to_sql, walk
+from utils import INTERNAL_SCHEMA, ensure_internal_schema, validate_table_name
+from versioning import table_fingerprint
+
+# Cubes per source table.
+#   dimensions - output column -> SQL expression over the source's columns
+#   measures   - output column -> sum(...) / count(...) / count(*) / min(...) / max(...)
+ROLLUP_CUBES = {
+    "sales_daily": {
+        "source": "sales",
+        "dimensions": {"day": "date_trunc('day', \"timestamp\")"},
+        "measures": {"total": "sum(amount)", "orders": "count(*)"},
+    },
+}
+
+CUBE_STATE_TABLE = f"{INTERNAL_SCHEMA}.cube_state"
+MEASURE_FUNCTIONS = ("sum", "count", "count_star", "min", "max")
+_COMBINE = {"sum": "sum({})", "count": "CAST(sum({}) AS BIGINT)", "count_star": "CAST(sum({}) AS BIGINT)",
+            "min": "min({})", "max": "max({})"}
+
+
+def cube_table_name(cube):
+    return f'{INTERNAL_SCHEMA}."cube_{cube}"'
+
+
+def declare_cube(cube, source, dimensions, measures):
+    """Register a cube, e.g. declare_cube("sales_by_region", "sales", {"region": "region"}, {"total": "sum(amount)"})"""
+    if not validate_table_name(cube):
+        raise ValueError(f"Invalid cube name: {cube}")
+    for column, measure in measures.items():
+        name = measure.split("(", 1)[0].strip().lower()
+        if name not in MEASURE_FUNCTIONS or "distinct" in measure.lower():
+            raise ValueError(f"Measure {column} = {measure} cannot be re-aggregated (use sum/count/min/max)")
+    ROLLUP_CUBES[cube] = {"source": source, "dimensions": dict(dimensions), "measures": dict(measures)}
+
+
+def _ensure_state_table(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CUBE_STATE_TABLE} (
+            cube VARCHAR PRIMARY KEY,
+            source VARCHAR,
+            fingerprint VARCHAR,
+            row_count BIGINT,
+            built_at TIMESTAMP
+        )
+    """)
+
+
+def _cube_select(cfg, relation):
+    columns = [f'{expr} AS "{name}"' for name, expr in cfg["dimensions"].items()]
+    columns += [f'{expr} AS "{name}"' for name, expr in cfg["measures"].items()]
+    return f"SELECT {', '.join(columns)} FROM {relation} GROUP BY ALL"
+
+
+def _record(con, cube, cfg):
+    rows = con.execute(f"SELECT count(*) FROM {cube_table_name(cube)}").fetchone()[0]
+    con.execute(
+        f"INSERT OR REPLACE INTO {CUBE_STATE_TABLE} VALUES (?, ?, ?, ?, ?)",
+        [cube, cfg["source"], table_fingerprint(con, cfg["source"]), rows, datetime.now()]
+    )
+    return rows
+
+
+def build_cube(con, cube):
+    """(Re)build a cube from its whole source table; returns its row count"""
+    cfg = ROLLUP_CUBES[cube]
+    _ensure_state_table(con)
+    con.begin()
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE {cube_table_name(cube)} AS {_cube_select(cfg, _quote(cfg['source']))}")
+        rows = _record(con, cube, cfg)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return rows
+
+
+def merge_cube(con, cube, delta_relation):
+    """
+    Fold rows appended to the source (given as a relation, e.g. read_csv_auto(...)) into
+    a cube: the delta is aggregated on its own and re-combined with the touched groups
+    """
+    cfg = ROLLUP_CUBES[cube]
+    _ensure_state_table(con)
+    cube_table = cube_table_name(cube)
+    exists = con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?", [INTERNAL_SCHEMA, f"cube_{cube}"]
+    ).fetchone()[0]
+    if not exists:
+        return build_cube(con, cube)
+
+    dims = ", ".join(f'"{d}"' for d in cfg["dimensions"])
+    match = " AND ".join(f'{cube_table}."{d}" IS NOT DISTINCT FROM __cube_delta."{d}"' for d in cfg["dimensions"])
+    measures = ", ".join(
+        _COMBINE[parse_expression(con, expr)["function_name"]].format(f'"{name}"') + f' AS "{name}"'
+        for name, expr in cfg["measures"].items()
+    )
+    con.begin()
+    try:
+        con.execute(f"CREATE OR REPLACE TEMP TABLE __cube_delta AS {_cube_select(cfg, delta_relation)}")
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE __cube_merged AS
+            SELECT {dims}, {measures} FROM (
+                SELECT * FROM {cube_table} WHERE EXISTS (SELECT 1 FROM __cube_delta WHERE {match})
+                UNION ALL BY NAME
+                SELECT * FROM __cube_delta
+            ) GROUP BY {dims}
+        """)
+        con.execute(f"DELETE FROM {cube_table} USING __cube_delta WHERE {match}")
+        con.execute(f"INSERT INTO {cube_table} BY NAME SELECT * FROM __cube_merged")
+        con.execute("DROP TABLE IF EXISTS __cube_merged")
+        con.execute("DROP TABLE IF EXISTS __cube_delta")
+        rows = _record(con, cube, cfg)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return rows
+
+
+def refresh_cubes(con, source, delta_relation=None):
+    """Build (or with `delta_relation`, merge into) every cube over `source`; returns the cubes refreshed"""
+    refreshed = []
+    for cube, cfg in ROLLUP_CUBES.items():
+        if cfg["source"].lower() != source.lower():
+            continue
+        if delta_relation:
+            merge_cube(con, cube, delta_relation)
+        else:
+            build_cube(con, cube)
+        refreshed.append(cube)
+    return refreshed
+
+
+def drop_cubes(con, source):
+    _ensure_state_table(con)
+    for cube, cfg in ROLLUP_CUBES.items():
+        if cfg["source"].lower() == source.lower():
+            con.execute(f"DROP TABLE IF EXISTS {cube_table_name(cube)}")
+            con.execute(f"DELETE FROM {CUBE_STATE_TABLE} WHERE cube = ?", [cube])
+
+
+def cube_status(con):
+    """[(cube, source, row_count, built_at, fresh)] for every declared cube"""
+    _ensure_state_table(con)
+    state = {r[0]: r[1:] for r in con.execute(
+        f"SELECT cube, fingerprint, row_count, built_at FROM {CUBE_STATE_TABLE}"
+    ).fetchall()}
+    out = []
+    for cube, cfg in ROLLUP_CUBES.items():
+        fingerprint, rows, built_at = state.get(cube, (None, None, None))
+        fresh = fingerprint is not None and _source_fingerprint(con, cfg["source"]) == fingerprint
+        out.append((cube, cfg["source"], rows, built_at, fresh))
+    return out
+
+
+def _source_fingerprint(con, source):
+    try:
+        return table_fingerprint(con, source)
+    except Exception:
+        return None  # Source not loaded
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# --- Query routing ---
+def _normalized(expr):
+    """Expression without positions or alias, column references reduced to their lower-cased name"""
+    expr = strip_locations(expr)
+    for e in walk(expr):
+        if e.get("class") == "COLUMN_REF":
+            e["column_names"] = [e["column_names"][-1].lower()]
+    if isinstance(expr, dict):
+        expr["alias"] = ""
+    return expr
+
+
+def _substitute(tree, dimensions, skip, substituted):
+    """
+    Copy of `tree` with every subexpression equal to a dimension replaced by that
+    dimension's column; the ids of the new column references are added to `substituted`
+    """
+    if isinstance(tree, list):
+        return [_substitute(v, dimensions, skip, substituted) for v in tree]
+    if not isinstance(tree, dict) or id(tree) in skip:
+        return tree
+    if "class" in tree:
+        key = _normalized(tree)
+        for name, dim in dimensions:
+            if key == dim:
+                ref = {"class": "COLUMN_REF", "type": "COLUMN_REF", "alias": tree.get("alias", ""), "column_names": [name]}
+                substituted.add(id(ref))
+                return ref
+    return {k: _substitute(v, dimensions, skip, substituted) for k, v in tree.items()}
+
+
+def _outside(tree, skip):
+    """Expression dicts of a tree, not descending into the ids in `skip`"""
+    if isinstance(tree, dict):
+        if id(tree) in skip:
+            return
+        yield tree
+        for value in tree.values():
+            yield from _outside(value, skip)
+    elif isinstance(tree, list):
+        for value in tree:
+            yield from _outside(value, skip)
+
+
+def _rewrite(con, sql, shape, cube, cfg):
+    dimensions = [(name.lower(), _normalized(parse_expression(con, expr))) for name, expr in cfg["dimensions"].items()]
+    measures = [(name, _normalized(parse_expression(con, expr))) for name, expr in cfg["measures"].items()]
+    node = copy.deepcopy(shape["node"])
+    parts = ("select_list", "where_clause", "group_expressions", "having", "qualify", "modifiers")
+
+    # Aggregates become combines of the matching measure (avg from a sum and a count)
+    aggregates = aggregate_names(con)
+    replaced = set()
+    for expr in [e for part in parts for e in walk(node.get(part))
+                 if e.get("class") == "FUNCTION" and e["function_name"] in aggregates]:
+        key = _normalized(expr)
+        match = next((name for name, m in measures if m == key), None)
+        if match is not None:
+            text = _COMBINE[key["function_name"]].format(_quote(match))
+        elif key["function_name"] == "avg" and not key["distinct"]:
+            total = next((n for n, m in measures if m["function_name"] == "sum" and m["children"] == key["children"]), None)
+            count = next((n for n, m in measures if m["function_name"] == "count" and m["children"] == key["children"]), None)
+            if total is None or count is None:
+                return None
+            text = f"CAST(sum({_quote(total)}) AS DOUBLE) / sum({_quote(count)})"
+        else:
+            return None
+        combine = parse_expression(con, text)
+        combine["alias"] = expr["alias"]
+        expr.clear()
+        expr.update(combine)
+        replaced.add(id(expr))
+    if not node["group_expressions"] and not replaced:
+        return None  # Row-level queries need the raw rows
+
+    substituted = set()
+    for part in parts:
+        node[part] = _substitute(node.get(part), dimensions, replaced, substituted)
+
+    # Whatever is left may only use dimensions: any other reference is either a source
+    # column (possibly one named like a dimension) or an output alias of the query itself
+    own_aliases = {e["alias"].lower() for e in node["select_list"] if e.get("alias")}
+    source_columns = {r[0].lower() for r in con.execute(
+        "SELECT column_name FROM duckdb_columns() WHERE schema_name = 'main' AND lower(table_name) = lower(?)",
+        [shape["table"]]
+    ).fetchall()}
+    for e in (e for part in parts for e in _outside(node.get(part), replaced)):
+        if e.get("class") == "COLUMN_REF" and id(e) not in substituted:
+            name = e["column_names"][-1].lower()
+            if name in source_columns or name not in own_aliases:
+                return None
+    for group in node["group_expressions"]:
+        if group.get("class") not in ("COLUMN_REF", "CONSTANT"):
+            return None
+
+    # Unaliased outputs keep the names the original query would have produced
+    cursor = con.cursor()
+    try:
+        names = [d[0] for d in cursor.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT 0").description]
+    finally:
+        cursor.close()
+    for expr, name in zip(node["select_list"], names):
+        expr["alias"] = name
+    return to_sql(con, replace_tables(node, {shape["table"].lower(): (INTERNAL_SCHEMA, f"cube_{cube}")}))
+
+
+def route_to_cube(con, sql):
+    """
+    {"sql", "cube"}: `sql` rewritten to read a fresh cube when it is a GROUP BY over the
+    cube's dimensions with measures the cube keeps; None otherwise
+    """
+    if not ROLLUP_CUBES:
+        return None
+    shape = query_shape(con, sql)
+    if shape is None or shape["plain"] or shape["grouping_sets"] or shape["distinct"]:
+        return None
+    for cube, fresh in ((s[0], s[4]) for s in cube_status(con)):
+        cfg = ROLLUP_CUBES[cube]
+        if not fresh or cfg["source"].lower() != shape["table"].lower():
+            continue
+        try:
+            rewritten = _rewrite(con, sql, shape, cube, cfg)
+        except Exception:
+            continue  # A declaration that does not parse cannot serve queries
+        if rewritten:
+            return {"sql": rewritten, "cube": cube}
+    return None
@@ -0,0 +1,259 @@
+"""
+Persisted table samples for preview runs
+Large tables get a small sample at ingest: stratified on a low-cardinality text
+column when there is one (so rare groups still show up), else a reservoir sample.
+A preview run reads the samples instead of the base tables, and filtered row counts
+are scaled back up with a stratified estimator and its 95% confidence interval.
+"""
+import math
+from datetime import datetime
+
+from ddl import atomic
+from sql_ast import aggregate_names, has_aggregate, parse_query, query_shape, replace_tables, table_refs, to_sql
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from versioning import table_fingerprint
+
+SAMPLE_ON_INGEST = True
+SAMPLE_MIN_ROWS = 200_000  # Smaller tables scan fast enough to preview on the real data
+SAMPLE_ROWS = 100_000  # Target sample size per table
+MAX_STRATA = 64
+MIN_PER_STRATUM = 500  # Rows kept from every stratum, however small its share
+STRATA_TYPES = ("VARCHAR", "BOOLEAN")
+SAMPLE_PREFIX = "sample__"
+SAMPLES_TABLE = f"{INTERNAL_SCHEMA}.table_samples"
+STRATA_TABLE = f"{INTERNAL_SCHEMA}.sample_strata"
+Z_95 = 1.96
+
+
+def _ensure_tables(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SAMPLES_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            sample_table VARCHAR,
+            method VARCHAR,
+            strata_column VARCHAR,
+            population BIGINT,
+            sample_rows BIGINT,
+            fingerprint VARCHAR,
+            built_at TIMESTAMP
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STRATA_TABLE} (
+            table_name VARCHAR NOT NULL,
+            stratum VARCHAR,
+            population BIGINT,
+            sampled BIGINT
+        )
+    """)
+
+
+def _table_name(con, name):
+    """Stored name of a main-schema base table (case-insensitive lookup), or None"""
+    row = con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' AND lower(table_name) = lower(?)", [name]
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _strata_column(con, table_name):
+    """Text/boolean column with the most distinct values up to MAX_STRATA, or None"""
+    candidates = [
+        r[0] for r in con.execute(
+            "SELECT column_name FROM duckdb_columns() WHERE schema_name = 'main' AND table_name = ? AND data_type IN "
+            f"({', '.join('?' for _ in STRATA_TYPES)})", [table_name, *STRATA_TYPES]
+        ).fetchall()
+    ]
+    if not candidates:
+        return None
+    distinct = con.execute(
+        f"SELECT {', '.join(f'approx_count_distinct({_quote(c)})' for c in candidates)} FROM {_quote(table_name)}"
+    ).fetchone()
+    usable = [(d, c) for c, d in zip(candidates, distinct) if 2 <= d <= MAX_STRATA]
+    return max(usable)[1] if usable else None
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def drop_table_sample(con, table_name):
+    _ensure_tables(con)
+    con.execute(f"DROP TABLE IF EXISTS {INTERNAL_SCHEMA}.{_quote(SAMPLE_PREFIX + table_name)}")
+    con.execute(f"DELETE FROM {SAMPLES_TABLE} WHERE table_name = ?", [table_name])
+    con.execute(f"DELETE FROM {STRATA_TABLE} WHERE table_name = ?", [table_name])
+
+
+def build_table_sample(con, table_name):
+    """(Re)build the sample of a table; returns its sample_info, or None for a table too small to sample"""
+    _ensure_tables(con)
+    population = con.execute(f"SELECT count(*) FROM {_quote(table_name)}").fetchone()[0]
+    if population < SAMPLE_MIN_ROWS:
+        drop_table_sample(con, table_name)
+        return None
+    sample = f"{INTERNAL_SCHEMA}.{_quote(SAMPLE_PREFIX + table_name)}"
+    column = _strata_column(con, table_name)
+    with atomic(con):
+        drop_table_sample(con, table_name)
+        if column is None:
+            con.execute(
+                f"CREATE TABLE {sample} AS SELECT * FROM {_quote(table_name)} USING SAMPLE reservoir({SAMPLE_ROWS} ROWS)"
+            )
+            strata = [(None, population, con.execute(f"SELECT count(*) FROM {sample}").fetchone()[0])]
+        else:
+            counts = con.execute(
+                f"SELECT CAST({_quote(column)} AS VARCHAR), count(*) FROM {_quote(table_name)} GROUP BY 1"
+            ).fetchall()
+            keys = [k for k, _ in counts]
+            rates = [_rate(n, population) for _, n in counts]
+            # Bernoulli sampling per stratum: one streaming pass, no sort of the full table.
+            # The rate is looked up per row; a joined rate table would get random() pushed into it.
+            con.execute(f"""
+                CREATE TABLE {sample} AS SELECT * FROM {_quote(table_name)}
+                WHERE random() < list_extract(?::DOUBLE[], list_position(?::VARCHAR[], CAST({_quote(column)} AS VARCHAR)))
+            """, [rates, keys])
+            sampled = dict(con.execute(
+                f"SELECT CAST({_quote(column)} AS VARCHAR), count(*) FROM {sample} GROUP BY 1"
+            ).fetchall())
+            strata = [(k, n, sampled.get(k, 0)) for k, n in counts]
+        con.executemany(f"INSERT INTO {STRATA_TABLE} VALUES (?, ?, ?, ?)", [[table_name, *s] for s in strata])
+        con.execute(
+            f"INSERT INTO {SAMPLES_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [table_name, SAMPLE_PREFIX + table_name, "reservoir" if column is None else "stratified", column,
+             population, sum(s[2] for s in strata), table_fingerprint(con, table_name), datetime.now()]
+        )
+    return sample_info(con, table_name)
+
+
+def _columns(con, relation):
+    return [(r[0], r[1]) for r in con.execute(f"DESCRIBE {relation}").fetchall()]
+
+
+def _rate(n, population):
+    """Bernoulli rate for a stratum of n rows: its share of SAMPLE_ROWS, at least MIN_PER_STRATUM rows"""
+    return min(1.0, max(MIN_PER_STRATUM, SAMPLE_ROWS * n / population) / n)
+
+
+def merge_table_sample(con, table_name, delta_relation):
+    """
+    Fold rows appended to a table (given as a relation, e.g. read_csv_auto(...)) into its
+    sample at each stratum's current rate, scanning only the delta. A sample whose
+    columns no longer match the table is dropped and rebuilt on its next use.
+    """
+    info = sample_info(con, table_name)
+    if info is None:
+        return build_table_sample(con, table_name)  # Small tables only count; large ones get their first sample
+    sample = f"{INTERNAL_SCHEMA}.{_quote(info['sample_table'])}"
+    if _columns(con, sample) != _columns(con, _quote(table_name)):
+        drop_table_sample(con, table_name)  # Columns added or widened by the append
+        return None
+
+    column = info["strata_column"]
+    stratum = f"CAST({_quote(column)} AS VARCHAR)" if column else "NULL"
+    counts = con.execute(f"SELECT {stratum}, count(*) FROM {delta_relation} GROUP BY 1").fetchall()
+    population = info["population"] + sum(n for _, n in counts)
+    keys = [k for k, _ in counts]
+    rates = []
+    for key, n in counts:
+        old_population, old_sampled = info["strata"].get(key, (0, 0))
+        rates.append(old_sampled / old_population if old_sampled else _rate(n, population))
+    with atomic(con):
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE __sample_delta AS SELECT * FROM {delta_relation}
+            WHERE random() < list_extract(?::DOUBLE[], list_position(?::VARCHAR[], {stratum}))
+        """, [rates, keys])
+        sampled = dict(con.execute(f"SELECT {stratum}, count(*) FROM __sample_delta GROUP BY 1").fetchall())
+        con.execute(f"INSERT INTO {sample} BY NAME SELECT * FROM __sample_delta")
+        con.execute("DROP TABLE IF EXISTS __sample_delta")
+        for key, n in counts:
+            old_population, old_sampled = info["strata"].get(key, (0, 0))
+            con.execute(f"DELETE FROM {STRATA_TABLE} WHERE table_name = ? AND stratum IS NOT DISTINCT FROM ?", [table_name, key])
+            con.execute(f"INSERT INTO {STRATA_TABLE} VALUES (?, ?, ?, ?)",
+                        [table_name, key, old_population + n, old_sampled + sampled.get(key, 0)])
+        con.execute(
+            f"UPDATE {SAMPLES_TABLE} SET population = ?, sample_rows = ?, fingerprint = ?, built_at = ? WHERE table_name = ?",
+            [population, info["sample_rows"] + sum(sampled.values()), table_fingerprint(con, table_name),
+             datetime.now(), table_name]
+        )
+    return sample_info(con, table_name)
+
+
+def sample_info(con, table_name):
+    """{"sample_table", "method", "strata_column", "population", "sample_rows", "fingerprint", "strata"} or None"""
+    _ensure_tables(con)
+    row = con.execute(
+        f"SELECT sample_table, method, strata_column, population, sample_rows, fingerprint FROM {SAMPLES_TABLE} "
+        "WHERE table_name = ?", [table_name]
+    ).fetchone()
+    if row is None:
+        return None
+    strata = con.execute(
+        f"SELECT stratum, population, sampled FROM {STRATA_TABLE} WHERE table_name = ?", [table_name]
+    ).fetchall()
+    keys = ("sample_table", "method", "strata_column", "population", "sample_rows", "fingerprint")
+    return {**dict(zip(keys, row)), "strata": {s: (n, k) for s, n, k in strata}}
+
+
+def ensure_table_sample(con, table_name):
+    """Sample of a table, rebuilt if it predates the table's last write (None when the table is small)"""
+    info = sample_info(con, table_name)
+    if info and info["fingerprint"] == table_fingerprint(con, table_name):
+        return info
+    return build_table_sample(con, table_name)
+
+
+def preview_sql(con, sql):
+    """
+    {"sql", "samples": {table: sample_info}}: `sql` rewritten to read table samples,
+    or None when it reads no sampled table (or is not a single SELECT)
+    """
+    node = parse_query(con, sql)
+    if node is None:
+        return None
+    samples = {}
+    for ref in table_refs(node):
+        name = _table_name(con, ref)
+        info = ensure_table_sample(con, name) if name else None
+        if info:
+            samples[ref] = info
+    if not samples:
+        return None
+    mapping = {ref: (INTERNAL_SCHEMA, info["sample_table"]) for ref, info in samples.items()}
+    return {"sql": to_sql(con, replace_tables(node, mapping)), "samples": samples}
+
+
+def estimate_rows(con, sql, preview):
+    """
+    {"rows", "low", "high"}: estimated full-data row count of a filtering query over one
+    sampled table, with a 95% interval; None for joins and aggregates, whose sample
+    results do not scale by row weight
+    """
+    shape = query_shape(con, sql)
+    if shape is None or shape["group_by"] or shape["distinct"] or shape["limit"] == -1:
+        return None
+    info = preview["samples"].get(shape["table"].lower())
+    if info is None or has_aggregate(shape["node"]["select_list"], aggregate_names(con)):
+        return None
+
+    node = dict(shape["node"], modifiers=[])
+    node["select_list"] = [{"class": "STAR", "type": "STAR", "alias": "", "relation_name": "", "exclude_list": [],
+                            "replace_list": [], "columns": False, "expr": None}]
+    matching = to_sql(con, replace_tables(node, {shape["table"].lower(): (INTERNAL_SCHEMA, info["sample_table"])}))
+    stratum = f"CAST({_quote(info['strata_column'])} AS VARCHAR)" if info["strata_column"] else "NULL"
+    hits = dict(con.execute(f"SELECT {stratum}, count(*) FROM ({matching}) GROUP BY 1").fetchall())
+
+    # Stratified estimator: each stratum's match rate scaled to its population
+    total = variance = 0.0
+    for key, (population, sampled) in info["strata"].items():
+        if not sampled:
+            continue
+        p = hits.get(key, 0) / sampled
+        total += population * p
+        if sampled > 1:
+            variance += population ** 2 * (1 - sampled / population) * p * (1 - p) / (sampled - 1)
+    margin = Z_95 * math.sqrt(variance)
+    low, high = max(0, total - margin), total + margin
+    if shape["limit"] is not None:
+        total, low, high = (min(v, shape["limit"]) for v in (total, low, high))
+    return {"rows": round(total), "low": round(low), "high": round(high)}
@@ -0,0 +1,138 @@
+"""
+Notebook cell execution scheduler
+Edits are debounced, a newer version of a cell cancels the run still in flight for
+it (interrupting the session cursor while that run holds it), and drafts that fail a
+cheap parse/bind check are never started, so full scans only run for complete, valid SQL.
+Cells of a session run one at a time on one cursor that lives as long as the session,
+so TEMP tables and SET VARIABLE carry over from cell to cell.
+"""
+import threading
+import time
+
+import duckdb
+
+from prepared import StatementCache
+
+DEBOUNCE_SECONDS = 0.75
+BIND_CHECKED_TYPES = ("SELECT",)  # EXPLAIN binds these without reading any data
+
+
+def check_sql(con, sql, bind=True):
+    """None when `sql` parses (and with `bind`, a single query binds), else the error message"""
+    try:
+        statements = con.extract_statements(sql)
+        if not statements:
+            return "Empty statement"
+        if bind and len(statements) == 1 and statements[0].type.name in BIND_CHECKED_TYPES:
+            con.execute(f"EXPLAIN {sql.strip().rstrip(';')}")
+    except duckdb.Error as e:
+        return str(e)
+    return None
+
+
+class CellRun:
+    """One submitted version of a cell: pending -> running -> done | error | cancelled"""
+
+    def __init__(self, version, sql):
+        self.version = version
+        self.sql = sql
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = threading.Event()
+        self._cancelled = threading.Event()
+        self._cursor = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        cursor = self._cursor
+        if cursor is not None:
+            try:
+                cursor.interrupt()
+            except Exception:
+                pass
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+class CellScheduler:
+    """Runs a session's cell queries serially on its own cursor, at most one live version per cell"""
+
+    def __init__(self, con, debounce=DEBOUNCE_SECONDS):
+        self.con = con
+        self.debounce = debounce
+        self.cursor = StatementCache(con.cursor())  # Repeated SELECTs reuse their prepared statements
+        self._runs = {}
+        self._lock = threading.Lock()
+        self._session_lock = threading.Lock()  # Held by the run using the cursor
+
+    def submit(self, cell_key, sql, fn, debounce=None, force=False):
+        """
+        Schedule fn(cursor, sql) for a cell after the debounce delay. A pending or
+        running version with the same SQL is reused unless `force`; any other
+        unfinished version is cancelled.
+        """
+        with self._lock:
+            previous = self._runs.get(cell_key)
+            if previous and not previous.finished.is_set():
+                if previous.sql == sql and not previous.cancelled and not force:
+                    return previous
+                previous.cancel()
+            run = CellRun(previous.version + 1 if previous else 1, sql)
+            self._runs[cell_key] = run
+        delay = self.debounce if debounce is None else debounce
+        threading.Thread(target=self._execute, args=(run, fn, delay), name=f"cell-{cell_key}", daemon=True).start()
+        return run
+
+    def _execute(self, run, fn, delay):
+        # A newer version arriving during the debounce window supersedes this one
+        if delay and run._cancelled.wait(delay):
+            run.status = "cancelled"
+            run.finished.set()
+            return
+        with self._session_lock:
+            run._cursor = self.cursor
+            try:
+                if run.cancelled:
+                    run.status = "cancelled"
+                    return
+                run.status, run.started = "running", time.time()
+                run.result = fn(self.cursor, run.sql)
+                run.status = "done"
+            except Exception as e:
+                run.error = e
+                run.status = "cancelled" if run.cancelled else "error"
+            finally:
+                run._cursor = None
+                run.finished.set()
+
+    def check(self, sql):
+        """
+        check_sql() on the session cursor, so the session's TEMP tables bind; while a run
+        holds the cursor, only parsing is checked (on the shared connection)
+        """
+        if not self._session_lock.acquire(blocking=False):
+            return check_sql(self.con, sql, bind=False)
+        try:
+            return check_sql(self.cursor, sql)
+        finally:
+            self._session_lock.release()
+
+    def current(self, cell_key):
+        return self._runs.get(cell_key)
+
+    def cancel(self, cell_key):
+        with self._lock:
+            run = self._runs.pop(cell_key, None)
+        if run:
+            run.cancel()
+
+    def cancel_all(self):
+        for cell_key in list(self._runs):
+            self.cancel(cell_key)
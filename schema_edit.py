@@ -0,0 +1,137 @@
+"""
+Table Manager schema edits without rewriting the table
+Drops, renames and retypes are applied as ALTER TABLE statements (catalog-only for
+renames/drops; a retype rewrites just that column). Only a column reorder needs a
+table rewrite. Partitioned tables (views over Parquet) are edited by redefining the
+view with aliases and casts, so nothing on disk is touched and casts run at query time.
+"""
+import re
+from ddl import table_indexes, create_indexes
+from partitioning import is_partitioned, rename_partition_columns
+from versioning import save_schema_version, bump_table_version
+
+
+class LossyRetype(ValueError):
+    """A retype would turn values that do not convert into NULL"""
+
+
+def plan_schema_edit(current, updates):
+    """
+    Operations turning `current` [(column, type)] into `updates`
+    [{"old", "new", "type"}] (in the desired order; columns left out are dropped).
+    """
+    current_types = dict(current)
+    kept = {u["old"] for u in updates}
+    plan = {
+        "drop": [c for c, _ in current if c not in kept],
+        "rename": [(u["old"], u["new"]) for u in updates if u["new"] != u["old"]],
+        "retype": [(u["new"], u["type"]) for u in updates
+                   if u.get("type") and u["type"].upper() != current_types[u["old"]].upper()],
+    }
+    natural = [c for c, _ in current if c in kept]
+    plan["reorder"] = natural != [u["old"] for u in updates]
+    return plan
+
+
+def describe_plan(plan):
+    """Human-readable summary, e.g. for a confirmation line in the UI"""
+    parts = []
+    if plan["rename"]:
+        parts.append(f"rename {len(plan['rename'])}")
+    if plan["drop"]:
+        parts.append(f"drop {len(plan['drop'])}")
+    if plan["retype"]:
+        parts.append(f"retype {len(plan['retype'])}")
+    if plan["reorder"]:
+        parts.append("reorder (full rewrite)")
+    return ", ".join(parts) or "no changes"
+
+
+def _view_body(con, view_name):
+    sql = con.execute("SELECT sql FROM duckdb_views() WHERE view_name = ?", [view_name]).fetchone()[0]
+    match = re.match(r'^CREATE (?:OR REPLACE )?VIEW\s+(?:"(?:[^"]|"")*"|\S+)\s+AS\s+(.*?);?\s*$', sql, re.S | re.I)
+    if not match:
+        raise ValueError(f"Cannot parse definition of view {view_name}")
+    return match.group(1)
+
+
+def _apply_to_view(con, table_name, updates, plan):
+    """Redefine a view with aliases and lazy casts on top of its current definition"""
+    casts = dict(plan["retype"])
+    exprs = []
+    for u in updates:
+        expr = f'"{u["old"]}"'
+        if u["new"] in casts:
+            expr = f"TRY_CAST({expr} AS {casts[u['new']]})"
+        exprs.append(f'{expr} AS "{u["new"]}"')
+    body = _view_body(con, table_name)
+    con.execute(f'CREATE OR REPLACE VIEW "{table_name}" AS SELECT {", ".join(exprs)} FROM ({body})')
+    rename_partition_columns(con, table_name, dict(plan["rename"]))
+
+
+def _apply_to_table(con, table_name, current, updates, plan, allow_nulls=False):
+    for col in plan["drop"]:
+        con.execute(f'ALTER TABLE "{table_name}" DROP COLUMN "{col}"')
+
+    # Two phases so swaps (a -> b, b -> a) never collide with a live name
+    remaining = {c for c, _ in current} - set(plan["drop"])
+    staged = {}
+    for i, (old, new) in enumerate(plan["rename"]):
+        if new in remaining:
+            staged[old] = f"__rename_{i}"
+            con.execute(f'ALTER TABLE "{table_name}" RENAME COLUMN "{old}" TO "{staged[old]}"')
+    for old, new in plan["rename"]:
+        con.execute(f'ALTER TABLE "{table_name}" RENAME COLUMN "{staged.get(old, old)}" TO "{new}"')
+
+    for col, col_type in plan["retype"]:
+        # Values that do not convert fail the edit (rolled back) unless NULLs were allowed.
+        # The ALTER itself keeps TRY_CAST: DuckDB also casts rows deleted since the last
+        # checkpoint, which must not fail the edit.
+        lossy = con.execute(
+            f'SELECT count(*) FROM "{table_name}" WHERE "{col}" IS NOT NULL AND TRY_CAST("{col}" AS {col_type}) IS NULL'
+        ).fetchone()[0]
+        if lossy and not allow_nulls:
+            raise LossyRetype(f"{lossy:,} values of {col} cannot be converted to {col_type} and would become NULL; nothing was changed")
+        con.execute(f'ALTER TABLE "{table_name}" ALTER COLUMN "{col}" TYPE {col_type} USING TRY_CAST("{col}" AS {col_type})')
+
+    if plan["reorder"]:
+        order = ", ".join(f'"{u["new"]}"' for u in updates)
+        con.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT {order} FROM "{table_name}"')
+
+
+def apply_schema_edit(con, table_name, updates, allow_nulls=False):
+    """
+    Apply Table Manager edits in one transaction; returns the executed plan.
+    `updates` is [{"old", "new", "type"}] in the desired column order. A retype that
+    would turn values into NULL raises LossyRetype unless `allow_nulls`.
+    """
+    current = [(c[0], c[1]) for c in con.execute(f'DESCRIBE "{table_name}"').fetchall()]
+    plan = plan_schema_edit(current, updates)
+    if not (plan["drop"] or plan["rename"] or plan["retype"] or plan["reorder"]):
+        return plan
+    if len({u["new"] for u in updates}) != len(updates):
+        raise ValueError("Column names must be unique")
+
+    # Indexes block ALTER on the columns they cover, and DuckDB still sees an index dropped
+    # inside the same transaction, so they are dropped before it and recreated after
+    partitioned = is_partitioned(con, table_name)
+    indexes = [] if partitioned else table_indexes(con, table_name)
+    for name, _, _ in indexes:
+        con.execute(f'DROP INDEX "{name}"')
+
+    con.begin()
+    try:
+        if partitioned:
+            _apply_to_view(con, table_name, updates, plan)
+        else:
+            _apply_to_table(con, table_name, current, updates, plan, allow_nulls)
+        con.commit()
+    except Exception:
+        con.rollback()
+        create_indexes(con, table_name, indexes)
+        raise
+    create_indexes(con, table_name, indexes, dict(plan["rename"]), plan["drop"])
+
+    save_schema_version(con, table_name)
+    bump_table_version(con, table_name)  # Column-keyed caches (sketches, profiles, key sets) go stale
+    return plan
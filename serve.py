@@ -0,0 +1,59 @@
+"""
+Streamlit server entry used by the launchers
+Starts the warm-up pipeline, then boots Streamlit in this process; once the server
+listens, readiness and startup phase timings are sent to the launcher's socket.
+
+    python serve.py ui_streamlit.py --port 8503 --ready-port 50123
+"""
+import argparse
+import socket
+import threading
+import time
+
+import warmup
+
+
+def _signal_when_listening(port, ready_port):
+    """Fallback for Streamlit versions without a server start hook: watch the port from inside"""
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    warmup.signal_ready(ready_port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Streamlit UI with a warmed engine")
+    parser.add_argument("script")
+    parser.add_argument("--port", type=int, default=8503)
+    parser.add_argument("--ready-port", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    warmup.start_warmup()  # Database and catalog warm while Streamlit imports and boots
+    with warmup.phase("import_streamlit"):
+        from streamlit.web import bootstrap
+
+    if args.ready_port:
+        on_server_start = getattr(bootstrap, "_on_server_start", None)
+        if on_server_start is not None:
+            def _on_server_start(server):
+                on_server_start(server)
+                threading.Thread(target=warmup.signal_ready, args=(args.ready_port,), daemon=True).start()
+            bootstrap._on_server_start = _on_server_start
+        else:
+            threading.Thread(target=_signal_when_listening, args=(args.port, args.ready_port), daemon=True).start()
+
+    flag_options = {
+        "server_port": args.port,
+        "server_headless": True,
+        "server_address": "127.0.0.1",
+        "browser_gatherUsageStats": False,
+    }
+    bootstrap.load_config_options(flag_options=flag_options)
+    bootstrap.run(args.script, False, [], flag_options)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ APP = ['bootstrap.py']
 DATA_FILES = [
     ('', ['ui_streamlit.py', 'versioning.py', 'macros.py', 'version.json', 
           'engine.py', 'ingestion.py', 'completer.py', 'native_window.py', 
-          'utils.py', 'app_icon.icns']),
+          'utils.py', 'watcher.py', 'partitioning.py', 'overlap.py', 'sketches.py', 'join_graph.py', 'profiler.py', 'catalog.py', 'schema_edit.py', 'ddl.py', 'export.py', 'results.py', 'scheduler.py', 'admission.py', 'isolation.py', 'prepared.py', 'sql_ast.py', 'reuse.py', 'sampling.py', 'rollups.py', 'warmup.py', 'serve.py', 'app_icon.icns']),
     ('data', []),
     ('schemas', []),
 ]
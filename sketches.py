@@ -0,0 +1,227 @@
+"""
+Per-column HyperLogLog and MinHash sketches
+Built in one vectorized DuckDB pass per table (at ingest), merged on append, and used
+for constant-time distinct-count, Jaccard and overlap estimates with error bounds.
+
+Both sketches share the same 2^PRECISION buckets of a 64-bit hash of the value's text:
+the HLL register keeps the max leading-zero rank, the MinHash slot keeps the minimum
+remaining hash bits (one-permutation MinHash).
+"""
+import math
+from datetime import datetime
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+from versioning import table_fingerprint
+
+PRECISION = 12
+BUCKETS = 1 << PRECISION
+EMPTY_SLOT = 1 << (64 - PRECISION)  # Larger than any stored MinHash value
+HLL_RELATIVE_ERROR = 1.04 / math.sqrt(BUCKETS)
+SKETCH_ON_INGEST = True
+SKETCHES_TABLE = f"{INTERNAL_SCHEMA}.column_sketches"
+RANK_MIN_DISTINCT = 20  # Constant and low-cardinality columns (flags, statuses) contain each other by accident
+MAX_CACHED_RANKINGS = 64
+
+_ranking_cache = {}
+
+
+def _ensure_table(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SKETCHES_TABLE} (
+            table_name VARCHAR NOT NULL,
+            column_name VARCHAR NOT NULL,
+            column_type VARCHAR,
+            fingerprint VARCHAR,
+            non_null BIGINT,
+            registers UTINYINT[],
+            minhash UBIGINT[],
+            built_at TIMESTAMP,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+
+
+def _compute(con, relation):
+    """{column: (non_null, registers, minhash)} for every column of a relation, one scan"""
+    columns = con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()
+    if not columns:
+        return {}, {}
+    casts = ", ".join(f'CAST("{c[0]}" AS VARCHAR) AS "{c[0]}"' for c in columns)
+    rest = 64 - PRECISION
+    rows = con.execute(f"""
+        SELECT col, h & {BUCKETS - 1} AS bucket, count(*),
+               max(CASE WHEN h >> {PRECISION} = 0 THEN {rest + 1}
+                        ELSE greatest(1, {rest} - floor(log2(h >> {PRECISION})))::INTEGER END),
+               min(h >> {PRECISION})
+        FROM (
+            SELECT col, hash(val) AS h
+            FROM (UNPIVOT (SELECT {casts} FROM {relation}) ON COLUMNS(*) INTO NAME col VALUE val)
+        )
+        GROUP BY ALL
+    """).fetchall()
+
+    sketches = {c[0]: [0, [0] * BUCKETS, [EMPTY_SLOT] * BUCKETS] for c in columns}
+    for col, bucket, count, rank, low in rows:
+        sketch = sketches[col]
+        sketch[0] += count
+        sketch[1][bucket] = rank
+        sketch[2][bucket] = low
+    return sketches, {c[0]: c[1] for c in columns}
+
+
+def _store(con, table_name, sketches, types, fingerprint):
+    now = datetime.now()
+    for col, (non_null, registers, minhash) in sketches.items():
+        con.execute(
+            f"INSERT OR REPLACE INTO {SKETCHES_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [table_name, col, types.get(col), fingerprint, non_null, registers, minhash, now]
+        )
+
+
+def build_table_sketches(con, table_name):
+    """(Re)build sketches for every column of a table"""
+    _ensure_table(con)
+    sketches, types = _compute(con, f'"{table_name}"')
+    con.execute(f"DELETE FROM {SKETCHES_TABLE} WHERE table_name = ?", [table_name])
+    _store(con, table_name, sketches, types, table_fingerprint(con, table_name))
+    return len(sketches)
+
+
+def merge_table_sketches(con, table_name, delta_relation):
+    """Fold rows appended to a table (given as a relation, e.g. read_csv_auto(...)) into its sketches"""
+    _ensure_table(con)
+    existing = {r[0]: r for r in con.execute(
+        f"SELECT column_name, non_null, registers, minhash FROM {SKETCHES_TABLE} WHERE table_name = ?", [table_name]
+    ).fetchall()}
+    if not existing:
+        return build_table_sketches(con, table_name)
+    delta, types = _compute(con, delta_relation)
+    for col, (non_null, registers, minhash) in delta.items():
+        if col in existing:
+            _, old_count, old_registers, old_minhash = existing[col]
+            non_null += old_count
+            registers = [max(a, b) for a, b in zip(old_registers, registers)]
+            minhash = [min(a, b) for a, b in zip(old_minhash, minhash)]
+        delta[col] = [non_null, registers, minhash]
+    _store(con, table_name, delta, types, table_fingerprint(con, table_name))
+    return len(delta)
+
+
+def ensure_table_sketches(con, table_name):
+    """Build sketches if a table has none or they predate writes made outside ingestion"""
+    _ensure_table(con)
+    row = con.execute(
+        f"SELECT min(fingerprint) FROM {SKETCHES_TABLE} WHERE table_name = ?", [table_name]
+    ).fetchone()
+    if row[0] is None or row[0] != table_fingerprint(con, table_name):
+        build_table_sketches(con, table_name)
+
+
+def has_sketches(con, table_name):
+    _ensure_table(con)
+    return con.execute(
+        f"SELECT count(*) FROM {SKETCHES_TABLE} WHERE table_name = ?", [table_name]
+    ).fetchone()[0] > 0
+
+
+def load_sketches(con, table_name):
+    """{column: {"type", "non_null", "registers", "minhash"}} for a table"""
+    _ensure_table(con)
+    return {
+        r[0]: {"type": r[1], "non_null": r[2], "registers": r[3], "minhash": r[4]}
+        for r in con.execute(
+            f"SELECT column_name, column_type, non_null, registers, minhash FROM {SKETCHES_TABLE} WHERE table_name = ?",
+            [table_name]
+        ).fetchall()
+    }
+
+
+# --- Estimators ---
+def hll_estimate(registers):
+    """HyperLogLog cardinality with the small-range (linear counting) correction"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+
+def jaccard_estimate(minhash_a, minhash_b):
+    """(Jaccard similarity, standard error) from one-permutation MinHash slots"""
+    used = [(a, b) for a, b in zip(minhash_a, minhash_b) if a != EMPTY_SLOT or b != EMPTY_SLOT]
+    if not used:
+        return 0.0, 0.0
+    j = sum(1 for a, b in used if a == b) / len(used)
+    return j, math.sqrt(max(j * (1 - j), 1.0 / len(used)) / len(used))
+
+
+def compare_sketches(sketch_a, sketch_b, z=1.96):
+    """Distinct counts, Jaccard, overlap and containment estimates with ~95% bounds"""
+    distinct_a = hll_estimate(sketch_a["registers"])
+    distinct_b = hll_estimate(sketch_b["registers"])
+    union = hll_estimate([max(a, b) for a, b in zip(sketch_a["registers"], sketch_b["registers"])])
+    jaccard, j_err = jaccard_estimate(sketch_a["minhash"], sketch_b["minhash"])
+    overlap = jaccard * union
+    overlap_err = z * union * math.sqrt(j_err ** 2 + (jaccard * HLL_RELATIVE_ERROR) ** 2)
+    smaller = max(min(distinct_a, distinct_b), 1.0)
+    return {
+        "distinct_a": distinct_a,
+        "distinct_b": distinct_b,
+        "distinct_error": HLL_RELATIVE_ERROR * z,
+        "jaccard": jaccard,
+        "jaccard_low": max(0.0, jaccard - z * j_err),
+        "jaccard_high": min(1.0, jaccard + z * j_err),
+        "overlap": overlap,
+        "overlap_low": max(0.0, overlap - overlap_err),
+        "overlap_high": min(smaller, overlap + overlap_err),
+        "containment": min(1.0, overlap / smaller),  # Share of the smaller side found in the other
+    }
+
+
+def estimate_overlap(con, table_a, column_a, table_b, column_b):
+    """Approximate overlap of two columns from stored sketches (built on demand)"""
+    ensure_table_sketches(con, table_a)
+    ensure_table_sketches(con, table_b)
+    a = load_sketches(con, table_a).get(column_a)
+    b = load_sketches(con, table_b).get(column_b)
+    if a is None or b is None:
+        raise ValueError(f"No sketch for {table_a}.{column_a} or {table_b}.{column_b}")
+    return compare_sketches(a, b)
+
+
+def rank_join_candidates(con, table_a, table_b, top=5, min_score=0.05):
+    """
+    Column pairs of two tables ranked by how likely they are join keys:
+    value containment (how much of the smaller side is found in the other), with a
+    small bonus for identical names. Columns with fewer than RANK_MIN_DISTINCT values
+    are left out. Returns [(column_a, column_b, score, estimates)], cached per table version.
+    """
+    ensure_table_sketches(con, table_a)
+    ensure_table_sketches(con, table_b)
+    cache_key = (table_a, table_fingerprint(con, table_a), table_b, table_fingerprint(con, table_b), top, min_score)
+    if cache_key in _ranking_cache:
+        return _ranking_cache[cache_key]
+
+    def keyish(sketches):
+        return {c: s for c, s in sketches.items() if s["non_null"] and hll_estimate(s["registers"]) >= RANK_MIN_DISTINCT}
+
+    sketches_a, sketches_b = keyish(load_sketches(con, table_a)), keyish(load_sketches(con, table_b))
+    ranked = []
+    for col_a, sa in sketches_a.items():
+        for col_b, sb in sketches_b.items():
+            est = compare_sketches(sa, sb)
+            score = est["containment"] + (0.1 if col_a.lower() == col_b.lower() else 0.0)
+            if score >= min_score:
+                ranked.append((col_a, col_b, score, est))
+    ranked.sort(key=lambda r: r[2], reverse=True)
+    if len(_ranking_cache) >= MAX_CACHED_RANKINGS:
+        _ranking_cache.pop(next(iter(_ranking_cache)))
+    _ranking_cache[cache_key] = ranked[:top]
+    return ranked[:top]
+
+
+def drop_sketches(con, table_name):
+    _ensure_table(con)
+    con.execute(f"DELETE FROM {SKETCHES_TABLE} WHERE table_name = ?", [table_name])
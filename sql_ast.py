@@ -0,0 +1,220 @@
+"""
+SQL syntax trees from DuckDB's own parser
+json_serialize_sql / json_deserialize_sql turn a SELECT into a JSON tree and back, so
+query shapes (table, projection, filters, grouping, limit) come from the real parse
+rather than regexes, and rewritten trees are rendered to SQL by DuckDB itself.
+"""
+import copy
+import json
+
+DECOMPOSABLE_AGGREGATES = {"sum": "sum", "count": "sum", "count_star": "sum", "min": "min", "max": "max"}
+
+
+def parse_query(con, sql):
+    """The query node of a single-statement SELECT (including set operations and CTEs), or None"""
+    try:
+        tree = json.loads(con.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    except Exception:
+        return None
+    if tree.get("error") or len(tree.get("statements", [])) != 1:
+        return None
+    return tree["statements"][0]["node"]
+
+
+def parse(con, sql):
+    """The SELECT_NODE of a single-statement SELECT, or None"""
+    node = parse_query(con, sql)
+    return node if node is not None and node.get("type") == "SELECT_NODE" else None
+
+
+def parse_expression(con, text):
+    """Expression tree of a scalar SQL expression (e.g. "date_trunc('day', ts)"), or None"""
+    node = parse(con, f"SELECT {text}")
+    return node["select_list"][0] if node is not None and len(node["select_list"]) == 1 else None
+
+
+def to_sql(con, node):
+    tree = {"error": False, "statements": [{"node": node, "named_param_map": []}]}
+    return con.execute("SELECT json_deserialize_sql(?)", [json.dumps(tree)]).fetchone()[0]
+
+
+def strip_locations(tree):
+    if isinstance(tree, dict):
+        return {k: strip_locations(v) for k, v in tree.items() if k != "query_location"}
+    if isinstance(tree, list):
+        return [strip_locations(v) for v in tree]
+    return tree
+
+
+def same(a, b):
+    """Structural equality, ignoring where in the text each expression was"""
+    return strip_locations(a) == strip_locations(b)
+
+
+def walk(tree):
+    """Every expression dict in a tree (depth first)"""
+    if isinstance(tree, dict):
+        yield tree
+        for value in tree.values():
+            yield from walk(value)
+    elif isinstance(tree, list):
+        for value in tree:
+            yield from walk(value)
+
+
+def conjuncts(expr):
+    """Top-level AND terms of a predicate ([] for none)"""
+    if expr is None:
+        return []
+    if expr.get("type") == "CONJUNCTION_AND":
+        return [c for child in expr["children"] for c in conjuncts(child)]
+    return [expr]
+
+
+def column_refs(tree):
+    """Lower-cased names of all columns referenced anywhere in `tree`"""
+    return {e["column_names"][-1].lower() for e in walk(tree) if e.get("class") == "COLUMN_REF"}
+
+
+def is_column(expr):
+    return expr.get("class") == "COLUMN_REF"
+
+
+def is_plain_star(expr):
+    """SELECT * without EXCLUDE/REPLACE/RENAME or COLUMNS(...)"""
+    return expr.get("class") == "STAR" and not (
+        expr["exclude_list"] or expr["replace_list"] or expr.get("rename_list") or expr.get("qualified_exclude_list")
+        or expr["columns"] or expr["expr"]
+    )
+
+
+def conjunction(terms):
+    """AND of predicate terms (None for no terms)"""
+    if not terms:
+        return None
+    if len(terms) == 1:
+        return terms[0]
+    return {"class": "CONJUNCTION", "type": "CONJUNCTION_AND", "alias": "", "children": list(terms)}
+
+
+def aggregate_names(con):
+    """Names of all aggregate functions DuckDB knows (count(*) parses as count_star)"""
+    return {r[0] for r in con.execute(
+        "SELECT DISTINCT function_name FROM duckdb_functions() WHERE function_type = 'aggregate'"
+    ).fetchall()} | {"count_star"}
+
+
+def has_aggregate(tree, aggregates):
+    return any(e.get("class") == "FUNCTION" and e["function_name"] in aggregates for e in walk(tree))
+
+
+def has_subquery(tree):
+    return any(e.get("class") == "SUBQUERY" for e in walk(tree))
+
+
+def base_table(node):
+    """Table name when the query reads exactly one plain table of the main schema, else None"""
+    source = node.get("from_table") or {}
+    if source.get("type") != "BASE_TABLE" or source.get("sample") or source.get("at_clause"):
+        return None
+    if source["schema_name"] not in ("", "main") or source["catalog_name"]:
+        return None
+    return source["table_name"]
+
+
+def limit_of(node):
+    """(limit, offset, order terms, distinct) from the node's modifiers; non-constant limits give -1"""
+    limit = offset = None
+    orders, distinct = [], False
+    for m in node.get("modifiers", []):
+        if m["type"] == "LIMIT_MODIFIER":
+            for key in ("limit", "offset"):
+                value = m.get(key)
+                if value is not None:
+                    value = value["value"]["value"] if value.get("class") == "CONSTANT" else -1
+                    if key == "limit":
+                        limit = value
+                    else:
+                        offset = value
+        elif m["type"] == "ORDER_MODIFIER":
+            orders = m["orders"]
+        elif m["type"] == "DISTINCT_MODIFIER":
+            distinct = True
+        else:
+            limit = -1  # Percentage or other limits are not reusable
+    return limit, offset, orders, distinct
+
+
+def query_shape(con, sql):
+    """
+    Summary of a single-table SELECT, or None for anything else (joins, set
+    operations, CTEs, subqueries):
+    {"node", "table", "alias", "star", "columns", "plain", "where", "group_by",
+     "grouping_sets", "having", "limit", "offset", "orders", "distinct"}
+    """
+    node = parse(con, sql)
+    if node is None or node.get("cte_map", {}).get("map") or has_subquery(node):
+        return None
+    table = base_table(node)
+    if table is None:
+        return None
+    limit, offset, orders, distinct = limit_of(node)
+    select = node["select_list"]
+    return {
+        "node": node,
+        "table": table,
+        "alias": node["from_table"]["alias"],
+        "star": any(is_plain_star(e) for e in select),
+        # Output columns that are plain references, under their output names
+        "columns": {(e["alias"] or e["column_names"][-1]).lower(): e["column_names"][-1].lower()
+                    for e in select if is_column(e)},
+        "where": conjuncts(node.get("where_clause")),
+        "group_by": node.get("group_expressions", []),
+        "grouping_sets": len(node.get("group_sets", [])) > 1,
+        "having": node.get("having"),
+        # Rows of the table as they are: only column references, no grouping
+        "plain": all(is_column(e) or is_plain_star(e) for e in select)
+                 and not node.get("group_expressions") and not node.get("having") and not distinct,
+        "limit": limit,
+        "offset": offset,
+        "orders": orders,
+        "distinct": distinct,
+    }
+
+
+def table_refs(node):
+    """
+    Lower-cased names of the main-schema tables a query reads, anywhere in it (joins,
+    subqueries, CTE bodies); names of its CTEs are not tables and are left out
+    """
+    ctes = {c["key"].lower() for e in walk(node) if isinstance(e.get("cte_map"), dict) for c in e["cte_map"]["map"]}
+    return {
+        e["table_name"].lower() for e in walk(node)
+        if e.get("type") == "BASE_TABLE" and e.get("schema_name") in ("", "main") and not e.get("catalog_name")
+    } - ctes
+
+
+def replace_tables(node, mapping):
+    """
+    Copy of `node` with every read of a main-schema table in `mapping` (lower-cased name ->
+    (schema, table)) redirected, keeping references to the old name valid
+    """
+    node = copy.deepcopy(node)
+    names = table_refs(node)
+    for e in walk(node):
+        if e.get("type") != "BASE_TABLE" or e.get("schema_name") not in ("", "main") or e.get("catalog_name"):
+            continue
+        target = mapping.get(e["table_name"].lower())
+        if target and e["table_name"].lower() in names:
+            e["alias"] = e["alias"] or e["table_name"]
+            e["schema_name"], e["table_name"] = target
+    return node
+
+
+def with_table(node, table_name):
+    """Copy of `node` reading `table_name` instead of its table, keeping references to the old name valid"""
+    node = copy.deepcopy(node)
+    source = node["from_table"]
+    source["alias"] = source["alias"] or source["table_name"]
+    source["table_name"], source["schema_name"], source["catalog_name"] = table_name, "", ""
+    return node
@@ -0,0 +1,55 @@
+import duckdb
+import pytest
+
+from prepared import StatementCache, lift_literals
+from scheduler import CellScheduler
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE t AS SELECT range AS i, 'v' || range AS s FROM range(10)")
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize("sql, template, literals", [
+    ("SELECT * FROM t WHERE i > 3 -- recent only\n AND i < 6",
+     "SELECT * FROM t WHERE i > $1 -- recent only\n AND i < $2", ["3", "6"]),
+    ("SELECT * FROM t WHERE i > 3/* lower */AND i < 6--upper",
+     "SELECT * FROM t WHERE i > $1/* lower */AND i < $2--upper", ["3", "6"]),
+    ("SELECT * FROM t WHERE s = 'it''s -- not a comment' -- but this is",
+     "SELECT * FROM t WHERE s = $1 -- but this is", ["'it''s -- not a comment'"]),
+    ("SELECT * FROM t WHERE i IN (1, 2.5e1 /* x */, 3) LIMIT 10 -- top",
+     "SELECT * FROM t WHERE i IN ($1, $2::DOUBLE /* x */, $3) LIMIT $4 -- top", ["1", "2.5e1", "3", "10"]),
+])
+def test_lift_literals_followed_by_comments(sql, template, literals):
+    assert lift_literals(sql) == (template, literals)
+
+
+def test_lift_literals_leaves_special_literals_in_template():
+    sql = "SELECT * FROM t WHERE s = E'a\\'b' AND i = 0x1F AND s <> $$x$$"
+    assert lift_literals(sql) == (sql, [])
+
+
+def test_commented_select_runs_through_cache(con):
+    statements = StatementCache(con)
+    sql = "SELECT i FROM t WHERE i > 3 -- recent only\n AND i < 6 ORDER BY i"
+    assert statements.execute(sql).fetchall() == [(4,), (5,)]
+    assert statements.execute(sql.replace("6", "5")).fetchall() == [(4,)]
+
+
+def test_session_state_persists_across_cells(con):
+    scheduler = CellScheduler(con, debounce=0)
+
+    def run(sql):
+        cell = scheduler.submit("cell", sql, lambda cursor, sql: cursor.execute(sql).fetchall())
+        assert cell.wait(5) and cell.error is None
+        return cell.result
+
+    run("CREATE TEMP TABLE scratch AS SELECT i FROM t WHERE i < 3")
+    run("SET VARIABLE v = 5")
+    assert run("SELECT count(*) FROM scratch") == [(3,)]
+    assert run("SELECT getvariable('v')") == [(5,)]
+    assert scheduler.check("SELECT * FROM scratch") is None
+    assert run("SELECT i FROM t WHERE i = 1") == run("SELECT i FROM t WHERE i = 1")
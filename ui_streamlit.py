@@ -1,13 +1,38 @@
 import streamlit as st
 import duckdb
-import pandas as pd
+import pyarrow as pa
 import os
+import uuid
 from datetime import datetime
+from functools import partial
 import re
-from streamlit_ace import st_ace
+from ingestion import ingest_csv, record_ingested_file, forget_table
+from watcher import start_folder_watcher
+from join_graph import RELATIONSHIP_LABELS, start_join_discovery, join_edges, join_condition
+from overlap import compare_keys, overlap_rows_sql, drop_key_sets
+from sketches import estimate_overlap, rank_join_candidates, drop_sketches
+from profiler import profile_table, cached_profiles, drop_profiles
+from ddl import staged_table, export_table_csv, create_auto_indexes
+from scheduler import CellScheduler
+from prepared import statement_stats
+from admission import QUERY_ADMISSION, RUN_TIMEOUTS
+from isolation import SNAPSHOT_MAX_MB, SnapshotTooLarge, start_query_pool, is_read_only_query, has_session_state
+from results import fetch_arrow, paginate_table, encode_page, serialize_page, ResultStore, ResultRef
+from export import (
+    FORMATS as EXPORT_FORMATS, EXPORTS_DIR, EXPORT_MAX_AGE_DAYS, DownloadServer, export_dir, export_query,
+    new_export_path, prune_exports
+)
+from schema_edit import plan_schema_edit, describe_plan, apply_schema_edit
+from catalog import catalog_signature, load_catalog, search_catalog, table_columns, TABLES_PER_PAGE, COLUMNS_PER_PAGE
+from versioning import record_writes, table_fingerprint
+from reuse import SemanticCache
+from sampling import preview_sql, estimate_rows
+from rollups import route_to_cube
+from warmup import take_database, warm_catalog
+from partitioning import GRANULARITIES, ingest_partitioned, is_partitioned, list_partitions, drop_partitioned_table
 from utils import (
     validate_table_name, validate_file_upload, sanitize_table_name,
-    validate_sql_query, create_query_hash, safe_execute, paginate_dataframe,
+    validate_sql_query, create_query_hash, safe_execute,
     MAX_FILE_SIZE, MAX_RESULT_ROWS, PAGINATION_SIZE
 )
 
@@ -34,6 +59,12 @@ if 'managing_table' not in st.session_state:
     st.session_state.managing_table = None
 if 'active_tool' not in st.session_state:
     st.session_state.active_tool = None
+if 'user_id' not in st.session_state:
+    st.session_state.user_id = uuid.uuid4().hex[:8]  # Key for the per-user query concurrency limit
+if 'result_store' not in st.session_state:
+    st.session_state.result_store = ResultStore()  # Large cell results spill to disk
+if 'semantic_cache' not in st.session_state:
+    st.session_state.semantic_cache = SemanticCache()  # Drill-downs answered from earlier results
 
 # --- Custom Styling ---
 st.markdown("""
@@ -166,34 +197,98 @@ st.markdown("""
 
 # --- Database Setup ---
 if 'con' not in st.session_state:
-    try:
-        st.session_state.con = duckdb.connect("metadata.db", read_only=False)
-        st.session_state.read_only = False
-    except duckdb.IOException as e:
-        st.warning(f"Database file error: {e}. Using in-memory database.")
-        st.session_state.con = duckdb.connect(":memory:")
-        st.session_state.read_only = True
-    except Exception as e:
-        st.error(f"Failed to connect to database: {e}")
-        st.session_state.con = duckdb.connect(":memory:")
-        st.session_state.read_only = True
-    
-    # --- OPTIMIZED HARDWARE TUNING for 10GB+ files ---
-    st.session_state.con.execute("SET memory_limit='16GB'")  # Increased for 10GB files
-    st.session_state.con.execute("SET threads=8")  # More threads for large file processing
-    st.session_state.con.execute("SET preserve_insertion_order=false")
-    st.session_state.con.execute("SET max_temp_directory_size='500GB'")
-    st.session_state.con.execute("SET allocator_flush_threshold='256MB'")  # Increased for large files
+    # Opened, tuned and checkpointed while the server booted when started via serve.py
+    # (see warmup.py); otherwise opened here the same way
+    database = take_database()
+    st.session_state.con = database["con"]
+    st.session_state.read_only = database["read_only"]
+    if database["problem"]:
+        level, message = database["problem"]
+        (st.warning if level == "warning" else st.error)(message)
     
     # --- LAZY CSV LOADING - Don't load all CSVs on startup ---
     # Tables will be created on-demand when ingested or queried
     # This significantly improves startup time
-    
-    st.session_state.con.execute("CHECKPOINT") # Persist and compact
 
 con = st.session_state.con
+RUN_POLL_SECONDS = 0.1  # How long a cell waits on its run per fragment rerun while it is in flight
+if 'cell_scheduler' not in st.session_state:
+    # Debounced, cancel-on-edit cell runs on this session's own cursor, which keeps its
+    # prepared statements, TEMP tables and variables for as long as the session lives
+    st.session_state.cell_scheduler = CellScheduler(con)
+
+# --- Live ingestion: pick up new/changed CSVs in data/ without a restart ---
+@st.cache_resource(show_spinner=False)
+def get_folder_watcher(_con):
+    return start_folder_watcher(_con, "data")
+
+folder_watcher = None if st.session_state.read_only else get_folder_watcher(con)
+catalog_version = folder_watcher.version if folder_watcher else 0
+if "seen_catalog_version" not in st.session_state:
+    st.session_state.seen_catalog_version = catalog_version  # A new session starts with nothing unseen
+if st.session_state.seen_catalog_version != catalog_version:
+    # Only tables changed since this session's last toast; the watcher is shared by all sessions
+    changed = folder_watcher.changes_since(st.session_state.seen_catalog_version)
+    st.session_state.seen_catalog_version = catalog_version
+    if changed:
+        st.toast(f"🔄 Live data updated: {', '.join(changed)}")
+
+# --- Join-key discovery: ranked join graph maintained in the background ---
+@st.cache_resource(show_spinner=False)
+def get_join_discovery(_con):
+    return start_join_discovery(_con)
+
+join_discovery = None if st.session_state.read_only else get_join_discovery(con)
+join_graph_version = join_discovery.version if join_discovery else 0
+
+# --- Optional isolated execution: SELECTs run in worker processes over a snapshot ---
+@st.cache_resource(show_spinner=False)
+def get_query_pool(_con):
+    return start_query_pool(_con)
+
+# --- Exports are written under exports/ (pruned) and streamed from disk by a download server ---
+@st.cache_resource(show_spinner=False)
+def get_download_server():
+    # static/exports held exports served by Streamlit's static handler in earlier versions
+    prune_exports(EXPORTS_DIR)
+    prune_exports(os.path.join("static", "exports"), max_age_days=0)
+    address = st.get_option("server.address") or ""  # Reachable wherever the app is
+    try:
+        return DownloadServer(address, st.get_option("server.port") + 1)
+    except OSError:
+        return DownloadServer(address)  # Next port taken: any free one
+
+download_server = get_download_server()
+
+def download_url(url_path):
+    """Link to the download server on the host the browser reached the app at"""
+    host = (st.context.headers.get("Host") or "localhost").rsplit(":", 1)[0]
+    return f"http://{host}:{download_server.port}{url_path}"
 
 # --- Helper Functions ---
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_catalog(signature):
+    """Catalog snapshot; a new signature (any DDL) invalidates it"""
+    return warm_catalog(signature) or load_catalog(con)
+
+def fetch_cell_result(cursor, sql, user=None, pool=None):
+    """
+    Cell queries run in the interactive class; the run timeout interrupts the cell's cursor.
+    With a worker pool, SELECTs run isolated in a worker; other statements, queries of a
+    session holding TEMP tables or variables (snapshots lack them) and every query on a
+    database too large to snapshot run here.
+    """
+    with QUERY_ADMISSION.admit("interactive", user, interrupt=cursor):
+        if pool is not None and is_read_only_query(cursor, sql) and not has_session_state(cursor):
+            try:
+                return pool.execute(sql, timeout=RUN_TIMEOUTS["interactive"])
+            except SnapshotTooLarge:
+                pass
+        result = fetch_arrow(cursor, sql)
+    if record_writes(cursor, sql) and pool is not None:
+        pool.invalidate()  # Workers must see what this statement changed
+    return result
+
 def get_active_cells():
     return st.session_state.notebooks.get(st.session_state.current_notebook, [])
 
@@ -202,16 +297,160 @@ def add_cell():
     new_id = max([c["id"] for c in active_cells]) + 1 if active_cells else 0
     active_cells.append({"id": new_id, "query": "", "result": None, "meta": {}})
 
+def format_column_profile(stats):
+    """Hover text for a profiled column"""
+    lines = [
+        f"Nulls: {stats['null_fraction']:.1%} of {stats['rows']:,} rows",
+        f"Distinct: ~{stats['distinct']:,}",
+    ]
+    if stats.get("min") is not None:
+        lines.append(f"Range: {stats['min']} → {stats['max']}")
+    if stats.get("mean") is not None:
+        lines.append(f"Mean: {stats['mean']:,.4g} (σ {stats['stddev'] or 0:,.4g})")
+    if stats.get("avg_length") is not None:
+        lines.append(f"Length: {stats['min_length']}–{stats['max_length']} (avg {stats['avg_length']:.1f})")
+    if stats.get("top_k"):
+        lines.append("Top values: " + ", ".join(str(v) for v in stats["top_k"]))
+    if stats.get("histogram"):
+        lines.append("Deciles: " + " | ".join(str(v) for v in stats["histogram"]))
+    return "\n\n".join(lines)
+
 def delete_cell(idx):
     active_cells = get_active_cells()
     if len(active_cells) > 1:
-        active_cells.pop(idx)
+        cell = active_cells.pop(idx)
+        st.session_state.cell_scheduler.cancel(f"{st.session_state.current_notebook}_{cell['id']}")
         st.rerun()
 
+# 🔍 Schema Explorer (The "Robust" Recommendation Tool)
+# Backed by a cached catalog snapshot: only one page of table rows and the columns
+# of the opened table are rendered, so sidebar cost does not grow with the catalog.
+@st.fragment
+def render_schema_explorer():
+    """Searching, paging and opening tables rerun only the explorer"""
+    st.header("🔍 Schema Reference")
+    search_q = st.text_input("Search tables or columns...", placeholder="Find schema...", key="schema_search").lower()
+    if st.session_state.get("schema_search_seen") != search_q:
+        st.session_state.schema_search_seen = search_q
+        st.session_state.schema_page = 0
+    
+    try:
+        catalog = get_catalog(catalog_signature(con))
+        total_tables, page_tables = search_catalog(
+            catalog, search_q, st.session_state.get("schema_page", 0) * TABLES_PER_PAGE
+        )
+        if not total_tables:
+            st.caption("No matching tables.")
+        
+        for tn, n_cols, n_matches in page_tables:
+            is_open = st.session_state.get("schema_open") == tn
+            label = f"{'📂' if is_open else '📁'} {tn} ({n_matches}/{n_cols} cols)" if search_q and n_matches < n_cols else f"{'📂' if is_open else '📁'} {tn} ({n_cols} cols)"
+            if st.button(label, key=f"schema_tbl_{tn}", use_container_width=True):
+                st.session_state.schema_open = None if is_open else tn
+                st.session_state.schema_col_page = 0
+                st.rerun(scope="fragment")
+            if not is_open:
+                continue
+            
+            with st.container(border=True):
+                # Table Name Copy
+                tc_1, tc_2 = st.columns([0.8, 0.2])
+                tc_1.caption("Table Name")
+                tc_2.markdown(f"""
+                    <button class="copy-btn" style="height:25px; font-size:0.8rem;" 
+                        onclick="(function(v, b) {{
+                            const e = document.createElement('textarea');
+                            e.value = v; e.style.position = 'fixed'; e.style.opacity = '0';
+                            b.parentNode.appendChild(e); e.select();
+                            document.execCommand('copy');
+                            b.parentNode.removeChild(e);
+                            const old = b.innerText; b.innerText = '✅';
+                            setTimeout(() => {{ b.innerText = old; }}, 1000);
+                        }})('{tn}', this)">
+                        📋
+                    </button>
+                """, unsafe_allow_html=True)
+                
+                # Cached column profile, shown only while it matches the table's contents
+                profile = {} if st.session_state.read_only else cached_profiles(con, tn).get(tn)
+                profile = profile[1] if profile and profile[0] == table_fingerprint(con, tn) else {}
+                if not profile and not st.session_state.read_only:
+                    if st.button("📊 Profile columns", key=f"profile_{tn}", use_container_width=True):
+                        with st.spinner(f"Profiling {tn} (single scan)..."):
+                            with QUERY_ADMISSION.admit("batch", st.session_state.user_id):
+                                profile_table(con, tn)
+                        st.rerun(scope="fragment")
+                
+                st.divider()
+                col_filter = None if not search_q or search_q in tn.lower() else search_q
+                col_page = st.session_state.get("schema_col_page", 0)
+                total_cols, cols = table_columns(con, tn, col_filter, col_page * COLUMNS_PER_PAGE)
+                for cn, dt in cols:
+                    cc_1, cc_2 = st.columns([0.8, 0.2])
+                    stats = profile.get(cn)
+                    if stats:
+                        cc_1.markdown(
+                            f"`{cn}` <small style='color:#64748b'>{dt} · {stats['null_fraction']:.0%} null · ~{stats['distinct']:,} distinct</small>",
+                            unsafe_allow_html=True, help=format_column_profile(stats)
+                        )
+                    else:
+                        cc_1.markdown(f"`{cn}` <small style='color:#64748b'>{dt}</small>", unsafe_allow_html=True)
+                    cc_2.markdown(f"""
+                        <button class="copy-btn" style="height:25px; font-size:0.8rem;" 
+                            onclick="(function(v, b) {{
+                                const e = document.createElement('textarea');
+                                e.value = v; e.style.position = 'fixed'; e.style.opacity = '0';
+                                b.parentNode.appendChild(e); e.select();
+                                document.execCommand('copy');
+                                b.parentNode.removeChild(e);
+                                const old = b.innerText; b.innerText = '✅';
+                                setTimeout(() => {{ b.innerText = old; }}, 1000);
+                            }})('{cn}', this)">
+                            📋
+                        </button>
+                    """, unsafe_allow_html=True)
+                if total_cols > COLUMNS_PER_PAGE:
+                    cp_1, cp_2, cp_3 = st.columns([0.3, 0.4, 0.3])
+                    if cp_1.button("◀", key=f"schema_cols_prev_{tn}", disabled=col_page == 0, use_container_width=True):
+                        st.session_state.schema_col_page = col_page - 1
+                        st.rerun(scope="fragment")
+                    cp_2.caption(f"Columns {col_page * COLUMNS_PER_PAGE + 1}–{min((col_page + 1) * COLUMNS_PER_PAGE, total_cols)} of {total_cols}")
+                    if cp_3.button("▶", key=f"schema_cols_next_{tn}", disabled=(col_page + 1) * COLUMNS_PER_PAGE >= total_cols, use_container_width=True):
+                        st.session_state.schema_col_page = col_page + 1
+                        st.rerun(scope="fragment")
+                
+                # Likely joins from the discovered join graph
+                joins = join_edges(con, tn, limit=5) if join_discovery else []
+                if joins:
+                    st.caption("🔗 Likely joins")
+                    for edge in joins:
+                        st.markdown(f"<small>`{join_condition(edge)}` · {RELATIONSHIP_LABELS[edge['relationship']]} · "
+                                    f"{edge['containment']:.0%}</small>", unsafe_allow_html=True)
+        
+        if total_tables > TABLES_PER_PAGE:
+            page = st.session_state.get("schema_page", 0)
+            sp_1, sp_2, sp_3 = st.columns([0.3, 0.4, 0.3])
+            if sp_1.button("◀", key="schema_prev", disabled=page == 0, use_container_width=True):
+                st.session_state.schema_page = page - 1
+                st.rerun(scope="fragment")
+            sp_2.caption(f"Tables {page * TABLES_PER_PAGE + 1}–{min((page + 1) * TABLES_PER_PAGE, total_tables)} of {total_tables}")
+            if sp_3.button("▶", key="schema_next", disabled=(page + 1) * TABLES_PER_PAGE >= total_tables, use_container_width=True):
+                st.session_state.schema_page = page + 1
+                st.rerun(scope="fragment")
+    except Exception: st.write("No tables to explore.")  # Reruns raise a BaseException and pass through
+
 # --- Sidebar ---
 with st.sidebar:
     st.image("https://img.icons8.com/clouds/100/000000/database.png", width=80)
     st.title("Settings")
+    isolated = st.toggle("🛡️ Isolated query workers", key="isolated_workers",
+                         help="Run notebook SELECTs in worker processes: a query that runs out of memory or crashes "
+                              "loses its worker, not the app. Workers read a snapshot refreshed after data changes; "
+                              f"databases over {SNAPSHOT_MAX_MB / 1024:.0f}GB are not copied and run in-process.")
+    query_pool = get_query_pool(con) if isolated else None
+    if query_pool:
+        qp = query_pool.stats()
+        st.caption(f"{qp['workers']} workers · {qp['restarts']} restarts · {qp['recycled']} recycled")
     
     st.divider()
     
@@ -237,6 +476,9 @@ with st.sidebar:
         c1, c2 = st.columns([0.8, 0.2])
         is_active = (nb == st.session_state.current_notebook)
         if c1.button(f"📄 {nb}", key=f"nb_sel_{nb}", use_container_width=True, type="primary" if is_active else "secondary"):
+            # The notebook going to the background keeps its results on disk only
+            if not is_active:
+                st.session_state.result_store.spill(c["result"] for c in get_active_cells())
             st.session_state.current_notebook = nb
             st.session_state.editing_file = None
             st.session_state.managing_table = None
@@ -251,69 +493,7 @@ with st.sidebar:
 
     st.divider()
 
-    # 🔍 Schema Explorer (The "Robust" Recommendation Tool)
-    st.header("🔍 Schema Reference")
-    search_q = st.text_input("Search tables or columns...", placeholder="Find schema...", key="schema_search").lower()
-    
-    try:
-        # Get all table/column data (ordered by position for better understanding)
-        schema_data = con.execute("""
-            SELECT table_name, column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_schema = 'main'
-            ORDER BY table_name, ordinal_position
-        """).fetchall()
-        
-        # Organize into dict: {table: [(col, type), ...]}
-        schema_tree = {}
-        for tn, cn, dt in schema_data:
-            if tn not in schema_tree: schema_tree[tn] = []
-            schema_tree[tn].append((cn, dt))
-            
-        for tn, cols in schema_tree.items():
-            # Filter based on search
-            matching_cols = [c for c in cols if search_q in tn or search_q in c[0].lower()]
-            if search_q and not matching_cols: continue
-            
-            with st.expander(f"📁 {tn}"):
-                # Table Name Copy
-                tc_1, tc_2 = st.columns([0.8, 0.2])
-                tc_1.caption("Table Name")
-                tc_2.markdown(f"""
-                    <button class="copy-btn" style="height:25px; font-size:0.8rem;" 
-                        onclick="(function(v, b) {{
-                            const e = document.createElement('textarea');
-                            e.value = v; e.style.position = 'fixed'; e.style.opacity = '0';
-                            b.parentNode.appendChild(e); e.select();
-                            document.execCommand('copy');
-                            b.parentNode.removeChild(e);
-                            const old = b.innerText; b.innerText = '✅';
-                            setTimeout(() => {{ b.innerText = old; }}, 1000);
-                        }})('{tn}', this)">
-                        📋
-                    </button>
-                """, unsafe_allow_html=True)
-                
-                st.divider()
-                for cn, dt in cols:
-                    if search_q and search_q not in cn.lower() and search_q not in tn: continue
-                    cc_1, cc_2 = st.columns([0.8, 0.2])
-                    cc_1.markdown(f"`{cn}` <small style='color:#64748b'>{dt}</small>", unsafe_allow_html=True)
-                    cc_2.markdown(f"""
-                        <button class="copy-btn" style="height:25px; font-size:0.8rem;" 
-                            onclick="(function(v, b) {{
-                                const e = document.createElement('textarea');
-                                e.value = v; e.style.position = 'fixed'; e.style.opacity = '0';
-                                b.parentNode.appendChild(e); e.select();
-                                document.execCommand('copy');
-                                b.parentNode.removeChild(e);
-                                const old = b.innerText; b.innerText = '✅';
-                                setTimeout(() => {{ b.innerText = old; }}, 1000);
-                            }})('{cn}', this)">
-                            📋
-                        </button>
-                    """, unsafe_allow_html=True)
-    except: st.write("No tables to explore.")
+    render_schema_explorer()
 
     st.divider()
 
@@ -334,6 +514,10 @@ with st.sidebar:
                     os.makedirs("data", exist_ok=True)
                     f_path = os.path.join("data", safe_filename)
                     
+                    # Keep the live watcher away from files awaiting configuration
+                    if folder_watcher:
+                        folder_watcher.hold(f_path)
+                    
                     # Show progress for large files
                     with st.spinner(f"Uploading {f.name} ({f.size / 1024 / 1024 / 1024:.2f}GB)..."):
                         with open(f_path, "wb") as tmp_f:
@@ -368,6 +552,9 @@ with st.sidebar:
         
         # Action to clear out stuck files
         if st.button("🧹 Clear All Pending", use_container_width=True):
+            if folder_watcher:
+                for info in st.session_state.pending_files.values():
+                    folder_watcher.release(info["path"])
             st.session_state.pending_files = {}
             st.rerun()
             
@@ -388,21 +575,16 @@ with st.sidebar:
                     tn = info["table_name"]
                     validate_table_name(tn)  # Validate table name
                     
-                    # Use parameterized query for safety
-                    safe_execute(con, f'CREATE OR REPLACE TABLE "{tn}" AS SELECT * FROM read_csv_auto(?)', [info["path"]])
+                    # Appends when the file matches the table's stored schema, rebuilds otherwise
+                    if not ingest_csv(con, info["path"], tn):
+                        raise ValueError(f"Could not ingest {fn} into {tn}")
                     
-                    # Analyze for query optimization
+                    # Analyze for query optimization (idx_* indexes are built by the staged load)
                     safe_execute(con, f'ANALYZE "{tn}"')
                     
-                    # Auto-Index for performance
-                    for c in info["columns"]:
-                        if any(k in c.lower() for k in ["id", "num", "phone", "email", "code", "key"]):
-                            try:
-                                safe_execute(con, f'CREATE INDEX IF NOT EXISTS idx_{tn}_{c.lower().replace(" ", "_")} ON "{tn}"("{c}")')
-                            except Exception as idx_err:
-                                pass  # Index creation is optional
-                    
                     del st.session_state.pending_files[fn]
+                    if folder_watcher:
+                        folder_watcher.release(info["path"])
                     st.toast(f"✅ Created table: {tn}")
                     st.rerun()
                 except ValueError as ve:
@@ -449,8 +631,15 @@ with st.sidebar:
             # Drop
             if tc3.button("🗑️", key=f"tbl_drop_{t}", use_container_width=True):
                 try:
-                    # 1. Drop from database
-                    con.execute(f'DROP TABLE IF EXISTS "{t}"')
+                    # 1. Drop from database (partitioned tables are views over Parquet)
+                    if is_partitioned(con, t):
+                        drop_partitioned_table(con, t)
+                    else:
+                        con.execute(f'DROP TABLE IF EXISTS "{t}"')
+                    forget_table(con, t)
+                    drop_key_sets(con, t)
+                    drop_sketches(con, t)
+                    drop_profiles(con, t)
                     
                     # 2. Clean up backend storage (data/ folder)
                     if os.path.exists("data"):
@@ -468,11 +657,10 @@ with st.sidebar:
     except Exception as e_list:
         st.error(f"⚠️ Table list could not be loaded: {e_list}")
 
-# --- Main Workspace ---
-
-# 1. Schema Editor
-if st.session_state.editing_file:
-    fn = st.session_state.editing_file
+# Tools are fragments: their widgets rerun only the tool; actions that change what
+# the workspace shows (ingest, save, close) call st.rerun() for a full app run.
+@st.fragment
+def render_schema_editor(fn):
     info = st.session_state.pending_files[fn]
     st.markdown(f"## 🛠️ Schema Editor: {fn}")
     with st.container():
@@ -488,6 +676,13 @@ if st.session_state.editing_file:
         for i, c in enumerate(info["columns"]):
             with cols[i % 3]: renames[c] = st.text_input(c, value=c, key=f"ren_{fn}_{c}")
             
+        st.write("**Partitioning** (for very large files)")
+        pc1, pc2 = st.columns(2)
+        part_col = pc1.selectbox("Partition by", ["(none)"] + info["columns"], key=f"part_{fn}",
+                                 help="Writes a hive-partitioned Parquet tree; filters on the key skip other partitions")
+        part_grain = pc2.selectbox("Granularity", list(GRANULARITIES), key=f"grain_{fn}",
+                                   disabled=(part_col == "(none)"), help="Use day/month/year for date or timestamp columns")
+        
         st.divider()
         rc1, rc2 = st.columns(2)
         if rc1.button("🚀 Ingest Now", use_container_width=True, type="primary"):
@@ -495,32 +690,39 @@ if st.session_state.editing_file:
                 # Validate table name
                 validate_table_name(t_target)
                 
-                # 1. Create table with renames in DuckDB (using parameterized query)
+                if part_col != "(none)":
+                    with st.spinner(f"Writing partitions of {t_target} by {part_col}..."):
+                        # The upload leaves data/ with its Parquet tree, or live ingestion would load it again
+                        ingest_partitioned(con, info["path"], t_target, part_col, part_grain, renames, move_source=True)
+                    del st.session_state.pending_files[fn]
+                    if folder_watcher:
+                        folder_watcher.release(info["path"])
+                    st.session_state.editing_file = None
+                    st.toast(f"✨ {t_target} ingested as {len(list_partitions(con, t_target))} partitions!")
+                    st.rerun()
+                
+                # 1. Load with renames into a staging table, index it and swap it in atomically;
+                #    on failure the previous table and its indexes are untouched
                 expr = ", ".join([f'"{old}" AS "{new}"' for old, new in renames.items()])
-                safe_execute(con, f'CREATE OR REPLACE TABLE "{t_target}" AS SELECT {expr} FROM read_csv_auto(?)', [info["path"]])
+                with st.spinner(f"Loading {t_target}..."):
+                    with staged_table(con, t_target) as staging:
+                        con.execute(f'CREATE TABLE "{staging}" AS SELECT {expr} FROM read_csv_auto(?)', [info["path"]])
                 
                 # Analyze for query optimization
                 safe_execute(con, f'ANALYZE "{t_target}"')
                 
-                # 2. Persist to backend CSV (optional - table is already in DB)
-                os.makedirs("data", exist_ok=True)
-                target_path = os.path.join("data", f"{t_target}.csv")
-                # COPY doesn't support parameters, but t_target is validated
-                safe_execute(con, f'COPY "{t_target}" TO \'{target_path}\' (HEADER, DELIMITER \',\')')
+                # 2. Persist to backend CSV (optional - table is already in DB); written to a
+                #    temporary file and renamed, so a failed export never leaves a partial CSV
+                target_path = export_table_csv(con, t_target, os.path.join("data", f"{t_target}.csv"))
+                forget_table(con, t_target)
+                record_ingested_file(con, t_target, target_path, mode="export")
                 
-                # 3. Auto-indexing for performance
-                for old, new in renames.items():
-                    col_low = new.lower().replace(" ", "_")
-                    if any(key in col_low for key in ["id", "num", "phone", "email", "code", "key"]):
-                        try:
-                            safe_execute(con, f'CREATE INDEX IF NOT EXISTS idx_{t_target}_{col_low} ON "{t_target}"("{new}")')
-                        except Exception:
-                            pass  # Index creation is optional
-                
-                # 4. Cleanup session state
+                # 3. Cleanup session state
                 from versioning import save_schema_version
                 save_schema_version(con, t_target)
                 del st.session_state.pending_files[fn]
+                if folder_watcher:
+                    folder_watcher.release(info["path"])
                 st.session_state.editing_file = None
                 st.toast(f"✨ {t_target} ingested and optimized for performance!")
                 st.rerun()
@@ -535,8 +737,9 @@ if st.session_state.editing_file:
             st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
 
-# 3. Mini App: Common Value Finder
-elif st.session_state.active_tool == "common_finder":
+
+@st.fragment
+def render_common_finder():
     st.markdown("## 🤝 Smart Common Value Finder")
     st.caption("Automatically detects common columns and finds overlapping records between two datasets.")
     
@@ -555,42 +758,107 @@ elif st.session_state.active_tool == "common_finder":
                     cols1 = [c[0] for c in con.execute(f'DESCRIBE "{t1}"').fetchall()]
                     cols2 = [c[0] for c in con.execute(f'DESCRIBE "{t2}"').fetchall()]
                     
-                    # Auto-detection: find exact matches
+                    # Auto-detection reads what is already known: the ranking asked for below,
+                    # else the join graph kept by background discovery, else exact name matches.
+                    # Nothing here scans a table or rebuilds sketches on a rerun.
+                    rank_key = (t1, table_fingerprint(con, t1), t2, table_fingerprint(con, t2))
+                    ranked = st.session_state.get("cf_ranked", {}).get(rank_key)
+                    best = None
+                    if ranked:
+                        best = (ranked[0][0], ranked[0][1], ranked[0][3]["containment"])
+                    else:
+                        for edge in join_edges(con, t1, limit=1000):  # Best first
+                            if edge["from_table"] == t1 and edge["to_table"] == t2:
+                                best = (edge["from_column"], edge["to_column"], edge["containment"])
+                            elif edge["from_table"] == t2 and edge["to_table"] == t1:
+                                best = (edge["to_column"], edge["from_column"], edge["containment"])
+                            if best:
+                                break
                     common_names = list(set(cols1) & set(cols2))
-                    default_col = common_names[0] if common_names else cols1[0]
+                    if best:
+                        default_a, default_b = best[0], best[1]
+                    else:
+                        default_a = default_b = common_names[0] if common_names else cols1[0]
                     
                     st.write("---")
                     st.write("🔍 **Mapping Configuration**")
-                    if common_names:
-                        st.success(f"Auto-detected common column: `{default_col}`")
+                    if best:
+                        st.success(f"Likely join columns: `{default_a}` ↔ `{default_b}` (~{best[2]:.0%} value containment)")
+                    elif common_names:
+                        st.success(f"Auto-detected common column: `{default_a}`")
                     
                     mcol1, mcol2 = st.columns(2)
-                    c1 = mcol1.selectbox(f"Column in {t1}", cols1, index=cols1.index(default_col) if default_col in cols1 else 0, key="cf_col1")
-                    c2 = mcol2.selectbox(f"Column in {t2}", cols2, index=cols2.index(default_col) if default_col in cols2 else 0, key="cf_col2")
+                    keys1 = mcol1.multiselect(f"Key column(s) in {t1}", cols1, default=[default_a] if default_a in cols1 else cols1[:1], key="cf_col1")
+                    keys2 = mcol2.multiselect(f"Key column(s) in {t2}", cols2, default=[default_b] if default_b in cols2 else cols2[:1], key="cf_col2")
+                    st.caption("Select several columns (in matching order) to compare composite keys.")
+                    cf_mode = st.radio("Mode", ["Exact", "Approximate (sketches)"], horizontal=True, key="cf_mode",
+                                       help="Approximate mode answers in constant time from per-column HyperLogLog/MinHash sketches")
+                    
+                    with st.expander("🧠 Rank likely join columns"):
+                        if st.button("Analyze column overlap", key="cf_rank", use_container_width=True):
+                            with st.spinner("Building column sketches (one scan per table, then cached)..."):
+                                with QUERY_ADMISSION.admit("batch", st.session_state.user_id):
+                                    ranked = rank_join_candidates(con, t1, t2, top=10)
+                            st.session_state.setdefault("cf_ranked", {})[rank_key] = ranked  # Defaults above on later reruns
+                        if ranked:
+                            import pandas as pd
+                            st.dataframe(pd.DataFrame(
+                                [(a, b, f"{e['containment']:.1%}", f"{e['jaccard']:.1%}", f"{e['distinct_a']:,.0f}", f"{e['distinct_b']:,.0f}")
+                                 for a, b, _, e in ranked],
+                                columns=[f"{t1} column", f"{t2} column", "containment", "jaccard", "distinct A", "distinct B"]
+                            ), use_container_width=True, hide_index=True)
                     
                     if st.button("🚀 Find Common Values", type="primary", use_container_width=True):
-                        query = f"""
-                        SELECT count(*) as overlap_count 
-                        FROM "{t1}" 
-                        WHERE "{c1}" IN (SELECT "{c2}" FROM "{t2}")
-                        """
-                        t0 = datetime.now()
-                        result = con.execute(query).df()
-                        duration = (datetime.now() - t0).total_seconds()
-                        
-                        count = result.iloc[0, 0]
-                        st.balloons()
-                        
+                        if len(keys1) != len(keys2) or not keys1:
+                            st.error("Pick the same number of key columns on both sides.")
+                        elif cf_mode != "Exact":
+                            if len(keys1) > 1:
+                                st.info("Sketches are per column; estimating on the first key pair only.")
+                            t0 = datetime.now()
+                            est = estimate_overlap(con, t1, keys1[0], t2, keys2[0])
+                            st.session_state.cf_estimate = {"pair": (t1, keys1[0], t2, keys2[0]), "est": est,
+                                                            "seconds": (datetime.now() - t0).total_seconds()}
+                        else:
+                            with st.spinner("Comparing key sets (cached per table version)..."), \
+                                    QUERY_ADMISSION.admit("batch", st.session_state.user_id):
+                                st.session_state.cf_result = {
+                                    "t1": t1, "t2": t2, "keys1": keys1, "keys2": keys2,
+                                    "stats": compare_keys(con, t1, keys1, t2, keys2)
+                                }
+                    
+                    ce = st.session_state.get("cf_estimate")
+                    if cf_mode != "Exact" and ce and ce["pair"] == (t1, keys1[0] if keys1 else None, t2, keys2[0] if keys2 else None):
+                        e = ce["est"]
+                        st.markdown("### Estimated Results")
+                        k1, k2, k3 = st.columns(3)
+                        k1.metric("Common values (est.)", f"~{e['overlap']:,.0f}", help=f"95% range {e['overlap_low']:,.0f} – {e['overlap_high']:,.0f}")
+                        k2.metric(f"Distinct in {t1}", f"~{e['distinct_a']:,.0f}", help=f"±{e['distinct_error']:.1%}")
+                        k3.metric(f"Distinct in {t2}", f"~{e['distinct_b']:,.0f}", help=f"±{e['distinct_error']:.1%}")
+                        st.markdown(f"""
+                        - **Jaccard similarity**: `{e['jaccard']:.3f}` (95% range {e['jaccard_low']:.3f} – {e['jaccard_high']:.3f})
+                        - **Overlap range**: `{e['overlap_low']:,.0f} – {e['overlap_high']:,.0f}` distinct values
+                        - **Execution Time**: `{ce['seconds']:.4f}s` (from sketches; run Exact mode for precise counts)
+                        """)
+                    
+                    cf = st.session_state.get("cf_result")
+                    if cf_mode == "Exact" and cf and (cf["t1"], cf["t2"], cf["keys1"], cf["keys2"]) == (t1, t2, keys1, keys2):
+                        r = cf["stats"]
+                        st.markdown("### Results")
+                        k1, k2, k3 = st.columns(3)
+                        k1.metric("Common keys", f"{r['common_keys']:,}")
+                        k2.metric(f"Only in {t1}", f"{r['a_only_keys']:,}")
+                        k3.metric(f"Only in {t2}", f"{r['b_only_keys']:,}")
                         st.markdown(f"""
-                        ### Results
-                        - **Common Records Found**: `{count:,}`
-                        - **Execution Time**: `{duration:.4f}s`
+                        - **Common Records Found** (rows of `{t1}` with a match): `{r['a_rows_matched']:,}`
+                        - **Rows of `{t2}` with a match**: `{r['b_rows_matched']:,}`
+                        - **Join output rows**: `{r['join_rows']:,}` • relationship `{r['relationship']}` (max {r['max_multiplicity_a']:,} × {r['max_multiplicity_b']:,} rows per key)
+                        - **Execution Time**: `{r['seconds']:.4f}s` {"⚡ cached" if r['cached'] else ""}
                         """)
                         
                         # Add to notebook option
                         if st.button("📓 Add this finding to Notebook", use_container_width=True):
-                            nb_query = f"-- Common values between {t1}.{c1} and {t2}.{c2}\n"
-                            nb_query += f"SELECT * FROM \"{t1}\"\nWHERE \"{c1}\" IN (SELECT \"{c2}\" FROM \"{t2}\")\nLIMIT 100;"
+                            nb_query = f"-- Common values between {t1}({', '.join(keys1)}) and {t2}({', '.join(keys2)})\n"
+                            nb_query += overlap_rows_sql(t1, keys1, t2, keys2)
                             st.session_state.notebooks[st.session_state.current_notebook].append({
                                 "id": datetime.now().microsecond,
                                 "query": nb_query,
@@ -609,9 +877,9 @@ elif st.session_state.active_tool == "common_finder":
     except Exception as e:
         st.error(f"Error in Tool: {e}")
 
-# 2. Table Manager
-elif st.session_state.managing_table:
-    tn = st.session_state.managing_table
+
+@st.fragment
+def render_table_manager(tn):
     st.markdown(f"## ⚙️ Manage Table: {tn}")
     try:
         c_info = safe_execute(con, f'DESCRIBE "{tn}"').fetchall()
@@ -620,46 +888,55 @@ elif st.session_state.managing_table:
             st.markdown('<div class="table-container">', unsafe_allow_html=True)
             st.subheader("Preview")
             st.dataframe(p_data, use_container_width=True, hide_index=True)
+            partitioned = is_partitioned(con, tn)
+            if partitioned:
+                parts = list_partitions(con, tn)
+                st.caption(f"🧩 Partitioned table: {len(parts)} Parquet partitions (filters on the key read only matching partitions)")
+                import pandas as pd
+                st.dataframe(pd.DataFrame(parts, columns=["partition", "rows", "path"]), use_container_width=True, hide_index=True)
             st.divider()
             
             updates = []
             for i, ci in enumerate(c_info):
                 cn = ci[0]
-                mc1, mc2, mc3, mc4 = st.columns([0.1, 0.4, 0.3, 0.2])
+                mc1, mc2, mc3, mc4, mc5 = st.columns([0.08, 0.32, 0.25, 0.15, 0.2])
                 mc1.write(f"#{i+1}")
                 m_name = mc2.text_input("Name", value=cn, key=f"mname_{tn}_{cn}")
-                m_keep = mc3.checkbox("Keep", value=True, key=f"mkeep_{tn}_{cn}")
-                m_p = mc4.number_input("Pos", value=i, min_value=0, key=f"mpos_{tn}_{cn}")
-                if m_keep: updates.append({"old": cn, "new": m_name, "pos": m_p})
+                m_type = mc3.text_input("Type", value=ci[1], key=f"mtype_{tn}_{cn}")
+                m_keep = mc4.checkbox("Keep", value=True, key=f"mkeep_{tn}_{cn}")
+                m_p = mc5.number_input("Pos", value=i, min_value=0, key=f"mpos_{tn}_{cn}")
+                if m_keep: updates.append({"old": cn, "new": m_name, "type": m_type.strip(), "pos": m_p})
             
             st.divider()
             updates.sort(key=lambda x: x["pos"])
+            plan = plan_schema_edit([(ci[0], ci[1]) for ci in c_info], updates)
+            st.caption(f"Planned: {describe_plan(plan)}" + (" · view redefinition only, casts apply at query time" if partitioned else ""))
+            export_csv = st.checkbox("Also export the table to data/ as CSV", value=False, disabled=partitioned,
+                                     help="Full rewrite; only needed to hand the edited table to other tools")
+            allow_nulls = bool(plan["retype"]) and not partitioned and st.checkbox(
+                "Allow values that do not convert to become NULL", value=False, key=f"mnulls_{tn}",
+                help="Otherwise a type change that cannot convert every value is refused"
+            )
             mc_a, mc_b = st.columns(2)
             if mc_a.button("💾 Save Changes", use_container_width=True, type="primary"):
                 try:
-                    # 1. Rebuild table with new schema in session
-                    sel = ", ".join([f'"{u["old"]}" AS "{u["new"]}"' for u in updates])
-                    safe_execute(con, f'CREATE TABLE "{tn}_new" AS SELECT {sel} FROM "{tn}"')
-                    safe_execute(con, f'DROP TABLE IF EXISTS "{tn}"')
-                    safe_execute(con, f'ALTER TABLE "{tn}_new" RENAME TO "{tn}"')
+                    # 1. Catalog-level edits (ALTER TABLE / view redefinition), one transaction
+                    apply_schema_edit(con, tn, updates, allow_nulls=allow_nulls)
                     
-                    # Analyze for query optimization
-                    safe_execute(con, f'ANALYZE "{tn}"')
-                    
-                    # 2. Sync to backend file storage
-                    os.makedirs("data", exist_ok=True)
-                    target_path = os.path.join("data", f"{tn}.csv")
-                    # COPY doesn't support parameters, but tn is from existing table name (safe)
-                    safe_execute(con, f'COPY "{tn}" TO \'{target_path}\' (HEADER, DELIMITER \',\')')
+                    # 2. Persist incrementally: the WAL is folded into the database file
+                    if not partitioned:
+                        safe_execute(con, "CHECKPOINT")
+                    if export_csv:
+                        target_path = export_table_csv(con, tn, os.path.join("data", f"{tn}.csv"))
+                        forget_table(con, tn)
+                        record_ingested_file(con, tn, target_path, mode="export")
                     
                     # 3. High-Performance Indexing (Auto-Detected)
-                    for u in updates:
-                        col = u["new"].lower().replace(" ", "_")
-                        if any(key in col for key in ["id", "num", "phone", "email", "code", "key"]):
-                            try:
-                                safe_execute(con, f'CREATE INDEX IF NOT EXISTS idx_{tn}_{col} ON "{tn}"("{u["new"]}")')
-                            except Exception:
-                                pass  # Index creation is optional
+                    if not partitioned:
+                        try:
+                            create_auto_indexes(con, tn)
+                        except Exception:
+                            pass  # Index creation is optional
                     
                     st.session_state.managing_table = None
                     st.toast(f"✅ Changes & Performance Indexes persisted for: {tn}")
@@ -676,6 +953,21 @@ elif st.session_state.managing_table:
             st.markdown('</div>', unsafe_allow_html=True)
     except Exception as e: st.error(f"Error: {e}")
 
+
+# --- Main Workspace ---
+
+# 1. Schema Editor
+if st.session_state.editing_file:
+    render_schema_editor(st.session_state.editing_file)
+
+# 3. Mini App: Common Value Finder
+elif st.session_state.active_tool == "common_finder":
+    render_common_finder()
+
+# 2. Table Manager
+elif st.session_state.managing_table:
+    render_table_manager(st.session_state.managing_table)
+
 # 3. Notebooks (Default)
 else:
     st.markdown(f'<div class="notebook-header"><h1 style="margin:0;">📓 {st.session_state.current_notebook}</h1></div>', unsafe_allow_html=True)
@@ -684,6 +976,14 @@ else:
     status_text = "LIVE: READ-WRITE" if not st.session_state.read_only else "STANDBY: READ-ONLY"
     st.markdown(f'<div class="status-badge {status_class}">{status_text}</div>', unsafe_allow_html=True)
     
+    # Shared query queue (all sessions of this server)
+    q_metrics = QUERY_ADMISSION.metrics()
+    if any(m["running"] or m["queued"] for m in q_metrics.values()):
+        st.caption("🚦 " + " · ".join(f"{p}: {m['running']} running, {m['queued']} queued" for p, m in q_metrics.items()))
+    s_stats = statement_stats()
+    if s_stats["hits"]:
+        st.caption(f"🧠 Plan cache: {s_stats['hit_rate']:.0%} hit rate ({s_stats['hits']:,} reused statements)")
+    
     n_col1, n_col2, n_col_s = st.columns([0.15, 0.15, 0.7])
     if n_col1.button("➕ Add Cell", key="nb_add_main", use_container_width=True):
         add_cell()
@@ -695,13 +995,13 @@ else:
     st.markdown('<div class="progress-styled"></div>', unsafe_allow_html=True)
     
     # --- Autocomplete Engine (Optimized with longer cache) ---
-    @st.cache_data(ttl=300, show_spinner=False)  # Cache for 5 minutes instead of 5 seconds
-    def get_sql_suggestions():
+    @st.cache_data(ttl=300, show_spinner=False)  # Cache for 5 minutes; a new catalog_version invalidates it
+    def get_sql_suggestions(catalog_version, join_graph_version):
         try:
             # 1. Fetch all table names
-            tables = [t[0] for t in safe_execute(con, "SHOW TABLES").fetchall()]
+            tables = [t[0] for t in safe_execute(con, "SHOW TABLES", priority="background").fetchall()]
             # 2. Fetch all column names across all tables
-            columns = [c[0] for c in safe_execute(con, "SELECT DISTINCT column_name FROM information_schema.columns").fetchall()]
+            columns = [c[0] for c in safe_execute(con, "SELECT DISTINCT column_name FROM information_schema.columns", priority="background").fetchall()]
             
             # 3. Core SQL Keywords
             sql_keywords = [
@@ -714,16 +1014,22 @@ else:
             # 4. Custom Macros
             macros = ["@top_users", "@daily_agg"]
             
+            # 5. Join conditions from the discovered join graph
+            joins = [join_condition(e) for e in join_edges(con, limit=200)] if join_discovery else []
+            
             # Combine, deduplicate, and sort
-            suggestions = list(set(tables + columns + sql_keywords + macros))
+            suggestions = list(set(tables + columns + sql_keywords + macros + joins))
             return sorted(suggestions)
         except Exception as e:
             return ["SELECT", "FROM", "WHERE", "LIMIT"]
 
-    suggestions = get_sql_suggestions()
+    suggestions = get_sql_suggestions(catalog_version, join_graph_version)
     
-    active_cells = get_active_cells()
-    for i, cell in enumerate(active_cells):
+    @st.fragment
+    def render_cell(i, cell):
+        """One notebook cell; editing, running or paging it reruns only this function"""
+        from streamlit_ace import st_ace  # Deferred: warmed in the background at server start
+        active_cells = get_active_cells()
         with st.container():
             st.markdown('<div class="table-container">', unsafe_allow_html=True)
             st.markdown(f'<div class="cell-index">[{i+1}]</div>', unsafe_allow_html=True)
@@ -750,37 +1056,103 @@ else:
             
             if d_now: delete_cell(i)
             
+            preview_mode = acol3.toggle(
+                "🔬 Preview on samples", key=f"preview_{st.session_state.current_notebook}_{cell['id']}",
+                help="Run against small samples of large tables; row counts are estimated for the full data"
+            )
+            full_now = st.session_state.get(f"full_btn_{st.session_state.current_notebook}_{cell['id']}", False)
+            
             active_cells[i]["query"] = c_query
-            do_run = r_now or (c_query != cell.get("last_run_query") and c_query.strip() != "")
+            # A run still in flight is polled on fragment reruns until it finishes,
+            # unless RUN or an edit since then supersedes it (submit() cancels it)
+            pending = active_cells[i].get("pending_run")
+            if pending and (r_now or full_now or c_query != pending["query"] or preview_mode != pending["preview_mode"]):
+                pending = None
+            active_cells[i].pop("pending_run", None)
+            do_run = pending is not None or r_now or full_now or (c_query.strip() != "" and (
+                c_query != cell.get("last_run_query") or preview_mode != cell.get("preview_toggle", False)
+            ))
+            
+            from macros import expand_macros
+            if do_run and not (pending or r_now or full_now):
+                # Edits only start a run once the SQL parses and binds; drafts stay put
+                draft_error = st.session_state.cell_scheduler.check(expand_macros(c_query))
+                if draft_error:
+                    do_run = False
+                    acol3.caption(f"✏️ Draft not run: {draft_error.splitlines()[0]}")
             
             if do_run:
-                from macros import expand_macros
                 try:
-                    # Validate query
-                    validate_sql_query(c_query)
-                    p_query = expand_macros(c_query)
+                    if pending:
+                        p_query, cube, preview = pending["p_query"], pending["cube"], pending["preview"]
+                    else:
+                        # Validate query
+                        validate_sql_query(c_query)
+                        p_query = expand_macros(c_query, con)
+                        # Aggregates a rollup cube covers read the cube (exact, so never previewed);
+                        # preview runs read table samples. Both are cached under the rewritten SQL.
+                        cube = route_to_cube(con, p_query)
+                        preview = preview_sql(con, p_query) if preview_mode and not full_now and not cube else None
+                    run_query = cube["sql"] if cube else preview["sql"] if preview else p_query
                     
                     # Query result caching
-                    query_hash = create_query_hash(p_query)
+                    query_hash = create_query_hash(run_query)
                     cache_key = f"query_result_{query_hash}"
                     
                     # Check cache first
-                    if cache_key in st.session_state and st.session_state[cache_key].get("query") == p_query:
+                    cached_result = None
+                    if not pending and cache_key in st.session_state and st.session_state[cache_key].get("query") == run_query:
                         cached_result = st.session_state[cache_key]
                         res_df = cached_result["data"]
                         dur = cached_result["time"]
                         st.toast("⚡ Result from cache!", icon="⚡")
-                    else:
-                        # Execute query
+                    reused = None if cached_result or pending else st.session_state.semantic_cache.answer(con, run_query)
+                    if reused:
+                        # A filter, projection, shorter LIMIT or roll-up of an earlier result
                         t0 = datetime.now()
-                        result = safe_execute(con, p_query)
-                        res_df = result.df()
+                        cached_result = reused
+                        res_df = st.session_state.result_store.wrap(reused["table"])
+                        dur = (datetime.now() - t0).total_seconds()
+                        st.toast("♻️ Answered from an earlier result", icon="♻️")
+                    elif not cached_result:
+                        if pending:
+                            run, t0, signature_before = pending["run"], pending["t0"], pending["signature"]
+                        else:
+                            # Execute query
+                            t0 = datetime.now()
+                            signature_before = catalog_signature(con)
+                            # DuckDB -> Arrow directly on the cell's own cursor; a newer edit of
+                            # this cell interrupts it. RUN skips the debounce and always re-runs.
+                            run = st.session_state.cell_scheduler.submit(
+                                f"{st.session_state.current_notebook}_{cell['id']}", run_query,
+                                partial(fetch_cell_result, user=st.session_state.user_id, pool=query_pool),
+                                debounce=0 if r_now or full_now else None, force=r_now or full_now
+                            )
+                        if not run.wait(RUN_POLL_SECONDS):
+                            # Not done yet (debounce or a long scan): rerun just this cell to
+                            # check again instead of holding the script until it finishes
+                            active_cells[i]["pending_run"] = {
+                                "run": run, "t0": t0, "signature": signature_before, "query": c_query,
+                                "preview_mode": preview_mode, "p_query": p_query, "cube": cube, "preview": preview,
+                            }
+                            acol3.caption(f"⏳ {run.status.capitalize()}...")
+                            st.rerun(scope="fragment")
+                        if run.status == "cancelled":
+                            raise RuntimeError("Run cancelled: superseded by a newer version of this cell")
+                        if run.error:
+                            raise run.error
+                        # Large results are spilled to a memory-mapped file and reloaded when viewed
+                        res_df = st.session_state.result_store.wrap(run.result)
                         dur = (datetime.now() - t0).total_seconds()
+                        if is_read_only_query(con, run_query):
+                            st.session_state.semantic_cache.add(con, run_query, res_df)
+                        else:
+                            st.session_state.semantic_cache.clear()  # Earlier results may predate this write
                         
                         # Cache the result (limit cache size)
                         if len(st.session_state) < 50:  # Limit cache entries
                             st.session_state[cache_key] = {
-                                "query": p_query,
+                                "query": run_query,
                                 "data": res_df,
                                 "time": dur
                             }
@@ -789,8 +1161,18 @@ else:
                         "result": res_df, 
                         "error": None, 
                         "last_run_query": c_query, 
-                        "meta": {"time": dur, "rows": len(res_df), "query_hash": query_hash}
+                        "preview_toggle": preview_mode,
+                        "meta": {"time": dur, "rows": res_df.num_rows, "query_hash": query_hash, "sql": p_query,
+                                 "reused_from": reused["source"] if reused else None,
+                                 "cube": cube["cube"] if cube else None,
+                                 "preview": {
+                                     "tables": {t: info["sample_rows"] / info["population"] for t, info in preview["samples"].items()},
+                                     "estimate": estimate_rows(con, p_query, preview),
+                                 } if preview else None}
                     })
+                    # DDL in a cell changes what the sidebar and other cells show
+                    if not cached_result and catalog_signature(con) != signature_before:
+                        st.rerun()
                 except ValueError as ve:
                     er = str(ve)
                     active_cells[i].update({"result": "ERROR", "last_run_query": c_query, "error": {"msg": er}})
@@ -807,19 +1189,35 @@ else:
 
             if active_cells[i]["result"] is not None:
                 res = active_cells[i]["result"]
-                if isinstance(res, pd.DataFrame):
+                spilled = isinstance(res, ResultRef) and res.spilled
+                if isinstance(res, ResultRef):
+                    res = res.table()
+                if isinstance(res, pa.Table):
                     meta = active_cells[i]["meta"]
                     total_rows = meta['rows']
                     st.divider()
                     
                     # Show execution info
                     cache_indicator = "⚡" if meta.get("query_hash") and f"query_result_{meta['query_hash']}" in st.session_state else ""
-                    st.caption(f"✨ Executed in {meta['time']:.4f}s • {total_rows:,} rows {cache_indicator}")
+                    spill_indicator = "💾 on disk" if spilled else ""
+                    reuse_indicator = "♻️ from an earlier result" if meta.get("reused_from") else ""
+                    cube_indicator = f"🧊 from rollup cube {meta['cube']}" if meta.get("cube") else ""
+                    st.caption(f"✨ Executed in {meta['time']:.4f}s • {total_rows:,} rows {cache_indicator} {reuse_indicator} {cube_indicator} {spill_indicator}")
+                    if meta.get("preview"):
+                        shares = ", ".join(f"{t} {share:.1%}" for t, share in meta["preview"]["tables"].items())
+                        est = meta["preview"]["estimate"]
+                        est_text = (
+                            f"~{est['rows']:,} rows on full data (95%: {est['low']:,}–{est['high']:,})" if est
+                            else "aggregates and joins computed on the sample, not scaled"
+                        )
+                        pcol1, pcol2 = st.columns([0.75, 0.25])
+                        pcol1.caption(f"🔬 Preview on samples ({shares}) • {est_text}")
+                        pcol2.button("▶ Run on full data", key=f"full_btn_{st.session_state.current_notebook}_{cell['id']}", use_container_width=True)
                     
                     # Pagination for large result sets
                     if total_rows > MAX_RESULT_ROWS:
                         st.warning(f"⚠️ Large result set ({total_rows:,} rows). Showing first {MAX_RESULT_ROWS:,} rows. Consider adding LIMIT to your query.")
-                        res_display = res.head(MAX_RESULT_ROWS)
+                        res_display = res.slice(0, MAX_RESULT_ROWS)
                     else:
                         res_display = res
                     
@@ -831,24 +1229,62 @@ else:
                             st.session_state[pagination_key] = 0
                         
                         page_num = st.session_state[pagination_key]
-                        page_data, _, total_pages = paginate_dataframe(res_display, page_num, PAGINATION_SIZE)
+                        page_data, _, total_pages = paginate_table(res_display, page_num, PAGINATION_SIZE)
                         
                         # Pagination controls
                         pag_col1, pag_col2, pag_col3 = st.columns([0.2, 0.6, 0.2])
                         with pag_col1:
                             if st.button("◀ Prev", key=f"prev_{cell['id']}", disabled=(page_num == 0)):
                                 st.session_state[pagination_key] = max(0, page_num - 1)
-                                st.rerun()
+                                st.rerun(scope="fragment")
                         with pag_col2:
                             st.caption(f"Page {page_num + 1} of {total_pages}")
                         with pag_col3:
                             if st.button("Next ▶", key=f"next_{cell['id']}", disabled=(page_num >= total_pages - 1)):
                                 st.session_state[pagination_key] = min(total_pages - 1, page_num + 1)
-                                st.rerun()
-                        
-                        st.dataframe(page_data, use_container_width=True, hide_index=True)
+                                st.rerun(scope="fragment")
                     else:
-                        st.dataframe(res_display, use_container_width=True, hide_index=True)
+                        page_data = res_display
+                    
+                    # Arrow page straight to the grid; repetitive strings travel dictionary-encoded
+                    page_data, ps = serialize_page(encode_page(page_data))
+                    st.dataframe(page_data, use_container_width=True, hide_index=True)
+                    st.caption(f"Page payload {ps['bytes'] / 1024:,.0f}KB (Arrow IPC, {ps['ms']:.1f}ms)")
+                    
+                    # Export: DuckDB streams the full result to disk; links stream it to the browser
+                    if meta.get("sql"):
+                        with st.expander("⬇️ Export full result"):
+                            ex1, ex2, ex3 = st.columns(3)
+                            ex_fmt = ex1.selectbox("Format", list(EXPORT_FORMATS), key=f"exfmt_{cell['id']}")
+                            ex_comp = ex2.selectbox("Compression", EXPORT_FORMATS[ex_fmt]["compression"], key=f"excomp_{cell['id']}")
+                            ex_split = ex3.number_input("Files", min_value=1, max_value=64, value=1, key=f"exsplit_{cell['id']}")
+                            ex_dir = st.text_input(
+                                "Subfolder", value="", key=f"exdir_{cell['id']}",
+                                help=f"Optional folder under {EXPORTS_DIR}/; exports are deleted after {EXPORT_MAX_AGE_DAYS} days"
+                            )
+                            if st.button("Export", key=f"export_{cell['id']}", use_container_width=True):
+                                bar = st.progress(0.0, text="Exporting...")
+                                try:
+                                    with QUERY_ADMISSION.admit("batch", st.session_state.user_id):
+                                        out = export_query(
+                                            con, meta["sql"],
+                                            new_export_path(f"{st.session_state.current_notebook}_{i+1}", ex_fmt, ex_comp, export_dir(ex_dir)),
+                                            ex_fmt, ex_comp, int(ex_split),
+                                            progress=lambda pct: bar.progress(min(pct, 100.0) / 100, text=f"Exporting... {pct:.0f}%")
+                                        )
+                                    names = [os.path.relpath(f, out["path"]) for f in out["files"]] if ex_split > 1 else [os.path.basename(out["path"])]
+                                    out["links"] = [(name, download_server.share(f)) for name, f in zip(names, out["files"])]
+                                    active_cells[i]["export"] = out
+                                except Exception as ex_err:
+                                    st.error(f"Export failed: {ex_err}")
+                            out = active_cells[i].get("export")
+                            if out:
+                                st.caption(f"{out['rows']:,} rows • {out['bytes'] / 1024 / 1024:,.1f}MB • {out['seconds']:.2f}s")
+                                st.code(out["path"], language=None)
+                                if len(out["links"]) == 1:
+                                    st.link_button("📥 Download", download_url(out["links"][0][1]), use_container_width=True)
+                                else:
+                                    st.markdown("\n".join(f"- [📥 {name}]({download_url(url)})" for name, url in out["links"]))
                 elif res == "ERROR":
                     e_obj = active_cells[i].get("error", {})
                     st.divider()
@@ -857,6 +1293,9 @@ else:
             
             st.markdown('</div>', unsafe_allow_html=True)
 
+    
+    for i, cell in enumerate(get_active_cells()):
+        render_cell(i, cell)
     st.divider()
     with st.expander("💡 Power User Tips"):
         st.markdown("- Press **Cmd + Enter** to run high-speed SQL queries.\n- Use **@macros** for complex aggregate snippets.")
@@ -4,11 +4,13 @@ Utility functions for validation, security, and performance optimization
 import re
 import hashlib
 import duckdb
+from admission import execute as admitted_execute
 
 # Configuration constants
 MAX_FILE_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
 MAX_RESULT_ROWS = 10000  # Maximum rows to display at once
 PAGINATION_SIZE = 1000  # Rows per page
+INTERNAL_SCHEMA = "_engine"  # Engine-managed tables, hidden from SHOW TABLES and the schema explorer
 
 def validate_table_name(name):
     """Validate table name is safe (SQL injection prevention)"""
@@ -20,6 +22,11 @@ def validate_table_name(name):
         raise ValueError(f"Table name too long (max 63 characters): {name}")
     return name
 
+def ensure_internal_schema(con):
+    """Create the schema that holds engine-managed tables (idempotent)"""
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {INTERNAL_SCHEMA}")
+    return INTERNAL_SCHEMA
+
 def validate_file_upload(file):
     """Validate uploaded file size and type"""
     if file.size > MAX_FILE_SIZE:
@@ -57,16 +64,16 @@ def create_query_hash(query):
     """Create a hash of the query for caching"""
     return hashlib.md5(query.encode()).hexdigest()
 
-def safe_execute(con, query, params=None):
+def safe_execute(con, query, params=None, priority="interactive", user=None):
     """
     Execute query with proper error handling and parameterization
-    Uses parameterized queries to prevent SQL injection
+    Uses parameterized queries to prevent SQL injection; runs once admitted in its
+    priority class (interactive, batch or background)
     """
     try:
-        if params:
-            return con.execute(query, params)
-        else:
-            return con.execute(query)
+        return admitted_execute(con, query, params, priority, user)
+    except TimeoutError:
+        raise
     except duckdb.Error as e:
         raise ValueError(f"Database error: {str(e)}")
     except Exception as e:
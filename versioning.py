@@ -1,28 +1,358 @@
 import os
+import re
 import json
+import hashlib
 from datetime import datetime
+from utils import INTERNAL_SCHEMA, ensure_internal_schema
+
+SCHEMAS_DIR = "schemas"  # Legacy per-ingest JSON files, imported by migrate_legacy_schema_files
+SCHEMA_VERSIONS_TABLE = f"{INTERNAL_SCHEMA}.schema_versions"
+SCHEMA_BLOBS_TABLE = f"{INTERNAL_SCHEMA}.schema_blobs"
+TABLE_VERSIONS_TABLE = f"{INTERNAL_SCHEMA}.table_versions"
+MIGRATIONS_TABLE = f"{INTERNAL_SCHEMA}.migrations"
+LEGACY_SCHEMA_MIGRATION = "legacy_schema_files"
+
+_table_change_listeners = []
+
+# Statement types that never change table data
+READ_ONLY_STATEMENTS = (
+    "SELECT", "EXPLAIN", "PRAGMA", "SET", "VARIABLE_SET", "TRANSACTION", "PREPARE", "ANALYZE", "LOAD",
+    "EXTENSION", "ATTACH", "DETACH", "EXPORT", "CALL", "RELATION", "LOGICAL_PLAN", "CREATE_FUNC", "VACUUM",
+)
+_NAME = r'((?:"(?:[^"]|"")+"|[A-Za-z_]\w*)(?:\s*\.\s*(?:"(?:[^"]|"")+"|[A-Za-z_]\w*))*)'
+# Statement type -> (pattern capturing the written table, whether a statement it misses may write any table)
+WRITE_TARGETS = {
+    "INSERT": (rf"\bINSERT\s+(?:OR\s+\w+\s+)?INTO\s+{_NAME}", True),
+    "UPDATE": (rf"\bUPDATE\s+{_NAME}", True),
+    "DELETE": (rf"\b(?:DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?)\s+{_NAME}", True),
+    "MERGE_INTO": (rf"\bMERGE\s+INTO\s+{_NAME}", True),
+    "COPY": (rf"\bCOPY\s+{_NAME}\s*(?:\([^)]*\)\s*)?FROM\b", False),  # COPY ... TO only reads
+    "CREATE": (rf"\bCREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP\w*\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{_NAME}", False),
+    "DROP": (rf"\bDROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?{_NAME}", False),
+    "ALTER": (rf"\bALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?{_NAME}", False),
+}
+
+
+def ensure_schema_catalog(con):
+    """Create the schema history tables and the (table, time) lookup index"""
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_BLOBS_TABLE} (
+            schema_hash VARCHAR PRIMARY KEY,
+            schema_json VARCHAR NOT NULL
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSIONS_TABLE} (
+            table_name VARCHAR NOT NULL,
+            schema_hash VARCHAR NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+    """)
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_schema_versions_lookup ON {SCHEMA_VERSIONS_TABLE}(table_name, created_at)")
+
+
+def describe_schema(con, relation):
+    """Schema of a table or query as a list of {column, type, nullable} dicts"""
+    schema_info = con.execute(f"DESCRIBE {relation}").fetchall()
+    return [{"column": r[0], "type": r[1], "nullable": r[2]} for r in schema_info]
+
+
+def schema_hash(schema):
+    return hashlib.md5(json.dumps(schema, separators=(",", ":")).encode()).hexdigest()
+
+
+def _record_version(con, table_name, schema, created_at):
+    digest = schema_hash(schema)
+    con.execute(
+        f"INSERT OR IGNORE INTO {SCHEMA_BLOBS_TABLE} VALUES (?, ?)",
+        [digest, json.dumps(schema, separators=(",", ":"))]
+    )
+    con.execute(f"INSERT INTO {SCHEMA_VERSIONS_TABLE} VALUES (?, ?, ?)", [table_name, digest, created_at])
+    return digest
 
-SCHEMAS_DIR = "schemas"
 
 def save_schema_version(con, table_name):
-    os.makedirs(SCHEMAS_DIR, exist_ok=True)
+    """
+    Record the current schema of a table.
+    A new version is only written when the schema hash differs from the latest one;
+    returns the schema hash.
+    """
     try:
-        schema_info = con.execute(f"DESCRIBE {table_name}").fetchall()
-        # Convert to list of dicts
-        schema_dict = [{"column": r[0], "type": r[1], "nullable": r[2]} for r in schema_info]
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{table_name}_{timestamp}.json"
-        
-        with open(os.path.join(SCHEMAS_DIR, filename), "w") as f:
-            json.dump(schema_dict, f, indent=4)
-            
-        return filename
+        ensure_schema_catalog(con)
+        schema = describe_schema(con, f'"{table_name}"')
+        digest = schema_hash(schema)
+        latest = con.execute(f"""
+            SELECT schema_hash FROM {SCHEMA_VERSIONS_TABLE}
+            WHERE table_name = ? ORDER BY created_at DESC LIMIT 1
+        """, [table_name]).fetchone()
+        if latest is None or latest[0] != digest:
+            _record_version(con, table_name, schema, datetime.now())
+        return digest
     except Exception as e:
         print(f"Error saving schema: {e}")
         return None
 
-def list_schema_versions():
+
+def list_schema_versions(con, table_name=None, limit=100):
+    """Schema history, newest first: list of (table_name, schema_hash, created_at)"""
+    ensure_schema_catalog(con)
+    where, params = ("WHERE table_name = ?", [table_name]) if table_name else ("", [])
+    return con.execute(f"""
+        SELECT table_name, schema_hash, created_at FROM {SCHEMA_VERSIONS_TABLE}
+        {where} ORDER BY created_at DESC LIMIT {int(limit)}
+    """, params).fetchall()
+
+
+def get_schema_version(con, table_name, at=None):
+    """Schema of a table as of `at` (latest when None), or None if unknown"""
+    ensure_schema_catalog(con)
+    params = [table_name] + ([at] if at else [])
+    row = con.execute(f"""
+        SELECT b.schema_json FROM {SCHEMA_VERSIONS_TABLE} v
+        JOIN {SCHEMA_BLOBS_TABLE} b USING (schema_hash)
+        WHERE v.table_name = ? {"AND v.created_at <= ?" if at else ""}
+        ORDER BY v.created_at DESC LIMIT 1
+    """, params).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def get_schema_by_hash(con, digest):
+    ensure_schema_catalog(con)
+    row = con.execute(f"SELECT schema_json FROM {SCHEMA_BLOBS_TABLE} WHERE schema_hash = ?", [digest]).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def diff_schemas(old, new):
+    """
+    Column-level diff of two schemas.
+    Returns {"added", "dropped", "retyped", "renamed"}; a dropped and an added column at
+    the same position with the same type are reported as a rename.
+    """
+    old_cols = {c["column"]: c for c in old}
+    new_cols = {c["column"]: c for c in new}
+    added = [c for c in new if c["column"] not in old_cols]
+    dropped = [c for c in old if c["column"] not in new_cols]
+    retyped = [
+        {"column": c["column"], "old_type": old_cols[c["column"]]["type"], "new_type": c["type"]}
+        for c in new if c["column"] in old_cols and old_cols[c["column"]]["type"] != c["type"]
+    ]
+
+    renamed = []
+    old_pos = {c["column"]: i for i, c in enumerate(old)}
+    new_pos = {c["column"]: i for i, c in enumerate(new)}
+    for d in list(dropped):
+        for a in added:
+            if old_pos[d["column"]] == new_pos[a["column"]] and d["type"] == a["type"]:
+                renamed.append({"old": d["column"], "new": a["column"], "type": a["type"]})
+                dropped.remove(d)
+                added.remove(a)
+                break
+
+    return {
+        "added": [{"column": c["column"], "type": c["type"]} for c in added],
+        "dropped": [{"column": c["column"], "type": c["type"]} for c in dropped],
+        "retyped": retyped,
+        "renamed": renamed,
+    }
+
+
+_INTEGER_WIDTHS = ["TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT"]
+_FLOAT_WIDTHS = ["FLOAT", "DOUBLE"]
+
+
+def is_widening(old_type, new_type):
+    """True if every value of old_type is representable in new_type without loss"""
+    old_type, new_type = old_type.upper(), new_type.upper()
+    if old_type == new_type or new_type == "VARCHAR":
+        return True
+    if old_type in _INTEGER_WIDTHS:
+        if new_type in _INTEGER_WIDTHS:
+            return _INTEGER_WIDTHS.index(new_type) >= _INTEGER_WIDTHS.index(old_type)
+        return new_type == "DOUBLE" or new_type.startswith("DECIMAL")
+    if old_type in _FLOAT_WIDTHS or old_type.startswith("DECIMAL"):
+        return new_type == "DOUBLE"
+    if old_type == "DATE":
+        return new_type.startswith("TIMESTAMP")
+    return False
+
+
+def classify_schema_change(stored, incoming):
+    """
+    Compare an incoming schema with a stored one.
+    Returns {"status": "match" | "compatible" | "break", "add": [...], "widen": [...]}:
+    compatible means the stored table can absorb the incoming rows after adding the
+    listed columns and widening the listed column types.
+    """
+    stored_cols = {c["column"]: c["type"] for c in stored}
+    incoming_cols = {c["column"]: c["type"] for c in incoming}
+    if [c["column"] for c in stored] == [c["column"] for c in incoming] and stored_cols == incoming_cols:
+        return {"status": "match", "add": [], "widen": []}
+
+    if any(col not in incoming_cols for col in stored_cols):
+        return {"status": "break", "add": [], "widen": []}  # Dropped columns are never absorbed silently
+
+    add, widen = [], []
+    for col, new_type in incoming_cols.items():
+        old_type = stored_cols.get(col)
+        if old_type is None:
+            add.append({"column": col, "type": new_type})
+        elif is_widening(new_type, old_type):
+            continue  # Incoming values fit the stored type; INSERT casts them
+        elif is_widening(old_type, new_type):
+            widen.append({"column": col, "old_type": old_type, "new_type": new_type})
+        else:
+            return {"status": "break", "add": [], "widen": []}
+    return {"status": "compatible", "add": add, "widen": widen}
+
+
+def diff_schema_versions(con, table_name, old_hash, new_hash=None):
+    """Diff two recorded versions of a table (new_hash defaults to the latest)"""
+    old = get_schema_by_hash(con, old_hash)
+    new = get_schema_by_hash(con, new_hash) if new_hash else get_schema_version(con, table_name)
+    if old is None or new is None:
+        raise ValueError(f"Unknown schema version for table: {table_name}")
+    return diff_schemas(old, new)
+
+
+def migrate_legacy_schema_files(con):
+    """Import JSON files from the old schemas/ directory into the catalog (once per database)"""
     if not os.path.exists(SCHEMAS_DIR):
-        return []
-    return sorted(os.listdir(SCHEMAS_DIR), reverse=True)
+        return 0
+    ensure_schema_catalog(con)
+    con.execute(f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (name VARCHAR PRIMARY KEY, ran_at TIMESTAMP)")
+    if con.execute(f"SELECT count(*) FROM {MIGRATIONS_TABLE} WHERE name = ?", [LEGACY_SCHEMA_MIGRATION]).fetchone()[0]:
+        return 0
+    imported = 0
+    for filename in sorted(os.listdir(SCHEMAS_DIR)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            table_name, day, clock = filename[:-5].rsplit("_", 2)
+            created_at = datetime.strptime(f"{day}_{clock}", "%Y%m%d_%H%M%S")
+            with open(os.path.join(SCHEMAS_DIR, filename)) as f:
+                schema = json.load(f)
+        except (ValueError, OSError) as e:
+            print(f"Skipping legacy schema file {filename}: {e}")
+            continue
+        # Like save_schema_version, an unchanged schema is not a new version; the same
+        # schema saved again after a change (A -> B -> A) is history and is kept
+        previous = con.execute(f"""
+            SELECT schema_hash FROM {SCHEMA_VERSIONS_TABLE}
+            WHERE table_name = ? AND created_at <= ? ORDER BY created_at DESC LIMIT 1
+        """, [table_name, created_at]).fetchone()
+        if previous and previous[0] == schema_hash(schema):
+            continue
+        _record_version(con, table_name, schema, created_at)
+        imported += 1
+    con.execute(f"INSERT INTO {MIGRATIONS_TABLE} VALUES (?, ?)", [LEGACY_SCHEMA_MIGRATION, datetime.now()])
+    return imported
+
+
+def subscribe_table_changes(callback):
+    """Call callback(table_name, version) whenever a table's data version is bumped"""
+    _table_change_listeners.append(callback)
+    return callback
+
+
+def unsubscribe_table_changes(callback):
+    if callback in _table_change_listeners:
+        _table_change_listeners.remove(callback)
+
+
+def _ensure_table_versions(con):
+    ensure_internal_schema(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def bump_table_version(con, table_name):
+    """Mark a table's data as changed; returns the new version"""
+    _ensure_table_versions(con)
+    version = get_table_version(con, table_name) + 1
+    con.execute(
+        f"INSERT OR REPLACE INTO {TABLE_VERSIONS_TABLE} VALUES (?, ?, ?)",
+        [table_name, version, datetime.now()]
+    )
+    for callback in list(_table_change_listeners):
+        try:
+            callback(table_name, version)
+        except Exception as e:
+            print(f"Table change listener failed: {e}")
+    return version
+
+
+def get_table_version(con, table_name):
+    _ensure_table_versions(con)
+    row = con.execute(f"SELECT version FROM {TABLE_VERSIONS_TABLE} WHERE table_name = ?", [table_name]).fetchone()
+    return row[0] if row else 0
+
+
+def get_table_versions(con):
+    _ensure_table_versions(con)
+    return dict(con.execute(f"SELECT table_name, version FROM {TABLE_VERSIONS_TABLE}").fetchall())
+
+
+def written_tables(con, sql):
+    """
+    Names of the tables the statements in `sql` write, or None when a statement may
+    write tables it does not name (e.g. EXECUTE, an INSERT behind a CTE)
+    """
+    try:
+        statements = con.extract_statements(sql)
+    except Exception:
+        return set()  # Does not parse, so it never ran
+    tables = set()
+    for statement in statements:
+        kind = statement.type.name
+        if kind in READ_ONLY_STATEMENTS:
+            continue
+        pattern, may_write_any = WRITE_TARGETS.get(kind, (None, True))
+        m = re.search(pattern, statement.query, re.IGNORECASE) if pattern else None
+        if m:
+            last = re.findall(r'"(?:[^"]|"")+"|[A-Za-z_]\w*', m.group(1))[-1]
+            tables.add(last[1:-1].replace('""', '"') if last.startswith('"') else last)
+        elif may_write_any:
+            return None
+    return tables
+
+
+def record_writes(con, sql):
+    """
+    Bump the data version of every table `sql` wrote (all tables when that cannot be
+    told), so fingerprint-keyed caches drop what DML made stale. Call after running it;
+    uses its own cursor, so a pending result on `con` stays readable. Returns the tables.
+    """
+    tables = written_tables(con, sql)
+    if tables == set():
+        return tables
+    cursor = con.cursor()
+    try:
+        stored = {r[0].lower(): r[0] for r in cursor.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main'"
+        ).fetchall()}
+        tables = set(stored.values()) if tables is None else {stored.get(t.lower(), t) for t in tables}
+        for table_name in sorted(tables):
+            bump_table_version(cursor, table_name)
+    finally:
+        cursor.close()
+    return tables
+
+
+def table_fingerprint(con, table_name):
+    """
+    Cheap change detector for caches keyed by table contents: the data version (bumped
+    by ingestion, schema edits and record_writes after cell/CLI DML) plus DuckDB's
+    storage row estimate (catches writes made outside the app).
+    """
+    version = get_table_version(con, table_name)
+    row = con.execute(
+        "SELECT estimated_size, column_count FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = ?",
+        [table_name]
+    ).fetchone()
+    return f"v{version}:{row[0]}:{row[1]}" if row else f"v{version}:view"
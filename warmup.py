@@ -0,0 +1,161 @@
+"""
+Cold-start pipeline
+Started by serve.py before Streamlit boots: the database is opened, cleaned and
+checkpointed, the catalog snapshot loaded and heavy UI modules imported on background
+threads while the server comes up, so the first session takes a ready connection.
+Each phase is timed; the timings travel with the readiness signal to the launcher.
+"""
+import importlib
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+DB_PATH = "metadata.db"
+DEFERRED_IMPORTS = ("pandas", "streamlit_ace")  # Imported lazily by the UI, warmed here
+TAKE_TIMEOUT = 60  # Seconds a session waits for the warm-up before opening the database itself
+
+_started = time.perf_counter()
+_timings = {}
+_lock = threading.Lock()
+_warmup = None
+
+
+@contextmanager
+def phase(name):
+    """Record how long the block took under `name`"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _timings[name] = time.perf_counter() - t0
+
+
+def record(name, seconds):
+    with _lock:
+        _timings[name] = seconds
+
+
+def timings():
+    """{phase: seconds} in the order phases finished"""
+    with _lock:
+        return dict(_timings)
+
+
+def format_timings(phases):
+    return ", ".join(f"{name} {seconds * 1000:,.0f}ms" for name, seconds in phases.items())
+
+
+def open_database(path=DB_PATH):
+    """
+    {"con", "read_only", "problem"}: the tuned session database; falls back to an
+    in-memory database with problem = ("warning" | "error", message)
+    """
+    from ddl import cleanup_staging
+
+    problem = None
+    with phase("open_db"):
+        try:
+            con, read_only = duckdb.connect(path, read_only=False), False
+        except duckdb.IOException as e:
+            con, read_only = duckdb.connect(":memory:"), True
+            problem = ("warning", f"Database file error: {e}. Using in-memory database.")
+        except Exception as e:
+            con, read_only = duckdb.connect(":memory:"), True
+            problem = ("error", f"Failed to connect to database: {e}")
+
+        # --- OPTIMIZED HARDWARE TUNING for 10GB+ files ---
+        con.execute("SET memory_limit='16GB'")  # Increased for 10GB files
+        con.execute("SET threads=8")  # More threads for large file processing
+        con.execute("SET preserve_insertion_order=false")
+        con.execute("SET max_temp_directory_size='500GB'")
+        con.execute("SET allocator_flush_threshold='256MB'")  # Increased for large files
+
+    if not read_only:
+        with phase("cleanup_staging"):
+            cleanup_staging(con)  # Leftovers of an interrupted load
+    with phase("checkpoint"):
+        con.execute("CHECKPOINT")  # Persist and compact
+    return {"con": con, "read_only": read_only, "problem": problem}
+
+
+class Warmup:
+    """Opens the database and loads the catalog on one thread, imports UI modules on another"""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.result = None
+        self.catalog = None  # (catalog_signature, load_catalog snapshot)
+        self._ready = threading.Event()
+        self._taken = False
+        threading.Thread(target=self._warm_database, name="warmup-db", daemon=True).start()
+        threading.Thread(target=self._warm_imports, name="warmup-imports", daemon=True).start()
+
+    def _warm_database(self):
+        from catalog import catalog_signature, load_catalog
+
+        try:
+            self.result = open_database(self.path)
+            cursor = self.result["con"].cursor()
+            with phase("catalog"):
+                self.catalog = (catalog_signature(cursor), load_catalog(cursor))
+            cursor.close()
+        except Exception as e:
+            print(f"Warm-up failed, sessions will open the database themselves: {e}")
+            self.result = None
+        finally:
+            record("warm_db_total", time.perf_counter() - _started)
+            self._ready.set()
+
+    def _warm_imports(self):
+        for module in DEFERRED_IMPORTS:
+            with phase(f"import_{module}"):
+                try:
+                    importlib.import_module(module)
+                except ImportError:
+                    pass
+
+    def take(self, timeout=TAKE_TIMEOUT):
+        """The warmed database for the first session that asks, else None"""
+        if not self._ready.wait(timeout):
+            return None
+        with _lock:
+            if self._taken or self.result is None:
+                return None
+            self._taken = True
+        return self.result
+
+
+def start_warmup(path=DB_PATH):
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup(path)
+    return _warmup
+
+
+def take_database(path=DB_PATH):
+    """The pre-warmed database when this process started a warm-up, else a freshly opened one"""
+    result = _warmup.take() if _warmup is not None else None
+    return result or open_database(path)
+
+
+def warm_catalog(signature):
+    """Catalog snapshot loaded during warm-up, if the catalog has not changed since"""
+    if _warmup is not None and _warmup.catalog and _warmup.catalog[0] == signature:
+        return _warmup.catalog[1]
+    return None
+
+
+def signal_ready(ready_port):
+    """Tell the launcher listening on `ready_port` that the server accepts connections"""
+    record("server_ready", time.perf_counter() - _started)
+    message = json.dumps({"ready": True, "timings": timings()}) + "\n"
+    try:
+        with socket.create_connection(("127.0.0.1", ready_port), timeout=5) as s:
+            s.sendall(message.encode())
+    except OSError as e:
+        print(f"Could not signal readiness to the launcher: {e}")
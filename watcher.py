@@ -0,0 +1,224 @@
+"""
+Watch-folder ingestion service for data/
+Uses filesystem events (inotify on Linux, FSEvents on macOS via watchdog) when available
+and falls back to polling. Files are ingested once they stop changing.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ingestion import ingest_csv
+from versioning import subscribe_table_changes, unsubscribe_table_changes
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+SETTLE_SECONDS = 2.0  # A file must be unchanged this long before it is ingested
+POLL_INTERVAL = 1.0
+MAX_CONCURRENT_INGESTS = 2
+IGNORED_SUFFIXES = (".part", ".tmp", ".crdownload", ".partial")
+
+
+def _is_candidate(path):
+    name = os.path.basename(path)
+    return name.lower().endswith(".csv") and not name.startswith(".") and not name.endswith(IGNORED_SUFFIXES)
+
+
+if WATCHDOG_AVAILABLE:
+    class _EventHandler(FileSystemEventHandler):
+        def __init__(self, watcher):
+            self.watcher = watcher
+
+        def on_created(self, event):
+            if not event.is_directory:
+                self.watcher.notify(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                self.watcher.notify(event.src_path)
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                self.watcher.notify(event.dest_path)
+
+
+class FolderWatcher:
+    """
+    Background ingestion of new and changed CSVs in a folder.
+
+    `version` increases on every table change (from this watcher or any other ingest in
+    the process) and `changed_tables` maps table -> data version, so UIs can cheaply
+    detect that their schema views are stale; changes_since() lists just the tables
+    changed after the `version` a UI last showed.
+    """
+
+    def __init__(self, con, folder="data", settle_seconds=SETTLE_SECONDS,
+                 poll_interval=POLL_INTERVAL, max_workers=MAX_CONCURRENT_INGESTS, use_events=True):
+        self.con = con
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_events = use_events and WATCHDOG_AVAILABLE
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.version = 0
+        self.changed_tables = {}
+        self._changed_at = {}   # table -> watcher version of its latest change
+        self.errors = []
+        self._pending = {}      # path -> (size, mtime, last change time)
+        self._seen = {}         # path -> (size, mtime) last submitted for ingest
+        self._in_flight = set()
+        self._held = set()      # paths managed elsewhere (e.g. UI uploads awaiting configuration)
+        self._table_locks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+        self._listener = None
+
+    # --- lifecycle ---
+    def start(self):
+        if self._thread:
+            return self
+        os.makedirs(self.folder, exist_ok=True)
+        # Files already on disk were handled by auto_ingest_folder; only react to changes
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and _is_candidate(entry.path):
+                st = entry.stat()
+                self._seen[entry.path] = (st.st_size, st.st_mtime)
+        self._listener = subscribe_table_changes(self._on_table_changed)
+        if self.use_events:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.folder, recursive=False)
+            self._observer.start()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._listener:
+            unsubscribe_table_changes(self._listener)
+        self.executor.shutdown(wait=True)
+
+    def hold(self, path):
+        """Exclude a path from live ingestion until release() is called"""
+        with self._lock:
+            self._held.add(os.path.abspath(path))
+
+    def release(self, path):
+        """Stop holding a path; its current contents count as already handled"""
+        with self._lock:
+            self._held.discard(os.path.abspath(path))
+            for key in (path, os.path.join(self.folder, os.path.basename(path))):
+                self._pending.pop(key, None)
+                if os.path.exists(key):
+                    st = os.stat(key)
+                    self._seen[key] = (st.st_size, st.st_mtime)
+
+    # --- change detection ---
+    def notify(self, path):
+        """Record a filesystem event; ingestion waits until the file settles"""
+        if not _is_candidate(path) or os.path.abspath(path) in self._held:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            prev = self._pending.get(path)
+            if prev is None or prev[:2] != (st.st_size, st.st_mtime):
+                self._pending[path] = (st.st_size, st.st_mtime, time.monotonic())
+
+    def _scan(self):
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_file() and _is_candidate(entry.path):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if self._seen.get(entry.path) != (st.st_size, st.st_mtime):
+                    self.notify(entry.path)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            if not self.use_events:
+                self._scan()
+            self._submit_settled()
+
+    def _submit_settled(self):
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (size, mtime, changed_at) in list(self._pending.items()):
+                if os.path.abspath(path) in self._held:
+                    del self._pending[path]
+                    continue
+                if now - changed_at < self.settle_seconds or path in self._in_flight:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del self._pending[path]
+                    continue
+                if (st.st_size, st.st_mtime) != (size, mtime):
+                    # Still being written: restart the debounce window
+                    self._pending[path] = (st.st_size, st.st_mtime, now)
+                    continue
+                del self._pending[path]
+                self._in_flight.add(path)
+                self._seen[path] = (size, mtime)
+                ready.append(path)
+        for path in ready:
+            self.executor.submit(self._ingest, path)
+
+    # --- ingestion ---
+    def _ingest(self, path):
+        table_name = os.path.splitext(os.path.basename(path))[0].lower().replace("-", "_").replace(" ", "_")
+        with self._lock:
+            table_lock = self._table_locks.setdefault(table_name, threading.Lock())
+        try:
+            with table_lock:
+                cursor = self.con.cursor()  # Own connection per worker thread
+                try:
+                    if ingest_csv(cursor, path, table_name) is None:
+                        self._record_error(path, "ingest failed")
+                finally:
+                    cursor.close()
+        except Exception as e:
+            self._record_error(path, str(e))
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+
+    def _record_error(self, path, message):
+        with self._lock:
+            self.errors = (self.errors + [(path, message)])[-50:]
+
+    def _on_table_changed(self, table_name, version):
+        with self._lock:
+            self.changed_tables[table_name] = version
+            self.version += 1
+            self._changed_at[table_name] = self.version
+
+    def changes_since(self, version):
+        """Tables changed after watcher `version`, sorted"""
+        with self._lock:
+            return sorted(t for t, v in self._changed_at.items() if v > version)
+
+
+def start_folder_watcher(con, folder="data", **kwargs):
+    return FolderWatcher(con, folder, **kwargs).start()